@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Validate the vectorized color differences of src/utils/color_diff.py against colormath and compare
+their speed: colormath one pair at a time (what color_distance used to do) vs. color_pdist.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+# colormath still calls numpy.asscalar, which numpy 1.23 removed
+if not hasattr(np, 'asscalar'):
+    np.asscalar = lambda a: a.item()
+
+from colormath.color_diff import delta_e_cie1976, delta_e_cie1994, delta_e_cie2000, delta_e_cmc
+from colormath.color_objects import LabColor
+from src.utils.color_diff import color_pdist
+
+COLORMATH = {
+    'CIE1976': lambda c1, c2: delta_e_cie1976(c1, c2),
+    'CIE1994': lambda c1, c2: delta_e_cie1994(c1, c2, K_1=0.048, K_2=0.014, K_L=2),
+    'CIE2000': lambda c1, c2: delta_e_cie2000(c1, c2),
+    'CMC': lambda c1, c2: delta_e_cmc(c1, c2),
+}
+
+def random_lab_colors(n, rng):
+    """Lab colors covering the gamut, with some grays (zero chroma) and repeated colors."""
+    colors = np.column_stack([rng.uniform(0, 100, n), rng.uniform(-100, 100, n), rng.uniform(-100, 100, n)])
+    colors[::7, 1:] = 0
+    colors[1::11] = colors[::11][:len(colors[1::11])]
+    return colors
+
+def colormath_pdist(colors, metric):
+    labs = [LabColor(*color) for color in colors]
+    distance = COLORMATH[metric]
+    return np.array([distance(labs[i], labs[j]) for i in range(len(labs)) for j in range(i + 1, len(labs))])
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate and time the vectorized color differences against colormath')
+    parser.add_argument('--ncolors', type=int, default=300, help='Number of random Lab colors')
+    parser.add_argument('--metrics', nargs='+', default=list(COLORMATH.keys()), choices=list(COLORMATH.keys()),
+                        help='Delta E metrics to compare')
+    parser.add_argument('--tolerance', type=float, default=1e-8, help='Largest accepted absolute difference')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    colors = random_lab_colors(args.ncolors, np.random.default_rng(args.seed))
+    npairs = args.ncolors * (args.ncolors - 1) // 2
+    failed = False
+    for metric in args.metrics:
+        start_time = time.time()
+        expected = colormath_pdist(colors, metric)
+        colormath_time = time.time() - start_time
+        start_time = time.time()
+        actual = color_pdist(colors, metric)
+        numpy_time = time.time() - start_time
+        error = np.abs(actual - expected).max()
+        failed = failed or not error <= args.tolerance
+        print(f"{metric:<8} {npairs} pairs  colormath {colormath_time:8.3f}s  numpy {numpy_time:8.4f}s  "
+              f"({colormath_time / max(numpy_time, 1e-9):7.0f}x)  max abs error {error:.2e}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
+
+# Usage:
+# python src/results/benchmark_color_diff.py --ncolors 500 --metrics CIE1994 CIE2000
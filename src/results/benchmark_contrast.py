@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark the contrast objective formulations of FabricBin.find_best_subsets_gurobi on the fabric_data sets.
+Compares model size, solve time and the pairwise contrast of the strips found with the pairwise model
+(one variable per edge pair) and the linear 'aggregate' and 'centroid' formulations, which replace the pair
+variables with one contrast coefficient per edge (the contrast_coefficients of find_best_subsets_gurobi).
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import numpy as np
+from scipy.spatial.distance import squareform
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from gurobipy import GurobiError
+from src.utils.bins import fabric_color
+from src.utils.color_diff import paired_color_distances
+from src.utils.filters import (LowContrastRank, HighContrastRank, LowValueContrastRank, HighValueContrastRank,
+                               LowHueContrastRank, HighHueContrastRank)
+from src.results.benchmark_solvers import load_bin
+
+RANKS = {
+    'low-contrast': (LowContrastRank, 'CIE1994'),
+    'high-contrast': (HighContrastRank, 'CIE1994'),
+    'low-value': (LowValueContrastRank, 'value'),
+    'high-value': (HighValueContrastRank, 'value'),
+    'low-hue': (LowHueContrastRank, 'hue'),
+    'high-hue': (HighHueContrastRank, 'hue'),
+}
+FORMULATIONS = ['pairwise', 'aggregate', 'centroid']
+
+def contrast_coefficients(fabric_bin, metric, formulation):
+    """
+    Per-edge contrast coefficients of the linear formulations.
+
+    Args:
+        fabric_bin: FabricBin
+        metric: 'CIE1994' (average colors), 'value' or 'hue' (dominant colors), as in FabricBin.pair_diffs
+        formulation: 'aggregate' for each edge's mean pairwise contrast to the edges of the other
+                     fabrics, 'centroid' for each edge's contrast to the mean color of the bin
+
+    Returns:
+        {edge: coefficient}, or None for the pairwise formulation
+    """
+    fabric_index = fabric_bin.fabric_index.tolist()
+    if formulation == 'aggregate':
+        # every fabric contributes its edges to the mean of the other fabrics' edges
+        nfabrics = len(fabric_bin.fabrics)
+        fabric_diffs = squareform(fabric_bin.pair_diffs(metric)) if nfabrics > 1 else np.zeros((1, 1))
+        nedges = np.bincount(fabric_bin.fabric_index, minlength=nfabrics).astype(float)
+        others = nedges.sum() - nedges
+        means = np.divide(fabric_diffs @ nedges, others, out=np.zeros(nfabrics), where=others > 0)
+        return {edge: means[k] for edge, k in zip(fabric_bin.edges, fabric_index)}
+    elif formulation == 'centroid':
+        colors = np.array([fabric_color(fabric, metric) for fabric in fabric_bin.fabrics], dtype=float)
+        centroid = colors.mean(axis=0)
+        if metric == "hue":
+            # hue is circular, average it on the unit circle
+            angles = 2 * np.pi * colors[:, 0]
+            centroid[0] = (np.arctan2(np.sin(angles).mean(), np.cos(angles).mean()) / (2 * np.pi)) % 1
+        distances = paired_color_distances(colors, centroid, metric)
+        return {edge: distances[k] for edge, k in zip(fabric_bin.edges, fabric_index)}
+    return None
+
+def pairwise_contrast(fabric_bin, metric, edge_subset):
+    """Total pairwise contrast of a strip, the objective of the pairwise formulation."""
+    positions = [fabric_bin.edges.index(edge) for edge in edge_subset]
+    first = [i for k, i in enumerate(positions) for j in positions[k + 1:]]
+    second = [j for k, i in enumerate(positions) for j in positions[k + 1:]]
+    return float(fabric_bin.edge_pair_diffs(metric, first, second).sum())
+
+def run_formulation(fabric_bin, rank, metric, formulation, target_L, args):
+    start_time = time.time()
+    try:
+        coefficients = contrast_coefficients(fabric_bin, metric, formulation)
+        results = fabric_bin.find_best_subsets_gurobi(target_L, args.threshold, sa=args.sa, time_limit=args.time_limit,
+                                                      solution_limit=args.solution_limit, option_rank=rank,
+                                                      mip_gap=args.mip_gap, contrast_coefficients=coefficients)
+    except GurobiError as e:
+        print(f"    {formulation}: {e}")
+        return None
+    duration = time.time() - start_time
+    contrasts = [pairwise_contrast(fabric_bin, metric, subset) for best_sum, subsets in results
+                 for subset in subsets if best_sum >= target_L]
+    if len(contrasts) == 0:
+        return duration, 0, None
+    # the High ranks look for the largest contrast
+    best = max(contrasts) if type(rank).__name__.startswith('High') else min(contrasts)
+    return duration, len(contrasts), best
+
+def benchmark_folder(folder, args):
+    fabric_bin = load_bin(folder, args.max_fabrics, sa=args.sa)
+    median_length = statistics.median([edge.length() for edge in fabric_bin.edges])
+    print(f"{os.path.basename(folder.rstrip('/'))}: {fabric_bin.nfabrics} fabrics, {len(fabric_bin.edge_pair_indices()[0])} edge pairs")
+    for factor in args.target_factors:
+        target_L = int(median_length * factor)
+        for rank_name in args.ranks:
+            rank_class, metric = RANKS[rank_name]
+            print(f"  target {target_L:6d}  {rank_name}")
+            for formulation in args.formulations:
+                row = run_formulation(fabric_bin, rank_class(), metric, formulation, target_L, args)
+                if row is None:
+                    continue
+                duration, nsolutions, best = row
+                best_str = f"{best:10.3f}" if best is not None else f"{'-':>10}"
+                print(f"    {formulation:<10} {duration:8.3f}s  {nsolutions:3d} solutions  best pairwise contrast {best_str}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark contrast objective formulations on fabric_data sets')
+    parser.add_argument('folders', nargs='*', default=['fabric_data/fabscrap_pp', 'fabric_data/linen_pp', 'fabric_data/etsybag_pp'],
+                        help='Fabric folders to benchmark (each becomes one bin)')
+    parser.add_argument('--max-fabrics', type=int, default=12, help='Only use the first N fabrics of each folder')
+    parser.add_argument('--target-factors', type=float, nargs='+', default=[2, 4],
+                        help='Target lengths as multiples of the median edge length')
+    parser.add_argument('--threshold', type=int, default=100, help='Acceptable overshoot of the target length')
+    parser.add_argument('--sa', type=int, default=25, help='Seam allowance')
+    parser.add_argument('--time-limit', type=float, default=30, help='Time limit per solve (seconds)')
+    parser.add_argument('--solution-limit', type=int, default=10, help='Number of solutions per solve')
+    parser.add_argument('--mip-gap', type=float, default=0, help='MIP gap tolerance')
+    parser.add_argument('--ranks', nargs='+', default=list(RANKS.keys()), choices=list(RANKS.keys()),
+                        help='Contrast ranks to benchmark')
+    parser.add_argument('--formulations', nargs='+', default=FORMULATIONS, choices=FORMULATIONS,
+                        help='Contrast formulations to compare')
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        benchmark_folder(folder, args)
+
+if __name__ == '__main__':
+    main()
+
+# Usage:
+# python src/results/benchmark_contrast.py fabric_data/linen_pp --max-fabrics 10 --ranks low-contrast high-hue
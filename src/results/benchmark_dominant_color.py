@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark the fast dominant color methods (features.image_dominant_color) against the current
+k-means on every pixel (binning.get_mode_color) on the fabric_data sets: time per image and how far
+the dominant colors are from the k-means ones (CIE2000 delta E in Lab, hue and value differences in HSV).
+"kmeans-opaque" is k-means on every opaque pixel, which shows how much of the difference comes from
+ignoring the transparent pixels rather than from the approximation.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from src.utils.binning import get_mode_color
+from src.utils.color_diff import circular_difference, delta_e_cie2000
+from src.utils.features import image_dominant_color
+from src.utils.load_images import is_image_file, open_image
+
+METHODS = ['kmeans-opaque', 'subsample', 'histogram']
+
+def color_error(reference, color, space):
+    if space == 'lab':
+        return {'delta E': float(delta_e_cie2000(reference, color))}
+    return {'hue': float(circular_difference(reference[0], color[0])), 'value': float(abs(reference[2] - color[2]))}
+
+def benchmark_folder(folder, args):
+    files = sorted([f for f in os.listdir(folder) if is_image_file(f)])[:args.max_images]
+    times = {method: [] for method in ['kmeans'] + args.methods}
+    errors = {method: {} for method in args.methods}
+    npixels = []
+    for file in files:
+        image = open_image(os.path.join(folder, file))
+        if image is None:
+            continue
+        npixels.append(image.size[0] * image.size[1])
+        start_time = time.time()
+        reference = get_mode_color(image, mode='dominant', criterion=args.criterion)
+        times['kmeans'].append(time.time() - start_time)
+        for method in args.methods:
+            start_time = time.time()
+            color = image_dominant_color(image, args.space, 'kmeans' if method == 'kmeans-opaque' else method,
+                                         max_samples=args.max_samples, histogram_bins=args.histogram_bins)
+            times[method].append(time.time() - start_time)
+            for name, error in color_error(reference, color, args.space).items():
+                errors[method].setdefault(name, []).append(error)
+    if len(npixels) == 0:
+        return
+    print(f"{folder}: {len(npixels)} images, median {int(statistics.median(npixels))} pixels")
+    kmeans_time = statistics.mean(times['kmeans'])
+    print(f"  {'kmeans':<14} {kmeans_time * 1000:9.1f} ms/image")
+    for method in args.methods:
+        method_time = statistics.mean(times[method])
+        error_str = '  '.join(f"{name} mean {statistics.mean(values):.4f} max {max(values):.4f}"
+                              for name, values in errors[method].items())
+        print(f"  {method:<14} {method_time * 1000:9.1f} ms/image  {kmeans_time / max(method_time, 1e-9):6.1f}x  {error_str}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fast dominant color extraction against k-means on every pixel')
+    parser.add_argument('folders', nargs='*', default=None,
+                        help='Fabric folders to benchmark (defaults to every folder in fabric_data)')
+    parser.add_argument('--criterion', default='hue', choices=['hue', 'lab'],
+                        help="Color space of the dominant color ('hue' clusters in HSV, 'lab' in Lab)")
+    parser.add_argument('--methods', nargs='+', default=METHODS, choices=METHODS, help='Methods to compare')
+    parser.add_argument('--max-images', type=int, default=20, help='Only use the first N images of each folder')
+    parser.add_argument('--max-samples', type=int, default=20000, help="Sample size of the 'subsample' method")
+    parser.add_argument('--histogram-bins', type=int, default=16, help="Bins per channel of the 'histogram' method")
+    args = parser.parse_args()
+    args.space = 'lab' if args.criterion == 'lab' else 'hsv'
+
+    folders = args.folders
+    if not folders:
+        folders = sorted([os.path.join('fabric_data', f) for f in os.listdir('fabric_data')
+                          if os.path.isdir(os.path.join('fabric_data', f))])
+    for folder in folders:
+        benchmark_folder(folder, args)
+
+if __name__ == '__main__':
+    main()
+
+# Usage:
+# python src/results/benchmark_dominant_color.py fabric_data/linen_pp --criterion lab --max-images 10
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark the strip selection engines of FabricBin on the fabric_data sets.
+Compares solve time and best wasted-area objective of the solver backends of find_best_subsets:
+the Gurobi MIP, the HiGHS MIP (scipy) and the NumPy thickness sweep.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from src.utils.bins import Fabric, FabricBin
+from src.utils.solvers import SOLVER_BACKENDS
+from src.utils.load_images import open_image, is_image_file
+
+def load_bin(folder, max_fabrics=None, sa=25):
+    """Build one FabricBin out of the images in a fabric_data folder."""
+    files = sorted([f for f in os.listdir(folder) if is_image_file(f)], key=lambda f: (len(f), f))
+    if max_fabrics is not None:
+        files = files[:max_fabrics]
+    Fabric.id = 0
+    fabrics = [Fabric(open_image(os.path.join(folder, f)), sa=sa, image_path=f) for f in files]
+    return FabricBin([f.e1 for f in fabrics] + [f.e2 for f in fabrics])
+
+def strip_objective(edge_subset, target_L, sa=0):
+    """The wasted area objective minimized by find_best_subsets."""
+    thickness = min([edge.get_other_dim() for edge in edge_subset])
+    total_length = sum([edge.length() for edge in edge_subset])
+    wasted_area = sum([(edge.get_other_dim() - 2 * sa - thickness) * edge.length() for edge in edge_subset])
+    return wasted_area + abs(total_length - target_L) * thickness
+
+def run_engine(fabric_bin, backend, target_L, threshold, sa, time_limit, solution_limit, length_unit=None):
+    start_time = time.time()
+    results = fabric_bin.find_best_subsets(target_L, threshold, sa=sa, time_limit=time_limit,
+                                           solution_limit=solution_limit, backend=backend, length_unit=length_unit)
+    duration = time.time() - start_time
+    subsets = [subset for best_sum, subsets in results for subset in subsets if best_sum >= target_L]
+    best = min([strip_objective(subset, target_L, sa) for subset in subsets]) if subsets else None
+    return duration, len(subsets), best
+
+def benchmark_folder(folder, args):
+    fabric_bin = load_bin(folder, args.max_fabrics, sa=args.sa)
+    lengths = [edge.length() for edge in fabric_bin.edges]
+    median_length = statistics.median(lengths)
+    print(f"{os.path.basename(folder.rstrip('/'))}: {fabric_bin.nfabrics} fabrics, median edge {median_length}")
+    engines = [name for name in args.backends if SOLVER_BACKENDS[name].is_available()]
+    rows = []
+    for factor in args.target_factors:
+        target_L = int(median_length * factor)
+        for name in engines:
+            duration, nsolutions, best = run_engine(fabric_bin, name, target_L, args.threshold, args.sa,
+                                                    args.time_limit, args.solution_limit, args.length_unit)
+            rows.append((target_L, name, duration, nsolutions, best))
+            best_str = f"{best:12.0f}" if best is not None else f"{'-':>12}"
+            print(f"  target {target_L:6d}  {name:<6} {duration:8.3f}s  {nsolutions:3d} solutions  best objective {best_str}")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark strip selection engines on fabric_data sets')
+    parser.add_argument('folders', nargs='*', default=['fabric_data/fabscrap_pp', 'fabric_data/linen_pp', 'fabric_data/etsybag_pp'],
+                        help='Fabric folders to benchmark (each becomes one bin)')
+    parser.add_argument('--max-fabrics', type=int, default=None, help='Only use the first N fabrics of each folder')
+    parser.add_argument('--target-factors', type=float, nargs='+', default=[2, 4, 8],
+                        help='Target lengths as multiples of the median edge length')
+    parser.add_argument('--threshold', type=int, default=100, help='Acceptable overshoot of the target length')
+    parser.add_argument('--sa', type=int, default=25, help='Seam allowance')
+    parser.add_argument('--time-limit', type=float, default=30, help='Time limit per solve (seconds)')
+    parser.add_argument('--solution-limit', type=int, default=20, help='Number of solutions per solve')
+    parser.add_argument('--length-unit', type=float, default=None,
+                        help='Solve on a grid of this many pixels and re-check at full resolution')
+    parser.add_argument('--backends', nargs='+', default=list(SOLVER_BACKENDS.keys()), choices=list(SOLVER_BACKENDS.keys()),
+                        help='Solver backends to compare (unavailable ones are skipped)')
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        benchmark_folder(folder, args)
+
+if __name__ == '__main__':
+    main()
+
+# Usage:
+# python src/results/benchmark_solvers.py fabric_data/linen_pp --max-fabrics 20
@@ -40,7 +40,8 @@ def reconstruct_high_res(session_data, fabric_folder, output_dir, public_dir='pu
         # Initialize bins with high-res fabrics
         high_res_fabrics = load_fabrics_for_binning(public_dir, os.path.join('fabric_data', original_folder), should_include_image=True)
         binning_bins = bins_per_iter[0]
-        bins = UserFabricBins(public_dir, binning_bins, sa=config.sa, high_res_fabrics=high_res_fabrics)
+        bins = UserFabricBins(public_dir, binning_bins, sa=config.sa, high_res_fabrics=high_res_fabrics,
+                              dominant_method=getattr(config, 'dominant_method', 'kmeans'))
 
         # Initialize packing
         packed_fabric = None
@@ -1,6 +1,9 @@
 from src.utils.pack import *
 from src.utils.bins import Fabric, FabricBins, ColorFabricBins
+from src.utils.scheduler import SolveScheduler
+from src.utils.solvers import get_solver_backend
 from src.utils.config import *
+from src.utils.options import OptionTable
 from src.utils.filters import *
 from src.utils.plot import pil_image_to_base64
 import dill as pickle
@@ -34,7 +37,8 @@ def next_packing_options(packed_fabric, fabrics, iter,
                          bin_filter=None, option_filter=None, option_rank=None,
                          bins=None, config=PackingConfig(),
                          thickness_min=None, thickness_max=None,
-                         fabric_count_min=None, fabric_count_max=None):
+                         fabric_count_min=None, fabric_count_max=None, solution_cache=None,
+                         on_progress=None, first_round_limit=None, cancel_token=None, solve_slo=None):
     """
     Given a list of remaining scrap fabrics, return the next packing options.
 
@@ -51,15 +55,100 @@ def next_packing_options(packed_fabric, fabrics, iter,
         thickness_max: maximum thickness constraint for the strip
         fabric_count_min: minimum number of fabrics to use
         fabric_count_max: maximum number of fabrics to use
+        solution_cache: a SolutionCache answering the bins that were already solved (optional)
+        on_progress: called as on_progress(options, progress) with the ranked options found so far
+            while the bins are solved (optional, see SolveScheduler.solve for progress)
+        first_round_limit: length of the first solver round in seconds, for a quick first on_progress (optional)
+        cancel_token: a CancelToken that stops the solve, no options are returned then (optional)
+        solve_slo: seconds the solver may spend on this call (defaults to config.solve_slo)
     """
+    if option_rank is None: # default to wasted area rank
+        option_rank = WastedAreaRank()
+    table = packing_option_table(packed_fabric, fabrics, iter, bin_filter, option_filter, bins, config,
+                                 thickness_min=thickness_min, thickness_max=thickness_max,
+                                 fabric_count_min=fabric_count_min, fabric_count_max=fabric_count_max,
+                                 solution_cache=solution_cache, first_round_limit=first_round_limit,
+                                 on_progress=ranked_progress(on_progress, option_rank), cancel_token=cancel_token,
+                                 solve_slo=solve_slo)
+    if table is None:
+        return []
+    ranks = option_rank.compute_ranks(table)
+    ranked_options = table.options(np.argsort(ranks, kind='stable'))
+    return ranked_options
+
+def ranked_progress(on_progress, option_rank):
+    # on_progress of packing_option_table that passes the ranked options on
+    if on_progress is None:
+        return None
+    return lambda table, progress: on_progress(table.options(np.argsort(option_rank.compute_ranks(table), kind='stable')), progress)
+
+def next_pareto_options(packed_fabric, fabrics, iter,
+                        bin_filter=None, option_filter=None, option_rank=None,
+                        bins=None, config=PackingConfig(),
+                        thickness_min=None, thickness_max=None,
+                        fabric_count_min=None, fabric_count_max=None, solution_cache=None,
+                        on_progress=None, first_round_limit=None, cancel_token=None, solve_slo=None, ranks=None, objectives=None,
+                        per_rank=5):
+    """
+    The packing options that are a good trade-off between the objectives, from the same solve as
+    next_packing_options (same arguments), so that the options can be re-sorted by any rank without
+    generating them again.
+
+    The options are the non-dominated ones w.r.t. the objectives (see OptionTable.pareto_mask) plus the
+    per_rank best ones of each rank, sorted by option_rank. on_progress gets all the options found so
+    far, ranked by option_rank.
+
+    Args:
+        ranks: {name: OptionRank} to index the options by (defaults to {'wastedArea': WastedAreaRank()})
+        objectives: ParetoObjectives (or OptionRanks) of the front (defaults to PARETO_OBJECTIVES)
+        per_rank: how many of the best options of each rank are kept even if they are dominated
+
+    Returns:
+        (options, {name: positions of the options in the order of that rank}, whether each option is on the front)
+    """
+    if option_rank is None: # default to wasted area rank
+        option_rank = WastedAreaRank()
+    table = packing_option_table(packed_fabric, fabrics, iter, bin_filter, option_filter, bins, config,
+                                 thickness_min=thickness_min, thickness_max=thickness_max,
+                                 fabric_count_min=fabric_count_min, fabric_count_max=fabric_count_max,
+                                 solution_cache=solution_cache, first_round_limit=first_round_limit,
+                                 on_progress=ranked_progress(on_progress, option_rank), cancel_token=cancel_token,
+                                 solve_slo=solve_slo)
+    if table is None:
+        return [], {}, []
+    ranks = ranks if ranks is not None else {'wastedArea': WastedAreaRank()}
+    front = table.pareto_mask(objectives if objectives is not None else PARETO_OBJECTIVES)
+    keep = front.copy()
+    for rank in ranks.values():
+        keep[np.argsort(rank.compute_ranks(table), kind='stable')[:per_rank]] = True
+    print(f'pareto front: {front.sum()} of {len(table)} options, {keep.sum()} kept')
+    table = table.select(keep)
+    front = front[keep]
+    order = np.argsort(option_rank.compute_ranks(table), kind='stable')
+    table = table.select(order)
+    front = front[order]
+    rank_orders = {name: np.argsort(rank.compute_ranks(table), kind='stable').tolist() for name, rank in ranks.items()}
+    return table.options(), rank_orders, front.tolist()
+
+def packing_option_table(packed_fabric, fabrics, iter, bin_filter=None, option_filter=None, bins=None,
+                         config=PackingConfig(), thickness_min=None, thickness_max=None,
+                         fabric_count_min=None, fabric_count_max=None, solution_cache=None,
+                         on_progress=None, first_round_limit=None, cancel_token=None, solve_slo=None):
+    """
+    Solve the selected bins for the next strip and return all its candidate options as an OptionTable
+    (filtered and deduplicated, not ranked), or None if there are none. See next_packing_options.
 
+    With on_progress, on_progress(table, progress) is called with the OptionTable of the options
+    found so far whenever a bin finds new ones (see SolveScheduler.solve for progress). A cancelled
+    solve returns None, and its partial results are neither cached nor remembered by the bins.
+    """
     if fabrics is None or (len(fabrics) == 0 and bins is None):
         print("No more fabrics")
-        return []
+        return None
 
     if config.strategy == 'rail-fence' and iter == 12:
         print('Rail-fence strategy is done after 12 iterations. Exiting...')
-        return []
+        return None
 
     fb = bins
     if fb is None:
@@ -79,75 +168,131 @@ def next_packing_options(packed_fabric, fabrics, iter,
         selected_bins = fb.select_bins(target_sum_high_res, config.threshold, bin_filter)
     if selected_bins is None:
         print('No valid bins found. Exiting...')
-        return []
-
-    max_time_limit = min(30, int(60 / len(selected_bins)))
+        return None
+
+    # configs pickled before solver backends were added fall back to the defaults
+    solver = get_solver_backend(getattr(config, 'solver_backend', 'auto'))
+    # bins are solved concurrently; the scheduler splits the time budget of this iteration between
+    # them and no single solve runs longer than the backend's time limit
+    max_time_limit = getattr(config, 'solver_time_limits', {}).get(solver.name, 30)
+    if solve_slo is None:
+        solve_slo = getattr(config, 'solve_slo', 20)
+    scheduler = SolveScheduler(slo=solve_slo, max_options=config.max_options,
+                               max_time_limit=max_time_limit, first_round_limit=first_round_limit)
 
     # Define thickness constraints for rail-fence iterations 10, 11, 12
     if thickness_min is None or thickness_max is None:
         thickness_min, thickness_max = compute_thickness_constraints(iter, config)
 
-    # Pass thickness and fabric count constraints to find_best_subsets
-    best_sum_subsets = [res for bin in selected_bins 
-                            for res in bin.find_best_subsets(target_sum_high_res, 100, sa=25,
-                                                             time_limit=max_time_limit,
-                                                             thickness_min=thickness_min,
-                                                             thickness_max=thickness_max,
-                                                             fabric_count_min=fabric_count_min,
-                                                             fabric_count_max=fabric_count_max)]
+    # Pass thickness and fabric count constraints and the filters to the solver; presolve drops scraps
+    # below min_scrap_size (config is in display resolution, the solver in high resolution)
+    min_length_high_res = config.min_scrap_size / config.scale_factor
+    length_grid = getattr(config, 'length_grid', None)
+    length_unit = length_grid * config.dpi / config.scale_factor if length_grid else None
+    bin_problems = [(bin, bin.subset_problem(target_sum_high_res, 100, sa=25,
+                                             time_limit=max_time_limit,
+                                             thickness_min=thickness_min,
+                                             thickness_max=thickness_max,
+                                             fabric_count_min=fabric_count_min,
+                                             fabric_count_max=fabric_count_max,
+                                             min_length=min_length_high_res,
+                                             filters=[bin_filter, option_filter], config=config,
+                                             length_unit=length_unit))
+                    for bin in selected_bins]
+    bin_problems = [(bin, problem) for bin, problem in bin_problems if problem is not None]
+    if len(bin_problems) == 0:
+        print('No feasible bins found after presolve. Exiting...')
+        return None
+    print('bin sizes:', [len(problem) for _, problem in bin_problems], 'solver:', solver.name)
+    # re-ranking and narrower windows are answered from the cache, only the other bins are solved
+    results = [None] * len(bin_problems)
+    if solution_cache is not None:
+        results = [solution_cache.get(problem, solver) for _, problem in bin_problems]
+        print(f'solution cache: {sum(res is not None for res in results)} of {len(results)} bins answered')
+    unsolved = [i for i, res in enumerate(results) if res is None]
+    on_bin_progress = None
+    if on_progress is not None:
+        def partial_table(progress):
+            table = results_option_table(bin_problems, results, target_sum_high_res, target_L, iter,
+                                         option_filter, config, verbose=False)
+            if table is not None:
+                on_progress(table, progress)
+
+        def on_bin_progress(k, bin_results, progress):
+            results[unsolved[k]] = bin_results
+            partial_table(progress)
+
+        # the bins answered from the cache are options right away
+        if len(unsolved) < len(results):
+            partial_table({'round': 0, 'bins_solved': 0, 'bins': len(unsolved),
+                           'solutions': sum(len(subsets) for res in results if res is not None for _, subsets in res),
+                           'time_left': scheduler.slo})
+    if len(unsolved) > 0:
+        solved = scheduler.solve([bin_problems[i][1] for i in unsolved], solver, on_progress=on_bin_progress,
+                                 cancel_token=cancel_token)
+        if cancel_token is not None and cancel_token.cancelled():
+            print('Solve cancelled')
+            return None
+        for k, (i, bin_results) in enumerate(zip(unsolved, solved)):
+            results[i] = bin_results
+            if solution_cache is not None:
+                solution_cache.put(bin_problems[i][1], bin_results, solver, complete=scheduler.completed[k])
+        if solution_cache is not None:
+            solution_cache.save()
+    for (bin, problem), bin_results in zip(bin_problems, results):
+        bin.remember_solutions(problem, bin_results)
+    return results_option_table(bin_problems, results, target_sum_high_res, target_L, iter, option_filter, config)
+
+def results_option_table(bin_problems, results, target_sum_high_res, target_L, iter, option_filter=None,
+                         config=PackingConfig(), verbose=True):
+    """
+    OptionTable of the solver results of the bins (filtered and deduplicated, not ranked).
+
+    Args:
+        bin_problems: list of (FabricBin, SubsetProblem)
+        results: backend results of each problem, None for the bins without results yet
+        target_sum_high_res: target length of the solver (high resolution)
+        target_L: target length of the strip in display resolution
+        iter: the current iteration
+        option_filter: a filter to select options (optional)
+        config: the packing configuration
+        verbose: Whether to print why there are no options and the debug output of the options
+
+    Returns:
+        OptionTable, or None if there are no options
+    """
+    best_sum_subsets = [res for (bin, problem), bin_results in zip(bin_problems, results) if bin_results is not None
+                            for res in bin.subsets_from_indices(bin_results, problem)]
     best_sum_subsets.sort(key=lambda item: abs(item[0] - target_sum_high_res))
     all_edge_subsets = [edge_subset for (best_sum, best_sum_subset) in best_sum_subsets 
                         for edge_subset in best_sum_subset 
                         if best_sum >= target_sum_high_res]
 
-    # If no valid subsets found, use any available subsets
+    # the backends only return sums within the target window (presolve drops the bins that cannot
+    # reach it), so there are no shorter subsets to fall back to
     if len(all_edge_subsets) == 0:
-        print("No target length satisfying edge subsets found")
-        if config.strategy == 'rail-fence':
-            all_edge_subsets = [edge_subset for (_, best_sum_subset) in best_sum_subsets for edge_subset in best_sum_subset]
-        if len(all_edge_subsets) == 0:
+        if verbose:
             print('No valid subsets found. Exiting...')
-            return []
-
-    # use the filter to filter and the ranking method to rank the edge_subsets
-    # the options here are not high res for display purposes
-    no_filter = option_filter is None
-    all_options = []
-    grouped_check_dups = {}
-    for i, edge_subset in enumerate(all_edge_subsets):
-        the_other_dimensions = [edge.get_other_dim(use_high_res=False) - 2 * config.sa for edge in edge_subset]
-        shortest_side = min(the_other_dimensions)
-        filter_passed = (not no_filter) and option_filter.validates(shortest_side)
-        if shortest_side not in grouped_check_dups:
-            grouped_check_dups[shortest_side] = set()
-        edge_lengths = frozenset([edge.length(use_high_res=False) for edge in edge_subset])
-        if (no_filter or filter_passed) and edge_lengths not in grouped_check_dups[shortest_side]:
-            wasted_area = 0
-            for edge, other_dim in zip(edge_subset, the_other_dimensions):
-                remaining_length = other_dim - shortest_side
-                if remaining_length < config.min_scrap_size or edge.length(use_high_res=False) < config.min_scrap_size:
-                    wasted_area += remaining_length * (edge.length(use_high_res=False) + 2 * config.sa)
-            sum_edge_lengths_diff = sum([edge.length(use_high_res=False) for edge in edge_subset]) - target_L + 2 * config.sa
-            if sum_edge_lengths_diff > 0:
-                wasted_area += sum_edge_lengths_diff * (shortest_side + 4 * config.sa)
-            elif sum_edge_lengths_diff < 0:
-                print(f"[Wasted Area Debug] Iteration {iter}")
-                print(f"sum_edge_lengths_diff (low res) negative: {sum_edge_lengths_diff}")
-                print(f"edge_subset: {edge_subset}")
-                print(f"target_L: {target_L}")
-                print(f"edge_lengths: {edge_lengths}")
-                print(f"shortest_side: {shortest_side}")
-                print(f"wasted_area: {wasted_area}")
-                print(f"[END]")
-            total_area = sum([(edge.length(use_high_res=False) + 2 * config.sa) * (edge.s.length(use_high_res=False) + 2 * config.sa) for edge in edge_subset])
-            the_other_dimensions_high_res_px = [edge.get_other_dim() for edge in edge_subset]
-            shortest_side_px = min(the_other_dimensions_high_res_px)
-            all_options.append(PackingOption(i, edge_subset, the_other_dimensions, shortest_side, total_area, wasted_area, shortest_side_px=shortest_side_px))
-            grouped_check_dups[shortest_side].add(edge_lengths)
-    if option_rank is None: # default to wasted area rank
-        option_rank = WastedAreaRank()
-    ranked_options = sorted(all_options, key=lambda option: option_rank.compute_rank(option))
-    return ranked_options
+        return None
+
+    # use the filter to filter the edge_subsets, the callers rank them
+    # (the filters are already constraints of the solver, this is a safety check)
+    # the options here are not high res for display purposes; all metrics and ranks are computed
+    # on the columns of the table at once
+    table = OptionTable(all_edge_subsets, config, target_L)
+    if option_filter is not None:
+        table = table.select(np.array([option_filter.validates(thickness) for thickness in table.shortest_side.tolist()], dtype=bool))
+    table = table.select(table.unique_mask())
+    negative_rows = np.nonzero(table.length_diff < 0)[0] if verbose else []
+    for i in negative_rows:
+        print(f"[Wasted Area Debug] Iteration {iter}")
+        print(f"sum_edge_lengths_diff (low res) negative: {table.length_diff[i]}")
+        print(f"edge_subset: {table.edge_subsets[i]}")
+        print(f"target_L: {target_L}")
+        print(f"shortest_side: {table.shortest_side[i]}")
+        print(f"wasted_area: {table.wasted_area[i]}")
+        print(f"[END]")
+    return table
 
 def option_to_strip(packed_fabric, sorted_fabrics, option, iter, bins, config, option_display=False, use_high_res=False):
     """
@@ -2,11 +2,12 @@ import numpy as np
 from sklearn.cluster import KMeans, AgglomerativeClustering
 from sklearn.metrics import silhouette_score
 from skimage.color import rgb2lab, rgb2hsv
-from colormath.color_diff import delta_e_cie1976, delta_e_cie1994, delta_e_cie2000, delta_e_cmc
-from colormath.color_objects import LabColor
+from scipy.spatial.distance import squareform
+from src.utils.color_diff import color_pdist, paired_color_distances
+from src.utils.features import criteria_value, image_dominant_color, mode_color
 import warnings
 
-def compute_criteria(image, mode='average', criterion='hue'):
+def compute_criteria(image, mode='average', criterion='hue', dominant_method='kmeans'):
     """
     Compute the specified criterion for an image.
 
@@ -14,10 +15,15 @@ def compute_criteria(image, mode='average', criterion='hue'):
         image (PIL.Image): a PIL Image.
         mode (str): 'average' for average pixel values or 'dominant' for dominant colors.
         criterion (str): Criterion to compute ('hue', 'value', 'hue-value', 'lab').
+        dominant_method (str): 'kmeans' clusters every pixel, 'subsample' and 'histogram' are the fast
+            approximations of features.image_dominant_color (without the transparent pixels).
 
     Returns:
         np.array: Criterion value(s) for the image.
     """
+    if mode == 'dominant' and dominant_method != 'kmeans':
+        color = get_mode_color(image, mode, criterion, dominant_method)
+        return criteria_value({'dominant_hsv': color, 'dominant_lab': color}, mode, criterion)
     if image.mode != 'RGB':
         image = image.convert('RGB')
     pixels = np.array(image).reshape(-1, 3) / 255.0  # Normalize to [0, 1]
@@ -59,7 +65,7 @@ def compute_criteria(image, mode='average', criterion='hue'):
 
     raise ValueError("Invalid criterion or mode")
 
-def get_mode_color(image, mode='average', criterion='hue'):
+def get_mode_color(image, mode='average', criterion='hue', dominant_method='kmeans'):
     """
     Compute the specified criterion for an image.
 
@@ -67,10 +73,14 @@ def get_mode_color(image, mode='average', criterion='hue'):
         image (str): a PIL Image.
         mode (str): 'average' for average pixel values or 'dominant' for dominant colors.
         criterion (str): Criterion to compute ('hue', 'value', 'hue-value', 'lab').
+        dominant_method (str): 'kmeans' clusters every pixel, 'subsample' and 'histogram' are the fast
+            approximations of features.image_dominant_color (without the transparent pixels).
 
     Returns:
         mode_color: Mode color for the image.
     """
+    if mode == 'dominant' and dominant_method != 'kmeans':
+        return image_dominant_color(image, 'lab' if criterion == 'lab' else 'hsv', dominant_method)
     if image.mode == 'RGBA':
         image = image.convert('RGB')
     pixels = np.array(image).reshape(-1, 3) / 255.0  # Normalize to [0, 1]
@@ -94,55 +104,192 @@ def get_mode_color(image, mode='average', criterion='hue'):
 
     raise ValueError("Invalid criterion or mode")
 
-def estimate_clusters(criteria_values, max_clusters=10):
+def unwrap_hues(hues, period=1.0):
+    """
+    Cut the hue circle at its largest gap between neighboring hues, so that the hues on both sides
+    of the wrap-around (e.g. the reds near 0 and 1) become one contiguous run for 1-D clustering.
+
+    Parameters:
+        hues (array): hue of each image, in [0, period].
+        period (float): length of the hue circle.
+
+    Returns:
+        np.array: the hues, those before the largest gap shifted up by period.
+    """
+    hues = np.asarray(hues, dtype=float) % period
+    if len(hues) < 2:
+        return hues
+    x = np.sort(hues.ravel())
+    gaps = np.diff(np.concatenate([x, [x[0] + period]]))
+    largest = np.argmax(gaps)
+    if largest == len(x) - 1:
+        # the largest gap already is the one across the wrap-around
+        return hues
+    return np.where(hues <= x[largest], hues + period, hues)
+
+def optimal_1d_partitions(values, max_clusters=10):
+    """
+    Exact k-means (Jenks natural breaks) of 1-D values for every k up to max_clusters, by dynamic
+    programming on the sorted values: the best split into k contiguous runs minimizing the within-cluster
+    sum of squares. The optimal split point only moves right as the run end moves right, so each k is
+    solved by divide and conquer on top of the previous one, one vectorized O(n) pass per recursion level.
+
+    Parameters:
+        values (array): 1-D criterion values.
+        max_clusters (int): Largest number of clusters.
+
+    Returns:
+        order (np.array): argsort of the values.
+        partitions (dict): {k: start index (in the sorted order) of each of the k clusters}.
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    order = np.argsort(values, kind='stable')
+    x = values[order]
+    n = len(x)
+    s1 = np.concatenate([[0], np.cumsum(x)])
+    s2 = np.concatenate([[0], np.cumsum(x * x)])
+
+    def cost(starts, end):
+        # sum of squares of x[start:end + 1] around its mean
+        counts = end + 1 - starts
+        sums = s1[end + 1] - s1[starts]
+        return s2[end + 1] - s2[starts] - sums * sums / counts
+
+    max_clusters = min(max_clusters, n)
+    if max_clusters < 1:
+        return order, {}
+    previous = cost(np.zeros(n, dtype=np.int64), np.arange(n))
+    splits = [np.zeros(n, dtype=np.int64)]
+    for k in range(1, max_clusters):
+        current = np.full(n, np.inf)
+        split = np.zeros(n, dtype=np.int64)
+        # divide and conquer over the run ends, all the (first end, last end, first split, last split)
+        # ranges of one recursion level at once
+        lo, hi = np.array([k]), np.array([n - 1])
+        split_lo, split_hi = np.array([k]), np.array([n - 1])
+        while len(lo) > 0:
+            mid = (lo + hi) // 2
+            counts = np.minimum(split_hi, mid) - split_lo + 1
+            node = np.repeat(np.arange(len(mid)), counts)
+            offsets = np.arange(len(node)) - np.repeat(np.cumsum(counts) - counts, counts)
+            starts = split_lo[node] + offsets
+            totals = previous[starts - 1] + cost(starts, mid[node])
+            # first best split of each node
+            best_totals = np.minimum.reduceat(totals, np.cumsum(counts) - counts)
+            is_best = totals <= best_totals[node]
+            _, first = np.unique(node[is_best], return_index=True)
+            best = starts[is_best][first]
+            current[mid] = best_totals
+            split[mid] = best
+            lo, hi = np.concatenate([lo, mid + 1]), np.concatenate([mid - 1, hi])
+            split_lo, split_hi = np.concatenate([split_lo, best]), np.concatenate([best, split_hi])
+            keep = lo <= hi
+            lo, hi, split_lo, split_hi = lo[keep], hi[keep], split_lo[keep], split_hi[keep]
+        previous = current
+        splits.append(split)
+
+    partitions = {}
+    for k in range(1, max_clusters + 1):
+        starts = []
+        end = n - 1
+        for layer in range(k - 1, -1, -1):
+            start = int(splits[layer][end]) if layer > 0 else 0
+            starts.append(start)
+            end = start - 1
+        partitions[k] = starts[::-1]
+    return order, partitions
+
+def partition_labels(order, starts):
+    """Cluster label of each value (in the original order) from optimal_1d_partitions."""
+    sorted_labels = np.zeros(len(order), dtype=np.int64)
+    for label, start in enumerate(starts[1:], start=1):
+        sorted_labels[start:] = label
+    labels = np.empty_like(sorted_labels)
+    labels[order] = sorted_labels
+    return labels
+
+def silhouette_1d(sorted_values, starts):
+    """
+    Mean silhouette score of contiguous clusters of sorted 1-D values (same as sklearn's silhouette_score),
+    in O(n) with prefix sums: the nearest other cluster of a value is always a neighboring one.
+    """
+    x = np.asarray(sorted_values, dtype=float)
+    n = len(x)
+    prefix = np.concatenate([[0], np.cumsum(x)])
+    bounds = list(starts) + [n]
+    index = np.arange(n)
+    cluster = np.searchsorted(np.array(starts), index, side='right') - 1
+    begin = np.array(bounds)[cluster]
+    end = np.array(bounds)[cluster + 1]
+
+    def total_distance(lo, hi):
+        # sum of |x_i - x_j| over j in [lo, hi), for lo <= i < hi or the run entirely on one side of i
+        split = np.clip(index + 1, lo, hi)
+        left = x * (split - lo) - (prefix[split] - prefix[lo])
+        right = (prefix[hi] - prefix[split]) - x * (hi - split)
+        return left + right
+
+    sizes = end - begin
+    a = total_distance(begin, end) / np.maximum(sizes - 1, 1)
+    b = np.full(n, np.inf)
+    has_left = cluster > 0
+    has_right = cluster < len(starts) - 1
+    left_begin = np.array(bounds)[np.maximum(cluster - 1, 0)]
+    right_end = np.array(bounds)[np.minimum(cluster + 2, len(bounds) - 1)]
+    b[has_left] = (total_distance(left_begin, begin) / np.maximum(begin - left_begin, 1))[has_left]
+    b[has_right] = np.minimum(b, total_distance(end, right_end) / np.maximum(right_end - end, 1))[has_right]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = np.where(sizes > 1, (b - a) / np.maximum(a, b), 0)
+    return float(np.nan_to_num(scores).mean())
+
+def estimate_clusters(criteria_values, max_clusters=10, return_scores=False):
     """
     Estimate the optimal number of clusters for the given list of images.
 
+    One criterion value per image is clustered exactly (optimal_1d_partitions) for every k at once;
+    multi-dimensional values fall back to KMeans for each k.
+
     Parameters:
         criteria_values (list): List of criterion values.
         max_clusters (int): Maximum number of clusters to test.
+        return_scores (bool): Also return the silhouette score of each k.
 
     Returns:
         int: Optimal number of clusters.
+        dict: {k: silhouette score} (if return_scores is True).
     """
     best_clusters = 2
     best_score = -1
+    scores = {}
 
-    for k in range(2, max_clusters + 1):
-        kmeans = KMeans(n_clusters=k, random_state=42).fit(criteria_values)
-        score = silhouette_score(criteria_values, kmeans.labels_)
+    criteria_values = np.asarray(criteria_values, dtype=float)
+    if criteria_values.ndim == 1 or criteria_values.shape[1] == 1:
+        values = criteria_values.ravel()
+        order, partitions = optimal_1d_partitions(values, min(max_clusters, len(values) - 1))
+        for k in range(2, len(partitions) + 1):
+            scores[k] = silhouette_1d(values[order], partitions[k])
+    else:
+        for k in range(2, min(max_clusters, len(criteria_values) - 1) + 1):
+            kmeans = KMeans(n_clusters=k, random_state=42).fit(criteria_values)
+            scores[k] = silhouette_score(criteria_values, kmeans.labels_)
+    for k, score in scores.items():
         if score > best_score:
             best_score = score
             best_clusters = k
 
+    if return_scores:
+        return best_clusters, scores
     return best_clusters
 
 def color_distance(color1, color2, metric):
-    if "hue" in metric or "value" in metric:
-        if metric == "hue":
-            return min(abs(color1[0] - color2[0]), 1 - abs(color1[0] - color2[0]))
-        elif metric == "value":
-            return min(abs(color1[2] - color2[2]), 1 - abs(color1[2] - color2[2]))
-        else:
-            min_hue_diff = min(abs(color1[0] - color2[0]), 1 - abs(color1[0] - color2[0]))
-            min_val_diff = min(abs(color1[2] - color2[2]), 1 - abs(color1[2] - color2[2]))
-            return np.sqrt(min_hue_diff ** 2 + min_val_diff ** 2)
-    else:
-        c1 = LabColor(*color1)
-        c2 = LabColor(*color2)
-        if metric == "CIE1976":
-            return delta_e_cie1976(c1, c2)
-        elif metric == "CIE1994":
-            # using textiles weights
-            return delta_e_cie1994(c1, c2, K_1=0.048, K_2=0.014, K_L=2)
-        elif metric == "CIE2000":
-            return delta_e_cie2000(c1, c2)
-        elif metric == "CMC":
-            return delta_e_cmc(c1, c2)
-        else:
-            raise ValueError(f"Unknown metric: {metric}")
-
-def group_images(fabric_list, n_clusters=None, criterion='hue', mode='average'):
+    """
+    Distance between two colors: delta E ('CIE1976', 'CIE1994' with textile weights, 'CIE2000', 'CMC')
+    of Lab colors, or the circular 'hue', 'value' or 'hue-value' difference of HSV colors.
+    Use color_pdist for many pairs.
+    """
+    return float(paired_color_distances(color1, color2, metric))
+
+def group_images(fabric_list, n_clusters=None, criterion='hue', mode='average', features=None):
     """
     Group images into clusters based on the specified criterion.
 
@@ -152,32 +299,50 @@ def group_images(fabric_list, n_clusters=None, criterion='hue', mode='average'):
         criterion (str): Criterion for clustering ('hue', 'value', 'hue-value', 'lab').
         mode (str): 'average' or 'dominant'.
         equal_ranges (bool): If True, split the range into equal intervals; otherwise, split into equal-sized groups.
+        features (list or None): Features of each fabric image (see features.extract_features), computed from the images if None.
 
     Returns:
         list of lists: Grouped image file paths.
     """
-    criteria_values = [compute_criteria(fabric['img'], mode, criterion) for fabric in fabric_list]
+    if features is None:
+        criteria_values = [compute_criteria(fabric['img'], mode, criterion) for fabric in fabric_list]
+    else:
+        criteria_values = [criteria_value(image_features, mode, criterion) for image_features in features]
     criteria_values = [np.linalg.norm(value) if isinstance(value, np.ndarray) else value for value in criteria_values]
     criteria_values = np.array(criteria_values).reshape(-1, 1)
+    if criterion == 'hue':
+        # hue is circular: red fabrics on both ends of the range belong together
+        criteria_values = unwrap_hues(criteria_values)
     if n_clusters is None:
         n_clusters = estimate_clusters(criteria_values)
 
     cluster_labels = None
-    # Compute the distance matrix
     num_images = len(fabric_list)
-    colors = [get_mode_color(fabric['img'], mode, criterion) for fabric in fabric_list]
-    distance_matrix = np.zeros((num_images, num_images))
+    if criterion in ['hue', 'value', 'hue-value']:
+        # one value per image: the exact 1-D clustering on the sorted values
+        order, partitions = optimal_1d_partitions(criteria_values, n_clusters)
+        n_clusters = max(len(partitions), 1)
+        cluster_labels = partition_labels(order, partitions[n_clusters]) if partitions else np.zeros(0, dtype=np.int64)
+        return make_groups(fabric_list, cluster_labels, n_clusters)
+
+    # Compute the distance matrix
+    if features is None:
+        colors = [get_mode_color(fabric['img'], mode, criterion) for fabric in fabric_list]
+    else:
+        colors = [mode_color(image_features, mode, criterion) for image_features in features]
     if criterion == 'lab': criterion = 'CIE1994'
-    for i in range(num_images):
-        for j in range(i + 1, num_images):
-            dist = color_distance(colors[i], colors[j], metric=criterion)
-            distance_matrix[i, j] = distance_matrix[j, i] = dist
+    if num_images > 1:
+        distance_matrix = squareform(color_pdist(colors, criterion))
+    else:
+        distance_matrix = np.zeros((num_images, num_images))
     # Use hierarchical clustering with the precomputed distance matrix
     clustering = AgglomerativeClustering(
         n_clusters=n_clusters, metric="precomputed", linkage="average"
     )
     cluster_labels = clustering.fit_predict(distance_matrix)
+    return make_groups(fabric_list, cluster_labels, n_clusters)
 
+def make_groups(fabric_list, cluster_labels, n_clusters):
     # Create groups based on cluster labels
     groups = [[] for _ in range(n_clusters)]
     for fabric, value in zip(fabric_list, cluster_labels):
@@ -1,33 +1,63 @@
 import colorsys
 import numpy as np
 import os
+import uuid
+from scipy.spatial.distance import squareform
 from src.utils.binning import *
+from src.utils.color_diff import color_pdist
 from src.utils.config import PackingOption
+from src.utils.features import extract_features
 from src.utils.filters import *
 from src.utils.plot import base64_to_pil_image, pil_image_to_base64
 from src.utils.load_images import open_image
-from gurobipy import *
+from src.utils.subset_sum import find_best_subsets_bitset
+from src.utils.solvers import SubsetProblem, SOLVER_BACKENDS, get_solver_backend, presolve_problem
 import copy
 
 def has_gurobi():
-    # uncomment to disable gurobi
-    # return False
-    try:
-        # Create a test model
-        m = Model("test")
-        
-        # Add a variable
-        m.addVar(name="x")
-        
-        # Update model
-        m.update()
-        
-        return True
-    except GurobiError:
-        return False
+    # probed once per process, see GurobiBackend.probe to disable gurobi
+    return SOLVER_BACKENDS['gurobi'].is_available()
 
 M = 1e6
 
+def fabric_color(fabric, metric):
+    # the contrast metrics compare average colors (CIE1994) or dominant colors (value, hue)
+    return fabric.color if metric == "CIE1994" else fabric.dominant_color
+
+def carry_pair_diffs(fabrics, metric, sources=(), stale=()):
+    """
+    Condensed matrix of the color differences between fabrics (see FabricBin.pair_diffs) that reuses
+    the known differences of sources and only computes the pairs with a new or stale fabric.
+
+    Args:
+        fabrics: list of Fabrics
+        metric: color_diff metric (see paired_color_distances)
+        sources: list of (fabrics, condensed differences) computed before, e.g. of a bin before a change
+        stale: fabrics whose colors changed since the sources were computed
+
+    Returns:
+        condensed differences over fabrics
+    """
+    nfabrics = len(fabrics)
+    if nfabrics < 2:
+        return np.zeros(0)
+    square = np.full((nfabrics, nfabrics), np.nan)
+    positions = {fabric: k for k, fabric in enumerate(fabrics)}
+    for source_fabrics, diffs in sources:
+        if len(source_fabrics) < 2:
+            continue
+        keep = [k for k, fabric in enumerate(source_fabrics) if fabric in positions and fabric not in stale]
+        moved = [positions[source_fabrics[k]] for k in keep]
+        square[np.ix_(moved, moved)] = squareform(diffs)[np.ix_(keep, keep)]
+    np.fill_diagonal(square, 0)
+    first, second = np.nonzero(np.isnan(square))
+    upper = first < second
+    first, second = first[upper], second[upper]
+    if len(first) > 0:
+        colors = np.array([fabric_color(fabric, metric) for fabric in fabrics], dtype=float)
+        square[first, second] = square[second, first] = color_pdist(colors, metric, first, second)
+    return squareform(square, checks=False)
+
 class Edge:
     def __init__(self, length, parent_fabric, sibling_edge, is_e1, high_res_length=None):
         self._length = length
@@ -66,7 +96,7 @@ class Fabric:
 
     id = 0
 
-    def __init__(self, image, sa=0, fid=None, image_path=None, high_res_image_path=None):
+    def __init__(self, image, sa=0, fid=None, image_path=None, high_res_image_path=None, features=None):
         # Use high-res image for edge dimensions if available
         self.high_res_image_size = None
         if high_res_image_path:
@@ -80,9 +110,11 @@ class Fabric:
         self.image_path = image_path
         self.image = image
         self.image_updated = False
-        # average color of the fabric
-        self.color = np.mean(np.mean(np.array(image)[:, :, :3], axis=0), axis=0)
-        self.dominant_color = get_mode_color(image, mode='dominant')
+        # average color of the fabric and dominant (HSV) color, see compute_features
+        if features is None:
+            features = extract_features([image])[0]
+        self.color = features['mean_rgb']
+        self.dominant_color = features['dominant_hsv']
         # autoincrement id or use user-supplied id
         if fid is None:
             self.id = Fabric.id
@@ -101,9 +133,16 @@ class Fabric:
             return {'id': self.id, 'image': self.image_path, 'img': pil_image_to_base64(self.image)}
         return {'id': self.id, 'image': self.image_path}
 
+    def hsv_mean(self):
+        """Average of the image in PIL's HSV (0-255 per channel), what the contrast ranks compare; cached."""
+        if getattr(self, '_hsv_mean', None) is None:
+            self._hsv_mean = np.array(self.image.convert('HSV')).reshape(-1, 3).mean(axis=0)
+        return self._hsv_mean
+
     def update_after_trimming(self, trimmed_image, sa=0, high_res_image_size=None):
         # Update image
         self.image = trimmed_image
+        self._hsv_mean = None
         self.color = np.mean(np.mean(np.array(self.image)[:, :, :3], axis=0), axis=0)
         # Update edges with new dimensions while maintaining relationships
         if high_res_image_size is not None:
@@ -115,10 +154,13 @@ class Fabric:
             self.e2.update_edge(trimmed_image.size[1] - 2 * sa)
         self.image_updated = True
 
-    def reload(self, sa=0):
+    def reload(self, sa=0, features=None, dominant_method='kmeans'):
         self.image = open_image(self.image_path)
-        self.color = np.mean(np.mean(np.array(self.image)[:, :, :3], axis=0), axis=0)
-        self.dominant_color = get_mode_color(self.image, mode='dominant')
+        self._hsv_mean = None
+        if features is None:
+            features = extract_features([self.image], [self.image_path], dominant_method=dominant_method)[0]
+        self.color = features['mean_rgb']
+        self.dominant_color = features['dominant_hsv']
         self.e1.update_edge(self.image.size[0] - 2 * sa)
         self.e2.update_edge(self.image.size[1] - 2 * sa)
 
@@ -128,12 +170,7 @@ class FabricBin:
 
     def __init__(self, edges, fbid=None, name=None):
         self.edges = edges
-        self.sibling_edges = [e.s for e in self.edges]
-        fabrics = set([e.p for e in self.edges])
-        self.nfabrics = len(fabrics)
-        self.max_length = sum([max(f.e1.length(), f.e2.length()) for f in fabrics])
-        self.min_length = min([min(f.e1.length(), f.e2.length()) for f in fabrics])
-        self.length_range = (self.min_length, self.max_length)
+        self.update_precomputed()
         # autoincrement id or use user-supplied id
         if fbid is None:
             self.id = FabricBin.id
@@ -144,31 +181,10 @@ class FabricBin:
             self.name = f"Bin {self.id + 1}"
         else:
             self.name = name
-        # add Wij matrix to precompute which edge is smaller than the other in length
-        self.Wmat = {}
-        for i in range(len(self.edges)):
-            for j in range(len(self.edges)):
-                self.Wmat[i, j] = 1 if self.edges[i].length() <= self.edges[j].length() else 0
-                
-        # Precompute color differences for all edge pairs
-        self.edge_pairs = []
-        self.color_diffs = {}
-        self.value_diffs = {}
-        self.hue_diffs = {}
-        for i, edge_i in enumerate(self.edges):
-            for j, edge_j in enumerate(self.edges[i+1:], i+1):
-                if edge_i.p != edge_j.p:  # Don't compute for edges from same fabric
-                    self.edge_pairs.append((edge_i, edge_j))
-                    # Compute color differences (CIE1994)
-                    self.color_diffs[(edge_i, edge_j)] = color_distance(edge_i.p.color, edge_j.p.color, "CIE1994")
-                    # Value differences
-                    self.value_diffs[(edge_i, edge_j)] = color_distance(edge_i.p.dominant_color, edge_j.p.dominant_color, "value")
-                    # Hue differences
-                    self.hue_diffs[(edge_i, edge_j)] = color_distance(edge_i.p.dominant_color, edge_j.p.dominant_color, "hue")
-                else:
-                    self.color_diffs[(edge_i, edge_j)] = 0
-                    self.value_diffs[(edge_i, edge_j)] = 0
-                    self.hue_diffs[(edge_i, edge_j)] = 0
+        # identifies this bin's cached solver model across iterations (see GurobiBackend)
+        self.solver_key = uuid.uuid4().hex
+        # last solution pool as (fabric id, is_e1) tuples, used to warm-start the next solve
+        self.last_solutions = []
 
     def __repr__(self):
         return f"FabricBin({self.length_range}) with {len(self.edges)} edges"
@@ -178,61 +194,50 @@ class FabricBin:
         return {'id': self.id, 'name': self.name, 'fabrics': [fabric.to_json() for fabric in fabrics]}
 
     def can_afford(self, target_length, threshold):
+        # cheap screen of the length range only, presolve_problem proves the rest before solving
         return self.min_length - threshold // 2 <= target_length <= self.max_length + threshold // 2
 
     def affordable_ranges(self): # this is the range of the sibling edges
         return (self.min_length, self.max_length)
 
-    def find_best_subsets_dp(self, target_L, threshold, suppress_output=True):
+    def find_best_subsets_dp(self, target_L, threshold, solution_limit=20, suppress_output=True):
         """
-        Dynamic programming implementation of the subset sum problem (slow as #edges grows)
+        Bitset dynamic programming implementation of the subset sum problem.
+
+        Reachable sums up to target_L + threshold are tracked in a boolean array with one step per
+        fabric, so the two edges of a fabric are never selected together. Subsets are rebuilt from
+        the per-fabric reachability rows.
+
+        Args:
+            target_L: Target length for the subset sum
+            threshold: Acceptable deviation from target length
+            solution_limit: Maximum number of solutions to return
+            suppress_output: Whether to suppress debug output
         """
         print('bin size:', len(self.edges))
-        # dp dictionary to hold the best subsets for each possible sum
-        dp = {0: set([frozenset()])}
-
-        for edge in self.sibling_edges:
-            # Create a new state dictionary to avoid modifying the dictionary during iteration
-            new_dp = dp.copy()
-            
-            for current_sum in dp:
-                if current_sum > target_L:
-                    continue
-                new_sum = current_sum + edge.length()
-                # Only consider new sums that are within the target threshold
-                for curr_subset in dp[current_sum].copy():
-                    # Ensure the new edge isn't from the same rectangle as any edge in the current subset
-                    if edge.p.id not in set([edge.p.id for edge in curr_subset]):
-                        if new_sum not in new_dp:
-                            new_dp[new_sum] = set()
-                        # check for duplicates
-                        new_subset = set(curr_subset)
-                        new_subset.add(edge)
-                        if frozenset(new_subset) not in new_dp[new_sum]:
-                            new_dp[new_sum].add(frozenset(new_subset))
-
-            dp = new_dp
-
-        # Filter out subsets that are out of the threshold range
-        best_sums = [sum_ for sum_ in dp.keys() if target_L <= sum_ <= target_L + threshold]
-
-        # If no valid sums are found, return an empty list
-        if not best_sums:
-            minimum = min(dp.keys(), key=lambda x: abs(target_L - x))
-            if not suppress_output: print(f"No valid sums found within the threshold. Closest sum: {minimum}")
-            if minimum == 0:
-                return []
-            return minimum, dp[minimum]
-
-        # Get the best subsets (closest to L)
-        best_sum = min(best_sums, key=lambda x: abs(target_L - x))
-        if not suppress_output: print(f"Best sum: {best_sum}; Target length: {target_L}")
-        if target_L == best_sum:
-            if not suppress_output: print(f"Found {len(dp[best_sum])} edge subsets with the exact length")
-        return best_sum, dp[best_sum]
+        candidates = self.sibling_edges
+        lengths = [edge.length() for edge in candidates]
+        groups = [edge.p.id for edge in candidates]
+        results = find_best_subsets_bitset(lengths, groups, target_L, threshold, solution_limit=solution_limit)
+
+        solutions_to_return = []
+        for best_sum, subsets in results:
+            if not subsets:
+                continue
+            solutions_to_return.append((best_sum, set(frozenset(candidates[i] for i in subset) for subset in subsets)))
+        if not solutions_to_return:
+            if not suppress_output: print("No solutions found")
+            return [(0, [])]
+        best_sum = solutions_to_return[0][0]
+        if best_sum < target_L:
+            if not suppress_output: print(f"No valid sums found within the threshold. Closest sum: {best_sum}")
+        elif not suppress_output:
+            print(f"Best sum: {best_sum}; Target length: {target_L}")
+        return solutions_to_return
 
     def find_best_subsets_gurobi(self, target_L, threshold, sa=0, time_limit=30, solution_limit=10,
-                          option_rank=None, mip_gap=10, suppress_output=True, thickness_min=None, thickness_max=None):
+                          option_rank=None, mip_gap=10, suppress_output=True, thickness_min=None, thickness_max=None,
+                          contrast_coefficients=None):
         """
         Gurobi implementation of the subset sum problem.
         
@@ -247,10 +252,14 @@ class FabricBin:
             suppress_output: Whether to suppress Gurobi output
             thickness_min: Minimum thickness constraint (optional)
             thickness_max: Maximum thickness constraint (optional)
+            contrast_coefficients: {edge: coefficient} replacing the pairwise contrast objective of the
+                                   contrast ranks with a linear one (optional, see src/results/benchmark_contrast.py)
         """
         if not has_gurobi():
             print("Gurobi license not found. Falling back to dynamic programming implementation.")
-            return self.find_best_subsets_dp(target_L, threshold, suppress_output)
+            return self.find_best_subsets_dp(target_L, threshold, solution_limit=solution_limit, suppress_output=suppress_output)
+        # imported here so that the other backends work without gurobipy installed
+        from gurobipy import GRB, Model, quicksum
 
         print('bin size:', len(self.edges))
 
@@ -282,7 +291,8 @@ class FabricBin:
         for edge in self.edges:
             m.addConstr(min_thickness <= edge.get_other_dim() + M * (1 - edge_vars[edge]))
 
-        # For each edge, check if it's the minimum using Wmat
+        # For each edge, check if it's the minimum using Wmat (which edge is not longer than the other)
+        Wmat = (self.edge_lengths[:, None] <= self.edge_lengths[None, :]).astype(int).tolist()
         is_min_vars = []
         for i, edge_i in enumerate(self.edges):
             # Binary variable indicating if edge_i is the minimum
@@ -300,7 +310,7 @@ class FabricBin:
             for j, edge_j in enumerate(self.edges):
                 if i != j:
                     # If edge_i is minimum and edge_j is selected, then edge_i <= edge_j must be true
-                    m.addConstr(self.Wmat[i,j] >= is_min_i + edge_vars[edge_j] - 1)
+                    m.addConstr(Wmat[i][j] >= is_min_i + edge_vars[edge_j] - 1)
 
         # Exactly one selected edge must be the minimum
         m.addConstr(quicksum(is_min_vars) == 1)
@@ -333,52 +343,34 @@ class FabricBin:
             elif isinstance(option_rank, LowFabricCountRank):
                 m.setObjective(fabric_count, GRB.MINIMIZE)
 
-        else:
-            # Create variables for each pair being selected
-            pair_vars = {}
-            for edge_i, edge_j in self.edge_pairs:
-                pair_vars[(edge_i, edge_j)] = m.addVar(vtype=GRB.BINARY, name=f"pair_{edge_i.p.id}_{edge_j.p.id}")
-
-            # Pair variable should be 1 only if both edges are selected
-            for (edge_i, edge_j), pair_var in pair_vars.items():
-                m.addConstr(pair_var <= edge_vars[edge_i])
-                m.addConstr(pair_var <= edge_vars[edge_j])
-                m.addConstr(pair_var >= edge_vars[edge_i] + edge_vars[edge_j] - 1)
-
-            # Calculate total number of pairs
-            total_pairs = quicksum(pair_vars.values())
-
-            # Add constraint to ensure we have at least one pair if we have at least 2 edges
-            total_edges = quicksum(edge_vars.values())
-            m.addConstr(total_pairs >= (total_edges * (total_edges - 1)) / 2 - M * (2 - total_edges))
-
-            # Set objective based on the specific rank type
-            if isinstance(option_rank, LowContrastRank) or isinstance(option_rank, HighContrastRank):
-                total_diff = quicksum(self.color_diffs[(edge_i, edge_j)] * pair_vars[(edge_i, edge_j)] 
-                                    for (edge_i, edge_j) in self.edge_pairs)
-                                    
-                if isinstance(option_rank, LowContrastRank):
-                    m.setObjective(total_diff, GRB.MINIMIZE)
-                else:  # HighContrastRank
-                    m.setObjective(-total_diff, GRB.MINIMIZE)
-
-            elif isinstance(option_rank, LowValueContrastRank) or isinstance(option_rank, HighValueContrastRank):
-                total_diff = quicksum(self.value_diffs[(edge_i, edge_j)] * pair_vars[(edge_i, edge_j)]
-                                    for (edge_i, edge_j) in self.edge_pairs)
-                                    
-                if isinstance(option_rank, LowValueContrastRank):
-                    m.setObjective(total_diff, GRB.MINIMIZE)
-                else:  # HighValueContrastRank
-                    m.setObjective(-total_diff, GRB.MINIMIZE)
-
-            elif isinstance(option_rank, LowHueContrastRank) or isinstance(option_rank, HighHueContrastRank):
-                total_diff = quicksum(self.hue_diffs[(edge_i, edge_j)] * pair_vars[(edge_i, edge_j)]
-                                    for (edge_i, edge_j) in self.edge_pairs)
-
-                if isinstance(option_rank, LowHueContrastRank):
-                    m.setObjective(total_diff, GRB.MINIMIZE)
-                else:  # HighHueContrastRank
-                    m.setObjective(-total_diff, GRB.MINIMIZE)
+        elif isinstance(option_rank, ContrastRank):
+            if isinstance(option_rank, LowValueContrastRank):
+                metric = "value"
+            elif isinstance(option_rank, LowHueContrastRank):
+                metric = "hue"
+            else:
+                metric = "CIE1994"
+            # the High*ContrastRank subclasses maximize the contrast
+            sign = -1 if isinstance(option_rank, (HighContrastRank, HighValueContrastRank, HighHueContrastRank)) else 1
+
+            if contrast_coefficients is None:
+                # Create variables for each pair being selected
+                first, second = self.edge_pair_indices()
+                pair_diffs = self.edge_pair_diffs(metric, first, second)
+                pair_terms = []
+                for i, j, diff in zip(first.tolist(), second.tolist(), pair_diffs.tolist()):
+                    edge_i, edge_j = self.edges[i], self.edges[j]
+                    pair_var = m.addVar(vtype=GRB.BINARY, name=f"pair_{edge_i.p.id}_{edge_j.p.id}")
+                    # Pair variable should be 1 only if both edges are selected
+                    m.addConstr(pair_var <= edge_vars[edge_i])
+                    m.addConstr(pair_var <= edge_vars[edge_j])
+                    m.addConstr(pair_var >= edge_vars[edge_i] + edge_vars[edge_j] - 1)
+                    pair_terms.append(diff * pair_var)
+
+                total_diff = quicksum(pair_terms)
+            else:
+                total_diff = quicksum(contrast_coefficients[edge] * edge_vars[edge] for edge in self.edges)
+            m.setObjective(sign * total_diff, GRB.MINIMIZE)
 
         # Add constraints
         # 1. Total length should be within threshold
@@ -478,197 +470,130 @@ class FabricBin:
             print("No solutions found")
         return [(0, [])]
 
+    def subset_problem(self, target_L, threshold, sa=0, time_limit=30, mip_gap=10,
+                       thickness_min=None, thickness_max=None,
+                       fabric_count_min=None, fabric_count_max=None, solution_limit=20,
+                       min_length=None, presolve=True, suppress_output=True, filters=None, config=None,
+                       length_unit=None):
+        """
+        Compact array form of the strip selection problem over self.edges, reduced by
+        presolve_problem unless presolve is False. problem.source_indices are positions in self.edges.
+        The last solutions of this bin that are still feasible become the problem's seeds.
+        problem.content_key identifies the problem before presolve for the SolutionCache.
+        Bin and option filters (None entries are skipped) add their constraints before presolve,
+        see BinFilter.constrain and OptionFilter.constrain. With a length_unit the backends solve on
+        that grid and re-check at full resolution (see quantize_problem).
+
+        Returns:
+            SubsetProblem, or None if presolve proves that no strip can be made from this bin
+        """
+        edge_keys = [(edge.p.id, edge.is_e1) for edge in self.edges]
+        edge_index = {key: i for i, key in enumerate(edge_keys)}
+        seeds = [tuple(edge_index[key] for key in solution) for solution in getattr(self, 'last_solutions', [])
+                 if all(key in edge_index for key in solution)]
+        problem = SubsetProblem([edge.length() for edge in self.edges],
+                             [edge.get_other_dim() for edge in self.edges],
+                             [edge.p.id for edge in self.edges],
+                             target_L, threshold, sa=sa,
+                             thickness_min=thickness_min, thickness_max=thickness_max,
+                             fabric_count_min=fabric_count_min, fabric_count_max=fabric_count_max,
+                             solution_limit=solution_limit, time_limit=time_limit, mip_gap=mip_gap,
+                             key=getattr(self, 'solver_key', None),
+                             edge_keys=edge_keys, seeds=seeds, length_unit=length_unit)
+        for problem_filter in filters or []:
+            if problem_filter is not None:
+                problem_filter.constrain(problem, self, config)
+        problem.content_key = problem.fingerprint(min_length if presolve else None)
+        if presolve:
+            problem = presolve_problem(problem, min_length=min_length, suppress_output=suppress_output)
+            if problem is None:
+                return None
+        problem.seeds = [seed for seed in problem.seeds if problem.is_feasible(seed)]
+        return problem
+
+    def remember_solutions(self, problem, results):
+        """Keep the solutions of problem (as edge keys) to warm-start the next solve of this bin."""
+        self.last_solutions = [tuple(problem.edge_keys[i] for i in subset)
+                               for _, subsets in results for subset in subsets]
+
     def find_best_subsets(self, target_L, threshold, sa=0, time_limit=30, mip_gap=10,
                           thickness_min=None, thickness_max=None,
                           fabric_count_min=None, fabric_count_max=None,
-                          solution_limit=20, suppress_output=True):
+                          solution_limit=20, suppress_output=True, backend=None, min_length=None, length_unit=None):
         """
-        Gurobi implementation of the subset sum problem with more constraints and fixed waste area objective.
+        Subset sum problem with more constraints and fixed waste area objective,
+        solved by one of the backends in solvers.py.
 
         Args:
             target_L: Target length for the subset sum
             threshold: Acceptable deviation from target length
             sa: Seam allowance
-            time_limit: Maximum time for Gurobi to run (seconds)
+            time_limit: Maximum time for the solver to run (seconds)
             mip_gap: MIP gap tolerance (%)
-            suppress_output: Whether to suppress Gurobi output
+            suppress_output: Whether to suppress solver output
             thickness_min: Minimum thickness constraint (optional)
             thickness_max: Maximum thickness constraint (optional)
             fabric_count_min: Minimum fabric count constraint (optional)
             fabric_count_max: Maximum fabric count constraint (optional)
-        """
-        if not has_gurobi():
-            print("Gurobi license not found. Falling back to dynamic programming implementation.")
-            return self.find_best_subsets_dp(target_L, threshold, suppress_output)
-
-        print('bin size:', len(self.edges))
-
-        # Create a new model
-        m = Model("edge_selection")
-        m.Params.OutputFlag = 0 if suppress_output else 1
-        m.Params.TimeLimit = time_limit
-        m.Params.SolutionLimit = solution_limit # still give a solution limit but much larger
-        if mip_gap > 0:
-            m.Params.MIPGap = mip_gap
+            backend: Solver backend name ('gurobi', 'highs', 'numpy'), None or 'auto' for the first available one
+            min_length: Edges shorter than this are not used (optional)
+            length_unit: Grid to solve on before re-checking at full resolution (optional, see quantize_problem)
 
-        # Create binary variables for each edge
-        edge_vars = {}
-        edges_by_var = {}  # Reverse lookup dictionary
-        for edge in self.edges:
-            var = m.addVar(vtype=GRB.BINARY, name=f"edge_{edge.p.id}_{edge.length()}")
-            edge_vars[edge] = var
-        # Update model to finalize variable creation
-        m.update()
-        for edge, var in edge_vars.items():
-            edges_by_var[var] = edge
-
-        total_length = quicksum(edge.length() * edge_vars[edge] for edge in self.sibling_edges)
-
-        ########## Create min_thickness variable ##########
-        min_thickness = m.addVar(name="min_thickness", lb=self.length_range[0], ub=self.length_range[1])
-        # Add thickness constraints if provided
-        if thickness_min is not None:
-            m.addConstr(min_thickness >= thickness_min)
-        if thickness_max is not None:
-            m.addConstr(min_thickness <= thickness_max)
-
-        # Ensure min_thickness is less than or equal to all selected edges
-        for edge in self.edges:
-            m.addConstr(min_thickness <= edge.get_other_dim() + M * (1 - edge_vars[edge]))
-
-        # For each edge, check if it's the minimum using Wmat
-        is_min_vars = []
-        for i, edge_i in enumerate(self.edges):
-            # Binary variable indicating if edge_i is the minimum
-            is_min_i = m.addVar(vtype=GRB.BINARY, name=f"is_min_{i}")
-            is_min_vars.append(is_min_i)
-
-            # If edge_i is selected and is the minimum, min_thickness should equal its length
-            m.addConstr(min_thickness >= edge_i.get_other_dim() - M * (1 - is_min_i))
-            m.addConstr(min_thickness <= edge_i.get_other_dim() + M * (1 - is_min_i))
-
-            # Edge can only be minimum if it's selected
-            m.addConstr(is_min_i <= edge_vars[edge_i])
-
-            # If edge_i is minimum, it must be <= all other selected edges
-            for j, edge_j in enumerate(self.edges):
-                if i != j:
-                    # If edge_i is minimum and edge_j is selected, then edge_i <= edge_j must be true
-                    m.addConstr(self.Wmat[i,j] >= is_min_i + edge_vars[edge_j] - 1)
-
-        # Exactly one selected edge must be the minimum
-        m.addConstr(quicksum(is_min_vars) == 1)
-
-        ########## Create fabric count constraints ##########
-        if fabric_count_min is not None or fabric_count_max is not None:
-            fabric_count = m.addVar(name="fabric_count", lb=0, ub=self.nfabrics) # lb=1 is somehow wrong
-            m.addConstr(fabric_count == quicksum(edge_vars[edge] for edge in self.edges))
-            if fabric_count_min is not None:
-                m.addConstr(fabric_count >= fabric_count_min)
-            if fabric_count_max is not None:
-                m.addConstr(fabric_count <= fabric_count_max)
-
-        ########## Create common constraints ##########
-        # 1. Total length should be within threshold
-        m.addConstr(total_length >= target_L)
-        m.addConstr(total_length <= target_L + threshold) # TODO: maybe this constraint is not necessary
-        # 2. Can't use multiple edges from same rectangle
-        for fabric in set([edge.p for edge in self.edges]):
-            m.addConstr(edge_vars[fabric.e1] + edge_vars[fabric.e2] <= 1)
-
-        ########## Create wasted area objective ##########
-        wasted_area = quicksum((edge.get_other_dim() - 2 * sa - min_thickness) * edge.length() * edge_vars[edge] for edge in self.edges)
-        # Add absolute deviation and constraints
-        abs_deviation = m.addVar(name="abs_deviation", lb=0, ub=threshold)
-        m.addConstr(abs_deviation >= total_length - target_L)
-        m.addConstr(abs_deviation >= target_L - total_length)
-        m.setObjective(wasted_area + abs_deviation * min_thickness, GRB.MINIMIZE)
-
-        # Print out the gurobi model for debugging
+        Returns:
+            list of (sum, set of frozensets of Edges) sorted by distance to target_L, or [(0, [])]
+        """
+        solver = get_solver_backend(backend)
+        print('bin size:', len(self.edges), 'solver:', solver.name)
+        problem = self.subset_problem(target_L, threshold, sa=sa, time_limit=time_limit, mip_gap=mip_gap,
+                                      thickness_min=thickness_min, thickness_max=thickness_max,
+                                      fabric_count_min=fabric_count_min, fabric_count_max=fabric_count_max,
+                                      solution_limit=solution_limit, min_length=min_length,
+                                      suppress_output=suppress_output, length_unit=length_unit)
+        if problem is None:
+            return [(0, [])]
+        results = solver.solve(problem, suppress_output=suppress_output)
+        self.remember_solutions(problem, results)
+        return self.subsets_from_indices(results, problem, suppress_output=suppress_output)
+
+    def subsets_from_indices(self, results, problem, suppress_output=True):
+        """Map the index tuples returned by a solver backend for problem back to frozensets of self.edges."""
+        if results == [(0, [])]:
+            if not suppress_output:
+                print("No solutions found")
+            return results
         if not suppress_output:
-            print("Gurobi model:")
-            print(m.getConstrs())
-            print(m.getVars())
-            print(m.getObjective())
-            print("target_L:", target_L)
-            print("threshold:", threshold)
-
-        # Collection to store solutions by their sums
-        solution_sums = {}
-
-        # Callback function to collect solutions
-        def solution_callback(model, where):
-            if where == GRB.Callback.MIPSOL:
-                # Get current solution - this works in callbacks even if model status is LOADED
-                var_values = model.cbGetSolution(list(edge_vars.values()))
-                vars_list = list(edge_vars.values())
-
-                # Build solution set and calculate sum
-                solution = set()
-                sol_sum = 0
-                for var, val in zip(vars_list, var_values):
-                    if val > 0.5:  # Binary variable is 1
-                        edge = edges_by_var[var]
-                        solution.add(edge)
-                        sol_sum += edge.length()
-
-                # if min_thickness is wrong, don't add the solution
-                if min_thickness is not None:
-                    min_thickness_val = model.cbGetSolution(min_thickness)
-                    shortest_side = min([edge.get_other_dim() for edge in solution])
-                    if round(min_thickness_val) != (shortest_side):
-                        print(f"warning: min thickness is wrong for sol#{sum([len(sol) for sol in solution_sums.values()])}")
-                        print(f"min thickness: {min_thickness_val}")
-                        print(f"shortest side: {shortest_side}")
-                        # Add constraint to find different solutions
-                        # model.cbLazy(quicksum(edge_vars[edge] for edge in solution) <= len(solution) - 1)
-                        return
-
-                # Add to solution_sums if not already present
-                solution_frozen = frozenset(solution)
-                if sol_sum not in solution_sums:
-                    solution_sums[sol_sum] = set()
-                if solution_frozen not in solution_sums[sol_sum]:
-                    solution_sums[sol_sum].add(solution_frozen)
-                    if not suppress_output:
-                        print(f"Found solution with sum {sol_sum}")
-                # Check if we've found enough solutions
-                total_solutions = sum([len(sol) for sol in solution_sums.values()])
-                if total_solutions >= solution_limit:
-                    if not suppress_output:
-                        print(f"Found {total_solutions} solutions, terminating")
-                    model.terminate()
-
-                # Add constraint to ensure at least one edge is different from this solution
-                # For each edge in the solution, we need at least one to be 0
-                # For each edge not in the solution, we need at least one to be 1
-                model.cbLazy(quicksum(1 - edge_vars[edge] for edge in solution) + 
-                             quicksum(edge_vars[edge] for edge in set(self.edges) - solution) >= 1)
-
-        # Set the callback
-        m.setParam(GRB.Param.LazyConstraints, 1)
-
-        # Optimize
-        m.optimize(solution_callback)
+            print(f"returning {sum([len(subsets) for _, subsets in results])} total #solutions")
+        return [(best_sum, set(frozenset(self.edges[problem.source_indices[i]] for i in subset) for subset in subsets))
+                for best_sum, subsets in results]
+
+    def find_best_subsets_sweep(self, target_L, threshold, sa=0, time_limit=30,
+                                thickness_min=None, thickness_max=None,
+                                fabric_count_min=None, fabric_count_max=None,
+                                solution_limit=20, suppress_output=True):
+        """
+        Thickness-sweep implementation of find_best_subsets (same arguments and return value).
 
-        # Return all solutions found
-        if len(solution_sums) > 0:
-            nsolutions = 0
-            solutions_to_return = []
-            for best_sum in sorted(solution_sums.keys(), key=lambda x: abs(target_L - x)):
-                best_sum_subset = solution_sums[best_sum]
-                solutions_to_return.append((best_sum, best_sum_subset))
-                nsolutions += len(best_sum_subset)
-            if not suppress_output:
-                print(f"returning {nsolutions} total #solutions")
-            return solutions_to_return
+        Instead of modeling the strip thickness with big-M constraints, every distinct other
+        dimension t is tried as the thickness and a plain subset sum is solved over the edges whose
+        other dimension is at least t. The wasted area objective of find_best_subsets is then
+        exact in closed form, see find_best_subsets_sweep in subset_sum.py.
+        """
+        return self.find_best_subsets(target_L, threshold, sa=sa, time_limit=time_limit,
+                                      thickness_min=thickness_min, thickness_max=thickness_max,
+                                      fabric_count_min=fabric_count_min, fabric_count_max=fabric_count_max,
+                                      solution_limit=solution_limit, suppress_output=suppress_output,
+                                      backend='numpy')
 
-        if not suppress_output:
-            print("No solutions found")
-        return [(0, [])]
+    def update_precomputed(self, stale_fabrics=()):
+        """
+        Update all precomputed values based on the current edges in the bin.
 
-    def update_precomputed(self):
-        """Update all precomputed values based on the current edges in the bin."""
+        The edge arrays are rebuilt (linear in the bin size); the cached pair differences are carried
+        over so that only the pairs of added fabrics and of stale_fabrics (e.g. trimmed ones, whose
+        colors changed) are computed.
+        """
+        old_fabrics = getattr(self, 'fabrics', [])
+        old_cache = getattr(self, 'pair_diff_cache', {})
         # Update sibling edges
         self.sibling_edges = [e.s for e in self.edges]
 
@@ -681,36 +606,91 @@ class FabricBin:
         else:
             self.max_length = 0
             self.min_length = 0
+        self.length_range = (self.min_length, self.max_length)
 
-        # Update Wij matrix
-        self.Wmat = {}
-        for i in range(len(self.edges)):
-            for j in range(len(self.edges)):
-                self.Wmat[i, j] = 1 if self.edges[i].length() <= self.edges[j].length() else 0
-
-        # Update edge pairs and color differences
-        self.edge_pairs = []
-        self.color_diffs = {}
-        self.value_diffs = {}
-        self.hue_diffs = {}
-        for i, edge_i in enumerate(self.edges):
-            for j, edge_j in enumerate(self.edges[i+1:], i+1):
-                if edge_i.p != edge_j.p:  # Don't compute for edges from same fabric
-                    self.edge_pairs.append((edge_i, edge_j))
-                    # Compute color differences (CIE1994)
-                    self.color_diffs[(edge_i, edge_j)] = color_distance(edge_i.p.color, edge_j.p.color, "CIE1994")
-                    # Value differences
-                    self.value_diffs[(edge_i, edge_j)] = color_distance(edge_i.p.dominant_color, edge_j.p.dominant_color, "value")
-                    # Hue differences
-                    self.hue_diffs[(edge_i, edge_j)] = color_distance(edge_i.p.dominant_color, edge_j.p.dominant_color, "hue")
-                else:
-                    self.color_diffs[(edge_i, edge_j)] = 0
-                    self.value_diffs[(edge_i, edge_j)] = 0
-                    self.hue_diffs[(edge_i, edge_j)] = 0
+        # edge lengths (which edge is smaller than the other, see find_best_subsets_gurobi)
+        self.edge_lengths = np.array([e.length() for e in self.edges])
+
+        # position of each edge's fabric in self.fabrics (in order of first appearance)
+        self.fabrics = list(dict.fromkeys([e.p for e in self.edges]))
+        fabric_positions = {fabric: k for k, fabric in enumerate(self.fabrics)}
+        self.fabric_index = np.array([fabric_positions[e.p] for e in self.edges], dtype=np.int64)
+        # condensed fabric pair color differences per metric, filled on first use (see pair_diffs)
+        self.pair_diff_cache = {metric: carry_pair_diffs(self.fabrics, metric, [(old_fabrics, diffs)], stale_fabrics)
+                                for metric, diffs in old_cache.items()}
+
+    def add_edges(self, edges):
+        """Add edges (e.g. of new fabrics) to the bin."""
+        self.edges = self.edges + list(edges)
+        self.update_precomputed()
+
+    def remove_fabric(self, fabric_id):
+        """Remove the edges of a fabric from the bin. Returns the fabric, or None if it is not in the bin."""
+        removed = [edge.p for edge in self.edges if edge.p.id == fabric_id]
+        if not removed:
+            return None
+        self.edges = [edge for edge in self.edges if edge.p.id != fabric_id]
+        self.update_precomputed()
+        return removed[0]
+
+    def take_precomputed(self, bins, keep_model=True):
+        """
+        Reuse the pair differences, warm-start solutions and cached solver model of bins whose fabrics
+        this bin is made of (e.g. the bins merged into it).
+
+        Args:
+            bins: list of FabricBins
+            keep_model: Whether to take over the solver model of the largest bin, which is then updated in
+                place on the next solve. Only one bin may keep a model, so bins regrouped from the same
+                bins should not.
+        """
+        metrics = set([metric for bin in bins for metric in bin.pair_diff_cache.keys()])
+        for metric in metrics:
+            sources = [(bin.fabrics, bin.pair_diff_cache[metric]) for bin in bins if metric in bin.pair_diff_cache]
+            self.pair_diff_cache[metric] = carry_pair_diffs(self.fabrics, metric, sources)
+        if bins and keep_model:
+            self.solver_key = max(bins, key=lambda bin: len(bin.edges)).solver_key
+        # solutions with edges of other bins are dropped when the next problem is built (see subset_problem)
+        self.last_solutions = self.last_solutions + [solution for bin in bins for solution in bin.last_solutions]
+
+    def merged(self, other, name=None):
+        """A new bin with the edges of this bin and other that reuses what both precomputed."""
+        merged = FabricBin(self.edges + other.edges, name=name)
+        merged.take_precomputed([self, other])
+        return merged
+
+    def pair_diffs(self, metric):
+        """
+        Color differences between the fabrics of this bin as a condensed matrix (the upper triangle
+        of self.fabrics x self.fabrics row by row, see scipy.spatial.distance.squareform), computed
+        on first use: 'CIE1994' on the average colors, 'value' and 'hue' on the dominant colors.
+        """
+        if metric not in self.pair_diff_cache:
+            self.pair_diff_cache[metric] = carry_pair_diffs(self.fabrics, metric)
+        return self.pair_diff_cache[metric]
+
+    def edge_pair_indices(self):
+        """Index arrays (first, second) into self.edges of all edge pairs i < j of different fabrics."""
+        first, second = np.triu_indices(len(self.edges), 1)
+        different = self.fabric_index[first] != self.fabric_index[second]
+        return first[different], second[different]
+
+    def edge_pair_diffs(self, metric, first, second):
+        """Color differences of the edge pairs (first[k], second[k]), zero for edges of the same fabric."""
+        a = self.fabric_index[np.asarray(first, dtype=np.int64)]
+        b = self.fabric_index[np.asarray(second, dtype=np.int64)]
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        nfabrics = len(self.fabrics)
+        diffs = self.pair_diffs(metric)
+        if len(diffs) == 0:
+            return np.zeros(len(a))
+        positions = np.where(lo < hi, nfabrics * lo - lo * (lo + 1) // 2 + hi - lo - 1, 0)
+        return np.where(lo < hi, diffs[positions], 0.0)
 
 class FabricBins:
-    def __init__(self, fabric_images, n=10, min_size=None, max_size=None, sa=None):
-        self.fabric_list = [Fabric(image, sa=sa) for image in fabric_images]
+    def __init__(self, fabric_images, n=10, min_size=None, max_size=None, sa=None, dominant_method='kmeans'):
+        features = extract_features(fabric_images, dominant_method=dominant_method)
+        self.fabric_list = [Fabric(image, sa=sa, features=f) for image, f in zip(fabric_images, features)]
         self.create_bins(n=n, min_size=min_size, max_size=max_size)
 
     def to_json(self):
@@ -733,8 +713,7 @@ class FabricBins:
         for i in range(len(self.bins)):
             if i % 2 == 0:
                 if len(self.bins) > i + 1:
-                    new_edges = self.bins[i].edges + self.bins[i+1].edges
-                    new_bins.append(FabricBin(new_edges))
+                    new_bins.append(self.bins[i].merged(self.bins[i+1]))
                 else:
                     new_bins.append(self.bins[i])
         print(f"Merged {len(self.bins)} bins into {len(new_bins)} bins")
@@ -783,14 +762,20 @@ class ColorFabricBin(FabricBin):
         super().__init__(edges, fbid=fbid)
         self.hue_range = hue_range
 
+    def merged(self, other, name=None):
+        merged = ColorFabricBin(self.edges + other.edges, (self.hue_range[0], other.hue_range[1]))
+        merged.take_precomputed([self, other])
+        return merged
+
     def contains_color(self, color):
         # color is a tuple of RGB values
         hue, _, _ = colorsys.rgb_to_hsv(*color)
         return self.hue_range[0] <= hue < self.hue_range[1]
 
 class ColorFabricBins(FabricBins):
-    def __init__(self, fabric_images, n=10, min_hue=None, max_hue=None, sa=None):
-        self.fabric_list = [Fabric(image, sa=sa) for image in fabric_images]
+    def __init__(self, fabric_images, n=10, min_hue=None, max_hue=None, sa=None, dominant_method='kmeans'):
+        features = extract_features(fabric_images, dominant_method=dominant_method)
+        self.fabric_list = [Fabric(image, sa=sa, features=f) for image, f in zip(fabric_images, features)]
         self.create_bins(n=n, min_hue=min_hue, max_hue=max_hue)
 
     def merge_bins(self):
@@ -799,9 +784,7 @@ class ColorFabricBins(FabricBins):
         for i in range(len(self.bins)):
             if i % 2 == 0:
                 if len(self.bins) > i + 1:
-                    new_edges = self.bins[i].edges + self.bins[i+1].edges
-                    new_hue_range = (self.bins[i].hue_range[0], self.bins[i+1].hue_range[1])
-                    new_bins.append(ColorFabricBin(new_edges, new_hue_range))
+                    new_bins.append(self.bins[i].merged(self.bins[i+1]))
                 else:
                     new_bins.append(self.bins[i])
         self.bins = new_bins
@@ -849,7 +832,9 @@ class ColorFabricBins(FabricBins):
 
 # Supporting UserBin class for storing user-created bins
 class UserFabricBins(FabricBins):
-    def __init__(self, public_folder, bins, sa=None, high_res_fabrics=None):
+    def __init__(self, public_folder, bins, sa=None, high_res_fabrics=None, dominant_method='kmeans'):
+        # how the dominant colors of the fabrics are computed (see features.DOMINANT_METHODS)
+        self.dominant_method = dominant_method
         if high_res_fabrics is not None:
             self.create_bins_for_high_res(bins, sa, high_res_fabrics)
         else:
@@ -860,21 +845,8 @@ class UserFabricBins(FabricBins):
         if len(fabric_in_bin) == 0:
             print("No fabrics to create bin from")
             return
-        if has_gurobi():
-            edges = [f.e1 for f in fabric_in_bin] + [f.e2 for f in fabric_in_bin]
-            self.bins.append(FabricBin(edges, name=name))
-        else:
-            nbins = 1
-            nfabrics = len(fabric_in_bin)
-            while nbins * 10 < nfabrics:
-                nbins += 1
-            for i in range(nbins):
-                start_idx = i * (nfabrics // nbins)
-                end_idx = (i + 1) * (nfabrics // nbins)
-                if i == nbins - 1:
-                    end_idx = nfabrics
-                edges = [f.e1 for f in fabric_in_bin[start_idx:end_idx]] + [f.e2 for f in fabric_in_bin[start_idx:end_idx]]
-                self.bins.append(FabricBin(edges, name=f"{name} - {i+1}" if name else None))
+        edges = [f.e1 for f in fabric_in_bin] + [f.e2 for f in fabric_in_bin]
+        self.bins.append(FabricBin(edges, name=name))
 
     def create_bins_for_high_res(self, input_bins, sa, high_res_fabrics):
         FabricBin.id = 0
@@ -884,17 +856,25 @@ class UserFabricBins(FabricBins):
             # newer version: bin is {id: .., name: .., fabrics: [...]}
             if 'fabrics' in bin:
                 fabricjson_in_bin = [high_res_fabric_map[f['id']] for f in bin['fabrics']]
-                fabric_in_bin = [Fabric(f['img'], sa=sa, fid=f['id'], image_path=f['image']) for f in fabricjson_in_bin]
+                features = extract_features([f['img'] for f in fabricjson_in_bin], dominant_method=self.dominant_method)
+                fabric_in_bin = [Fabric(f['img'], sa=sa, fid=f['id'], image_path=f['image'], features=features[k])
+                                 for k, f in enumerate(fabricjson_in_bin)]
                 self.create_bin_from_fabrics(fabric_in_bin, name=bin['name'])
             # the bin is a list of dictionaries each representing a fabric
             else:
                 fabricjson_in_bin = [high_res_fabric_map[f['id']] for f in bin]
-                fabric_in_bin = [Fabric(f['img'], sa=sa, fid=f['id'], image_path=f['image']) for f in fabricjson_in_bin]
+                features = extract_features([f['img'] for f in fabricjson_in_bin], dominant_method=self.dominant_method)
+                fabric_in_bin = [Fabric(f['img'], sa=sa, fid=f['id'], image_path=f['image'], features=features[k])
+                                 for k, f in enumerate(fabricjson_in_bin)]
                 self.create_bin_from_fabrics(fabric_in_bin)
 
     def create_bins(self, public_folder, bins, sa=None):
         FabricBin.id = 0
         self.bins = []
+        # load the images first so that the features of all fabrics are extracted in parallel
+        loaded_bins = []
+        images = []
+        image_paths = []
         for bin in bins:
             # the bin is a list of dictionaries each representing a fabric
             fabric_in_bin = []
@@ -918,7 +898,15 @@ class UserFabricBins(FabricBins):
                         print(f"Image {image_path} does not exist!")
                 else:
                     img = f['img']
-                fabric_in_bin.append(Fabric(img, sa=sa, fid=f['id'], image_path=f['image'], high_res_image_path=high_res_image_path))
+                fabric_in_bin.append((img, f, high_res_image_path))
+                images.append(img)
+                image_paths.append(image_path)
+            loaded_bins.append((fabric_in_bin, name))
+        features = iter(extract_features(images, image_paths, dominant_method=self.dominant_method))
+        for fabric_in_bin, name in loaded_bins:
+            fabric_in_bin = [Fabric(img, sa=sa, fid=f['id'], image_path=f['image'], high_res_image_path=high_res_image_path,
+                                    features=next(features))
+                             for img, f, high_res_image_path in fabric_in_bin]
             self.create_bin_from_fabrics(fabric_in_bin, name=name)
 
     def merge_bins(self):
@@ -927,8 +915,7 @@ class UserFabricBins(FabricBins):
         for i in range(len(self.bins)):
             if i % 2 == 0:
                 if len(self.bins) > i + 1:
-                    new_edges = self.bins[i].edges + self.bins[i+1].edges
-                    new_bins.append(FabricBin(new_edges, name=f"{self.bins[i].name} + {self.bins[i+1].name}"))
+                    new_bins.append(self.bins[i].merged(self.bins[i+1], name=f"{self.bins[i].name} + {self.bins[i+1].name}"))
                 else:
                     new_bins.append(self.bins[i])
         print(f"Merged {len(self.bins)} bins into {len(new_bins)} bins")
@@ -962,15 +949,12 @@ class UserFabricBins(FabricBins):
     def remove_fabric(self, removed_fabric_id):
         removed = False
         removed_fabric = None
-        new_bins = []
         for bin in self.bins:
-            new_edges = [edge for edge in bin.edges if edge.p.id != removed_fabric_id]
-            if len(new_edges) < len(bin.edges):
+            fabric = bin.remove_fabric(removed_fabric_id)
+            if fabric is not None:
                 removed = True
-                removed_fabric = [edge.p for edge in bin.edges if edge.p.id == removed_fabric_id][0]
-            if new_edges:
-                new_bins.append(FabricBin(new_edges, fbid=bin.id, name=bin.name))
-        self.bins = new_bins
+                removed_fabric = fabric
+        self.bins = [bin for bin in self.bins if bin.edges]
         if not removed:
             return removed, None
         if removed_fabric.high_res_image_size is not None:
@@ -1007,12 +991,18 @@ class UserFabricBins(FabricBins):
 
         # Update the fabric and the bin
         for bin in self.bins:
-            bin.edges = [edge for edge in bin.edges if (edge.p.id not in used_fabric_ids or edge.p.id in trimming_map)]
+            kept_edges = [edge for edge in bin.edges if (edge.p.id not in used_fabric_ids or edge.p.id in trimming_map)]
+            if len(kept_edges) == len(bin.edges) and not any(edge.p.id in trimming_map for edge in bin.edges):
+                # nothing of this bin was used
+                continue
+            bin.edges = kept_edges
             # Get unique fabrics from the bin's edges
             fabrics_in_bin = {edge.p for edge in bin.edges}
+            trimmed_fabrics = set()
             for fabric in fabrics_in_bin:
                 # If fabric was trimmed, update it
                 if fabric.id in trimming_map:
+                    trimmed_fabrics.add(fabric)
                     records = trimming_map[fabric.id]
                     # Update the fabric with trimmed image
                     fabric.update_after_trimming(
@@ -1031,7 +1021,7 @@ class UserFabricBins(FabricBins):
                                 high_res_image_size=record['trimmed_image_high_res_size'])
                             bin.edges.append(new_fabric.e1)
                             bin.edges.append(new_fabric.e2)
-            bin.update_precomputed()
+            bin.update_precomputed(stale_fabrics=trimmed_fabrics)
 
     def to_id_fabric_map(self, bin_filter=None):
         # construct the mapping from fabric ids to fabric images
@@ -1062,6 +1052,7 @@ class UserFabricBins(FabricBins):
         # Create new bins with updated fabrics
         FabricBin.id = 0
         current_fabrics = self.to_fabric_map()
+        old_bins = self.bins
         self.bins = []
         for bin in new_bins:
             fabric_in_bin = []
@@ -1070,3 +1061,9 @@ class UserFabricBins(FabricBins):
                 assert fabric_id in current_fabrics, 'the new bins should be existing fabrics shifted around, not introducing any new fabrics'
                 fabric_in_bin.append(current_fabrics[fabric_id])
             self.create_bin_from_fabrics(fabric_in_bin, name=bin['name'])
+            # fabrics moved between bins keep their pair differences
+            if self.bins and len(fabric_in_bin) > 0:
+                fabric_ids = set([fabric.id for fabric in fabric_in_bin])
+                self.bins[-1].take_precomputed([old_bin for old_bin in old_bins
+                                                if any(edge.p.id in fabric_ids for edge in old_bin.edges)],
+                                               keep_model=False)
@@ -0,0 +1,144 @@
+"""
+Vectorized color differences.
+
+The delta E formulas follow colormath (colormath.color_diff_matrix), including its asymmetric
+CIE1994/CMC weights (taken from the first color) and its CIE2000 mean hue, so the distances match
+colormath.color_diff.delta_e_* to floating point precision. Every function takes two broadcastable
+(..., 3) arrays of colors and returns the distance of each pair; color_pdist returns the condensed
+distance matrix (scipy.spatial.distance.pdist order) of an (N, 3) array in one call.
+"""
+
+import numpy as np
+
+METRICS = ["CIE1976", "CIE1994", "CIE2000", "CMC", "hue", "value", "hue-value"]
+
+def _lab(lab1, lab2):
+    lab1 = np.asarray(lab1, dtype=float)
+    lab2 = np.asarray(lab2, dtype=float)
+    return lab1[..., 0], lab1[..., 1], lab1[..., 2], lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+def delta_e_cie1976(lab1, lab2):
+    L1, a1, b1, L2, a2, b2 = _lab(lab1, lab2)
+    return np.sqrt((L1 - L2) ** 2 + (a1 - a2) ** 2 + (b1 - b2) ** 2)
+
+def _delta_lch(L1, a1, b1, L2, a2, b2):
+    C1 = np.sqrt(a1 ** 2 + b1 ** 2)
+    C2 = np.sqrt(a2 ** 2 + b2 ** 2)
+    delta_L = L1 - L2
+    delta_C = C1 - C2
+    delta_H = np.sqrt(np.clip((a1 - a2) ** 2 + (b1 - b2) ** 2 - delta_C ** 2, 0, None))
+    return C1, delta_L, delta_C, delta_H
+
+def delta_e_cie1994(lab1, lab2, K_L=1, K_C=1, K_H=1, K_1=0.045, K_2=0.015):
+    """
+    Delta E (CIE1994). The graphic arts weights are the defaults; textiles use K_L=2, K_1=0.048, K_2=0.014.
+    """
+    C1, delta_L, delta_C, delta_H = _delta_lch(*_lab(lab1, lab2))
+    S_C = 1 + K_1 * C1
+    S_H = 1 + K_2 * C1
+    return np.sqrt((delta_L / K_L) ** 2 + (delta_C / (K_C * S_C)) ** 2 + (delta_H / (K_H * S_H)) ** 2)
+
+def delta_e_cmc(lab1, lab2, pl=2, pc=1):
+    """Delta E (CMC l:c), acceptability (2:1) by default, perceptibility is 1:1."""
+    L1, a1, b1, L2, a2, b2 = _lab(lab1, lab2)
+    C1, delta_L, delta_C, delta_H = _delta_lch(L1, a1, b1, L2, a2, b2)
+    H1 = np.degrees(np.arctan2(b1, a1)) % 360
+    F = np.sqrt(C1 ** 4 / (C1 ** 4 + 1900.0))
+    T = np.where((H1 >= 164) & (H1 <= 345),
+                 0.56 + np.abs(0.2 * np.cos(np.radians(H1 + 168))),
+                 0.36 + np.abs(0.4 * np.cos(np.radians(H1 + 35))))
+    S_L = np.where(L1 < 16, 0.511, 0.040975 * L1 / (1 + 0.01765 * L1))
+    S_C = 0.0638 * C1 / (1 + 0.0131 * C1) + 0.638
+    S_H = S_C * (F * T + 1 - F)
+    return np.sqrt((delta_L / (pl * S_L)) ** 2 + (delta_C / (pc * S_C)) ** 2 + (delta_H / S_H) ** 2)
+
+def delta_e_cie2000(lab1, lab2, Kl=1, Kc=1, Kh=1):
+    """Delta E (CIE2000)."""
+    L1, a1, b1, L2, a2, b2 = _lab(lab1, lab2)
+    avg_Lp = (L1 + L2) / 2.0
+    C1 = np.sqrt(a1 ** 2 + b1 ** 2)
+    C2 = np.sqrt(a2 ** 2 + b2 ** 2)
+    avg_C = (C1 + C2) / 2.0
+    G = 0.5 * (1 - np.sqrt(avg_C ** 7 / (avg_C ** 7 + 25.0 ** 7)))
+    a1p = (1.0 + G) * a1
+    a2p = (1.0 + G) * a2
+    C1p = np.sqrt(a1p ** 2 + b1 ** 2)
+    C2p = np.sqrt(a2p ** 2 + b2 ** 2)
+    avg_Cp = (C1p + C2p) / 2.0
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+    # like colormath, the mean hue is shifted by 180 degrees whenever the hues are more than 180 apart
+    avg_Hp = ((np.abs(h1p - h2p) > 180) * 360 + h1p + h2p) / 2.0
+    T = (1 - 0.17 * np.cos(np.radians(avg_Hp - 30)) + 0.24 * np.cos(np.radians(2 * avg_Hp))
+         + 0.32 * np.cos(np.radians(3 * avg_Hp + 6)) - 0.2 * np.cos(np.radians(4 * avg_Hp - 63)))
+    delta_hp = h2p - h1p
+    delta_hp = delta_hp + (np.abs(delta_hp) > 180) * 360 - (h2p > h1p) * 720
+    delta_Lp = L2 - L1
+    delta_Cp = C2p - C1p
+    delta_Hp = 2 * np.sqrt(C2p * C1p) * np.sin(np.radians(delta_hp) / 2.0)
+    S_L = 1 + 0.015 * (avg_Lp - 50) ** 2 / np.sqrt(20 + (avg_Lp - 50) ** 2)
+    S_C = 1 + 0.045 * avg_Cp
+    S_H = 1 + 0.015 * avg_Cp * T
+    delta_ro = 30 * np.exp(-((avg_Hp - 275) / 25) ** 2)
+    R_C = np.sqrt(avg_Cp ** 7 / (avg_Cp ** 7 + 25.0 ** 7))
+    R_T = -2 * R_C * np.sin(2 * np.radians(delta_ro))
+    dL = delta_Lp / (S_L * Kl)
+    dC = delta_Cp / (S_C * Kc)
+    dH = delta_Hp / (S_H * Kh)
+    return np.sqrt(dL ** 2 + dC ** 2 + dH ** 2 + R_T * dC * dH)
+
+def circular_difference(x1, x2):
+    """Difference of values on the unit circle (e.g. hues in [0, 1])."""
+    diff = np.abs(np.asarray(x1, dtype=float) - np.asarray(x2, dtype=float))
+    return np.minimum(diff, 1 - diff)
+
+def paired_color_distances(colors1, colors2, metric):
+    """
+    Distances between colors1[i] and colors2[i] (see color_distance for the metrics).
+
+    Args:
+        colors1: (..., 3) array of colors, Lab for the delta E metrics and HSV for 'hue', 'value' and 'hue-value'
+        colors2: (..., 3) array of colors broadcastable with colors1
+        metric: one of METRICS
+
+    Returns:
+        array of distances
+    """
+    colors1 = np.asarray(colors1, dtype=float)
+    colors2 = np.asarray(colors2, dtype=float)
+    if metric == "hue":
+        return circular_difference(colors1[..., 0], colors2[..., 0])
+    elif metric == "value":
+        return circular_difference(colors1[..., 2], colors2[..., 2])
+    elif metric == "hue-value":
+        return np.sqrt(circular_difference(colors1[..., 0], colors2[..., 0]) ** 2 +
+                       circular_difference(colors1[..., 2], colors2[..., 2]) ** 2)
+    elif metric == "CIE1976":
+        return delta_e_cie1976(colors1, colors2)
+    elif metric == "CIE1994":
+        # using textiles weights
+        return delta_e_cie1994(colors1, colors2, K_1=0.048, K_2=0.014, K_L=2)
+    elif metric == "CIE2000":
+        return delta_e_cie2000(colors1, colors2)
+    elif metric == "CMC":
+        return delta_e_cmc(colors1, colors2)
+    raise ValueError(f"Unknown metric: {metric}")
+
+def color_pdist(colors, metric, first=None, second=None):
+    """
+    Condensed matrix of the distances between all pairs of colors, in scipy's pdist order
+    (use scipy.spatial.distance.squareform for the square matrix).
+
+    Args:
+        colors: (N, 3) array of colors
+        metric: one of METRICS
+        first, second: only compute these pairs (index arrays with first < second) instead of all of them
+
+    Returns:
+        array of N * (N - 1) / 2 distances, or of the distances of the given pairs
+    """
+    colors = np.asarray(colors, dtype=float).reshape(-1, 3)
+    if first is None:
+        first, second = np.triu_indices(len(colors), k=1)
+    # the CIE1994 and CMC weights come from the first color, as in the pairwise loops this replaces
+    return paired_color_distances(colors[first], colors[second], metric)
@@ -1,7 +1,9 @@
+
 class PackingConfig:
     def __init__(self, dpi=100, threshold=100, min_scrap_size=100,
                  seam_allowance=25, strategy='log-cabin', color_bin=False,
-                 start_length=None, max_options=20):
+                 start_length=None, max_options=20, solver_backend='auto', solver_time_limits=None, solve_slo=20,
+                 length_grid=None, dominant_method='kmeans'):
         self.dpi = dpi # how many pixels per inch
         self.scale_factor = 1
         self.threshold = threshold # threshold for allowable packing target length difference
@@ -11,6 +13,21 @@ class PackingConfig:
         self.use_color_bins = color_bin
         self.desired_color = None
         self.max_options = max_options
+        # strip selection solver ('auto', 'gurobi', 'highs' or 'numpy') and its time limit per bin in seconds
+        self.solver_backend = solver_backend
+        self.solver_time_limits = solver_time_limits if solver_time_limits is not None else {
+            'gurobi': 30,
+            'highs': 30,
+            'numpy': 10,
+        }
+        # wall-clock budget in seconds for solving all bins of one iteration (see SolveScheduler)
+        self.solve_slo = solve_slo
+        # solve on a grid of this many inches (e.g. 1/8) and re-check the options at full resolution,
+        # None solves at full resolution (only the numpy backend uses the grid, see quantize_problem)
+        self.length_grid = length_grid
+        # how the dominant colors of the fabrics are computed: 'kmeans' on every pixel, or the faster
+        # 'subsample' and 'histogram' approximations (see features.image_dominant_color)
+        self.dominant_method = dominant_method
         # useful when the strategy is rail-fence
         self.start_length = start_length
         self.block12 = None
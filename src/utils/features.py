@@ -0,0 +1,309 @@
+import hashlib
+import os
+import threading
+import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from skimage.color import rgb2hsv, rgb2lab
+from sklearn.cluster import KMeans
+from threadpoolctl import threadpool_limits
+
+# bump when compute_features changes so that stores on disk are recomputed
+FEATURE_VERSION = 1
+FEATURE_STORE_NAME = '.fabric_features.npz'
+HISTOGRAM_BINS = 32
+# how dominant colors are found: k-means on every pixel, on a stratified sample of the opaque pixels,
+# or on a quantized color histogram of the opaque pixels (see image_dominant_color)
+DOMINANT_METHODS = ['kmeans', 'subsample', 'histogram']
+
+def feature_key(image):
+    """Key of the features of an image: hash of its pixels (a trimmed image is a new image)."""
+    digest = hashlib.sha1()
+    digest.update(f"{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def dominant_color(pixels, weights=None):
+    """Center of the largest of 3 k-means clusters of the pixels (see binning.get_mode_color)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        kmeans = KMeans(n_clusters=min(3, len(pixels)), random_state=0).fit(pixels, sample_weight=weights)
+    cluster_sizes = np.bincount(kmeans.labels_, weights=weights)
+    return kmeans.cluster_centers_[np.argmax(cluster_sizes)]
+
+def to_color_space(rgb, space):
+    """(N, 3) RGB colors in [0, 1] to 'hsv', 'lab' or (unchanged) 'rgb'."""
+    if space == 'hsv':
+        return rgb2hsv(rgb.reshape(-1, 1, 3)).reshape(-1, 3)
+    elif space == 'lab':
+        return rgb2lab(rgb.reshape(-1, 1, 3)).reshape(-1, 3)
+    return rgb
+
+def opaque_pixels(image, max_samples=None, seed=0):
+    """
+    RGB pixels in [0, 1] of an image without its transparent pixels, as an (N, 3) array.
+
+    Args:
+        image: PIL Image
+        max_samples: keep about this many pixels, sampled on a regular grid with a random offset
+            in each cell so that every part of the image is represented (all pixels if None)
+        seed: seed of the offsets
+
+    Returns:
+        (N, 3) array
+    """
+    pixels = np.array(image.convert('RGBA'))
+    height, width = pixels.shape[:2]
+    if max_samples is not None and height * width > max_samples:
+        step = int(np.ceil(np.sqrt(height * width / max_samples)))
+        rng = np.random.default_rng(seed)
+        rows = np.arange(0, height, step)
+        cols = np.arange(0, width, step)
+        rows = np.minimum(rows[:, None] + rng.integers(0, step, (len(rows), len(cols))), height - 1)
+        cols = np.minimum(cols[None, :] + rng.integers(0, step, (len(rows), len(cols))), width - 1)
+        pixels = pixels[rows, cols]
+    pixels = pixels.reshape(-1, 4)
+    opaque = pixels[:, 3] > 0
+    if not opaque.any():
+        # fully transparent, fall back to all pixels
+        opaque[:] = True
+    return pixels[opaque, :3] / 255.0
+
+def image_dominant_color(image, space='hsv', method='subsample', max_samples=20000, histogram_bins=16):
+    """
+    Fast dominant color of the opaque pixels of an image.
+
+    Args:
+        image: PIL Image
+        space: 'hsv' or 'lab', the space the pixels are clustered in
+        method: 'subsample' clusters a stratified sample of max_samples pixels; 'histogram' clusters
+            the mean colors of the occupied cells of a histogram_bins^3 RGB histogram, weighted by
+            their pixel counts; 'kmeans' clusters every opaque pixel
+        max_samples: sample size of 'subsample'
+        histogram_bins: bins per channel of 'histogram'
+
+    Returns:
+        dominant color in space
+    """
+    if method == 'histogram':
+        rgb = opaque_pixels(image)
+        cells = np.minimum((rgb * histogram_bins).astype(np.int64), histogram_bins - 1)
+        cells = (cells[:, 0] * histogram_bins + cells[:, 1]) * histogram_bins + cells[:, 2]
+        counts = np.bincount(cells, minlength=histogram_bins ** 3)
+        occupied = np.nonzero(counts)[0]
+        sums = np.column_stack([np.bincount(cells, weights=rgb[:, c], minlength=histogram_bins ** 3)[occupied] for c in range(3)])
+        counts = counts[occupied].astype(float)
+        return dominant_color(to_color_space(sums / counts[:, None], space), weights=counts)
+    elif method == 'subsample':
+        return dominant_color(to_color_space(opaque_pixels(image, max_samples), space))
+    elif method == 'kmeans':
+        return dominant_color(to_color_space(opaque_pixels(image), space))
+    raise ValueError(f"Unknown dominant color method: {method}")
+
+def compute_features(image, dominant_method='kmeans'):
+    """
+    Color features of a fabric image, the same values as binning.compute_criteria and
+    binning.get_mode_color and Fabric.color compute from the image.
+
+    Args:
+        image: PIL Image
+        dominant_method: one of DOMINANT_METHODS, 'kmeans' clusters every pixel like get_mode_color
+
+    Returns:
+        dict with mean_rgb (0-255), average_hsv, dominant_hsv (0-1), average_lab, dominant_lab,
+        hue_histogram and value_histogram (HISTOGRAM_BINS bins, summing to 1)
+    """
+    mean_rgb = np.mean(np.mean(np.array(image)[:, :, :3], axis=0), axis=0)
+    rgb_image = image.convert('RGB') if image.mode != 'RGB' else image
+    pixels = np.array(rgb_image).reshape(-1, 1, 3) / 255.0
+    hsv_pixels = rgb2hsv(pixels).reshape(-1, 3)
+    lab_pixels = rgb2lab(pixels).reshape(-1, 3)
+    hue_histogram = np.histogram(hsv_pixels[:, 0], bins=HISTOGRAM_BINS, range=(0, 1))[0]
+    value_histogram = np.histogram(hsv_pixels[:, 2], bins=HISTOGRAM_BINS, range=(0, 1))[0]
+    if dominant_method == 'kmeans':
+        dominant_hsv = dominant_color(hsv_pixels)
+        dominant_lab = dominant_color(lab_pixels)
+    else:
+        dominant_hsv = image_dominant_color(image, 'hsv', dominant_method)
+        dominant_lab = image_dominant_color(image, 'lab', dominant_method)
+    return {
+        'mean_rgb': mean_rgb,
+        'average_hsv': np.mean(hsv_pixels, axis=0),
+        'dominant_hsv': dominant_hsv,
+        'average_lab': np.mean(lab_pixels, axis=0),
+        'dominant_lab': dominant_lab,
+        'hue_histogram': hue_histogram / max(hue_histogram.sum(), 1),
+        'value_histogram': value_histogram / max(value_histogram.sum(), 1),
+    }
+
+def mode_color(features, mode='average', criterion='hue'):
+    """binning.get_mode_color from the features of the image."""
+    space = 'lab' if criterion == 'lab' else 'hsv'
+    if mode not in ['average', 'dominant']:
+        raise ValueError("Invalid criterion or mode")
+    return features[f'{mode}_{space}']
+
+def criteria_value(features, mode='average', criterion='hue'):
+    """binning.compute_criteria from the features of the image."""
+    color = mode_color(features, mode, criterion)
+    if criterion == 'hue':
+        return color[0]
+    elif criterion == 'value':
+        return color[2]
+    elif criterion == 'hue-value':
+        return np.array([color[0], color[2]])
+    elif criterion == 'lab':
+        return color
+    raise ValueError("Invalid criterion or mode")
+
+_feature_pool = None
+
+def get_feature_pool(max_workers=None):
+    """Lazily created process pool for feature extraction."""
+    global _feature_pool
+    if _feature_pool is None:
+        from src.utils.solvers import worker_context
+        _feature_pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=worker_context())
+    return _feature_pool
+
+def _features_in_worker(image, dominant_method):
+    # the pool already uses every cpu, so each k-means runs single-threaded
+    with threadpool_limits(limits=1):
+        return compute_features(image, dominant_method)
+
+class FeatureStore:
+    """
+    Color features of fabric images, keyed by image content hash (see feature_key),
+    so that the k-means fits of the dominant colors run once per image rather than on every load.
+
+    A store made with for_folder lives on disk in that fabric_data folder (FEATURE_STORE_NAME, one
+    file per dominant color method); FeatureStore() only keeps the features in memory. The file is
+    a plain npz archive (the keys and one stacked array per feature), loaded without pickle.
+
+    path: file the store is loaded from and saved to (optional)
+    dominant_method: how the dominant colors are computed (see DOMINANT_METHODS)
+    """
+    _folder_stores = {}
+    _folder_stores_lock = threading.Lock()
+
+    def __init__(self, path=None, dominant_method='kmeans'):
+        if dominant_method not in DOMINANT_METHODS:
+            raise ValueError(f"Unknown dominant color method: {dominant_method}")
+        self.path = path
+        self.dominant_method = dominant_method
+        self.features = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    if int(data['version']) == FEATURE_VERSION:
+                        names = [name for name in data.files if name not in ('version', 'keys')]
+                        columns = {name: data[name] for name in names}
+                        self.features = {str(key): {name: columns[name][i] for name in names}
+                                         for i, key in enumerate(data['keys'])}
+            except Exception as e:
+                print(f"Error loading feature store {path}: {e}")
+
+    @classmethod
+    def for_folder(cls, folder, dominant_method='kmeans'):
+        """The store of a fabric folder (in memory only if folder is None), shared by all callers in this process."""
+        folder = os.path.abspath(folder) if folder is not None else None
+        with cls._folder_stores_lock:
+            if (folder, dominant_method) not in cls._folder_stores:
+                path = None
+                if folder is not None:
+                    name, extension = os.path.splitext(FEATURE_STORE_NAME)
+                    suffix = '' if dominant_method == 'kmeans' else f'_{dominant_method}'
+                    path = os.path.join(folder, f'{name}{suffix}{extension}')
+                cls._folder_stores[(folder, dominant_method)] = cls(path, dominant_method)
+            return cls._folder_stores[(folder, dominant_method)]
+
+    def get(self, image):
+        """Features of an image, computed and stored if they are not known yet."""
+        return self.extract([image])[0]
+
+    def extract(self, images, max_workers=None):
+        """
+        Features of many images; the unknown ones are computed in a process pool and the store is saved.
+
+        Args:
+            images: list of PIL Images
+            max_workers: Number of workers (defaults to the number of cpus)
+
+        Returns:
+            list of feature dicts (see compute_features), in the same order
+        """
+        keys = [feature_key(image) for image in images]
+        missing = {}
+        with self.lock:
+            for i, key in enumerate(keys):
+                if key not in self.features and key not in missing:
+                    missing[key] = i
+        if len(missing) > 0:
+            # computed without the lock, another thread may compute the same images meanwhile
+            indices = list(missing.values())
+            if len(indices) <= 1 or (max_workers or os.cpu_count()) <= 1:
+                computed = [compute_features(images[i], self.dominant_method) for i in indices]
+            else:
+                try:
+                    pool = get_feature_pool(max_workers)
+                    futures = [pool.submit(_features_in_worker, images[i], self.dominant_method)
+                               for i in indices]
+                    computed = [future.result() for future in futures]
+                except BrokenProcessPool:
+                    global _feature_pool
+                    _feature_pool = None
+                    print("Feature pool broke. Extracting the features sequentially.")
+                    computed = [compute_features(images[i], self.dominant_method) for i in indices]
+            with self.lock:
+                for key, features in zip(missing.keys(), computed):
+                    self.features[key] = features
+                self.dirty = True
+            self.save()
+        with self.lock:
+            return [self.features[key] for key in keys]
+
+    def save(self):
+        """Write the store to its path (if it has one and changed)."""
+        with self.lock:
+            if self.path is None or not self.dirty:
+                return
+            try:
+                tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                keys = list(self.features.keys())
+                columns = {name: np.array([self.features[key][name] for key in keys])
+                           for name in next(iter(self.features.values()))}
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, version=FEATURE_VERSION, keys=np.array(keys, dtype=str), **columns)
+                os.replace(tmp_path, self.path)
+                self.dirty = False
+            except OSError as e:
+                print(f"Error saving feature store {self.path}: {e}")
+
+def extract_features(images, image_paths=None, max_workers=None, dominant_method='kmeans'):
+    """
+    Features of images through the store of the fabric folder of each image, or an in-memory store
+    for images without a path (or whose folder does not exist).
+
+    Args:
+        images: list of PIL Images
+        image_paths: path of each image (optional)
+        max_workers: Number of workers (defaults to the number of cpus)
+        dominant_method: how the dominant colors are computed (see DOMINANT_METHODS)
+
+    Returns:
+        list of feature dicts (see compute_features), in the same order
+    """
+    image_paths = image_paths or [None] * len(images)
+    stores = {}
+    for i, image_path in enumerate(image_paths):
+        folder = os.path.dirname(image_path) if image_path is not None else None
+        store = FeatureStore.for_folder(folder if folder and os.path.isdir(folder) else None, dominant_method)
+        stores.setdefault(id(store), (store, []))[1].append(i)
+    features = [None] * len(images)
+    for store, indices in stores.values():
+        for i, image_features in zip(indices, store.extract([images[i] for i in indices], max_workers=max_workers)):
+            features[i] = image_features
+    return features
@@ -1,5 +1,5 @@
 import numpy as np
-from src.utils.binning import color_distance
+from src.utils.color_diff import color_pdist
 
 class BinFilter:
     def __init__(self, filter_parameters):
@@ -8,6 +8,10 @@ class BinFilter:
     def validates(self, bin):
         pass
 
+    def constrain(self, problem, bin, config):
+        # tighten the SubsetProblem of bin (indexed like bin.edges) before it is solved
+        pass
+
 class FabricFilter(BinFilter):
     def __init__(self, filter_parameters):
         self.must_have_fabric = filter_parameters['must_have_fabric']
@@ -16,6 +20,11 @@ class FabricFilter(BinFilter):
     def validates(self, bin):
         return any([edge.p.id == self.must_have_fabric for edge in bin.edges])
 
+    def constrain(self, problem, bin, config):
+        # the fabric has to be part of the strip, not only of the bin
+        if self.validates(bin):
+            problem.group_mins = {**problem.group_mins, self.must_have_fabric: 1}
+
 class UserBinFilter(BinFilter):
     def __init__(self, filter_parameters):
         self.user_selected_bins = filter_parameters.get('user_selected_bins', [])
@@ -33,6 +42,11 @@ class OptionFilter:
     def validates(self, option):
         pass
 
+    def constrain(self, problem, bin, config):
+        # tighten the SubsetProblem of bin (indexed like bin.edges) before it is solved,
+        # validates stays the final check of the options
+        pass
+
 class ThicknessFilter(OptionFilter):
     def __init__(self, filter_parameters):
         self.thickness_min = filter_parameters['thickness_min']
@@ -44,6 +58,18 @@ class ThicknessFilter(OptionFilter):
     def validates(self, thickness):
         return self.thickness_min <= thickness <= self.thickness_max
 
+    def constrain(self, problem, bin, config):
+        # the filter is on the display thickness (other dimension minus seam allowances) and the
+        # solver works on high-res other dimensions, so bound the solver by the edges that pass
+        thickness = np.array([edge.get_other_dim(use_high_res=False) - 2 * config.sa for edge in bin.edges])
+        thick = problem.other_dims[thickness >= self.thickness_min]
+        thin = problem.other_dims[thickness <= self.thickness_max]
+        # without such edges, bounds that no edge can meet let presolve reject the bin
+        thickness_min = int(thick.min()) if len(thick) > 0 else int(problem.other_dims.max()) + 1
+        thickness_max = int(thin.max()) if len(thin) > 0 else int(problem.other_dims.min()) - 1
+        problem.thickness_min = thickness_min if problem.thickness_min is None else max(problem.thickness_min, thickness_min)
+        problem.thickness_max = thickness_max if problem.thickness_max is None else min(problem.thickness_max, thickness_max)
+
 class OptionRank:
     def __init__(self):
         pass
@@ -51,99 +77,143 @@ class OptionRank:
     def compute_rank(self):
         pass
 
+    def compute_ranks(self, table):
+        # ranks of all options of an OptionTable (lower = better), one option at a time unless overridden
+        return np.array([self.compute_rank(option) for option in table.options()])
+
 class HighFabricCountRank(OptionRank):
     # more fabrics = better
     def compute_rank(self, option):
         return len(option.edge_subset)
 
+    def compute_ranks(self, table):
+        return table.counts
+
 class LowFabricCountRank(HighFabricCountRank):
     # less fabrics = better
     def compute_rank(self, option):
         return -super().compute_rank(option)
 
+    def compute_ranks(self, table):
+        return -super().compute_ranks(table)
+
 class LargeThicknessRank(OptionRank):
     # thicker = better
     def compute_rank(self, option):
         return option.shortest_side
 
+    def compute_ranks(self, table):
+        return table.shortest_side
+
 class SmallThicknessRank(LargeThicknessRank):
     # thinner = better
     def compute_rank(self, option):
         return -super().compute_rank(option)
 
+    def compute_ranks(self, table):
+        return -super().compute_ranks(table)
+
 class WastedAreaRank(OptionRank):
     # less wasted area = better
     def compute_rank(self, option):
         return option.wasted_area
 
-class LowContrastRank(OptionRank):
-    # less color difference = better
-    def compute_rank(self, option):
-        fabric_images = [edge.p.image for edge in option.edge_subset]
-        average_colors = [np.mean(np.mean(np.array(im)[:, :, :3], axis=0), axis=0) for im in fabric_images]
-        
-        n = len(average_colors)
-        if n < 2:
-            return 0
-
-        # Calculate average pairwise color differences using CIE2000
-        total_diff = sum(
-            color_distance(average_colors[i], average_colors[j], "CIE2000")
-            for i in range(n)
-            for j in range(i + 1, n)
-        )
-
-        return total_diff / (n * (n - 1) / 2)
-
-class LowValueContrastRank(OptionRank):
-    # less value difference = better
-    def compute_rank(self, option):
-        fabric_images = [edge.p.image for edge in option.edge_subset]
-        hsv_images = [image.convert('HSV') for image in fabric_images]
-        average_values = [np.mean(np.mean(np.array(hsv_image)[:, :, 2])) for hsv_image in hsv_images]
+    def compute_ranks(self, table):
+        return table.wasted_area
 
-        n = len(average_values)
-        if n < 2:
-            return 0
+def mean_pair_difference(values, metric):
+    # average difference over all pairs of values
+    if len(values) < 2:
+        return 0
+    return float(color_pdist(values, metric).mean())
 
-        total_diff = sum(
-            color_distance([0, 0, average_values[i]], [0, 0, average_values[j]], "value")
-            for i in range(n)
-            for j in range(i + 1, n)
-        )
+class ContrastRank(OptionRank):
+    # the color difference ranks, which find_best_subsets_gurobi models with one variable per edge pair
+    pass
 
-        return total_diff / (n * (n - 1) / 2)
+class LowContrastRank(ContrastRank):
+    # less color difference = better (CIE2000 between the average colors)
+    def compute_rank(self, option):
+        return mean_pair_difference([edge.p.color for edge in option.edge_subset], "CIE2000")
 
-class LowHueContrastRank(OptionRank):
-    # less hue difference = better
+    def compute_ranks(self, table):
+        return table.pair_difference_means(table.fabric_stats('rgb'), "CIE2000")
+
+class LowValueContrastRank(ContrastRank):
+    # less value difference = better
     def compute_rank(self, option):
-        fabric_images = [edge.p.image for edge in option.edge_subset]
-        hsv_images = [image.convert('HSV') for image in fabric_images]
-        average_hues = [np.mean(np.mean(np.array(hsv_image)[:, :, 0])) for hsv_image in hsv_images]
+        values = np.zeros((len(option.edge_subset), 3))
+        values[:, 2] = [edge.p.hsv_mean()[2] for edge in option.edge_subset]
+        return mean_pair_difference(values, "value")
 
-        n = len(average_hues)
-        if n < 2:
-            return 0
+    def compute_ranks(self, table):
+        return table.pair_difference_means(table.fabric_stats('hsv') * [0, 0, 1], "value")
 
-        total_diff = sum(
-            color_distance([average_hues[i], 0, 0], [average_hues[j], 0, 0], "hue")
-            for i in range(n)
-            for j in range(i + 1, n)
-        )
+class LowHueContrastRank(ContrastRank):
+    # less hue difference = better
+    def compute_rank(self, option):
+        hues = np.zeros((len(option.edge_subset), 3))
+        hues[:, 0] = [edge.p.hsv_mean()[0] for edge in option.edge_subset]
+        return mean_pair_difference(hues, "hue")
 
-        return total_diff / (n * (n - 1) / 2)
+    def compute_ranks(self, table):
+        return table.pair_difference_means(table.fabric_stats('hsv') * [1, 0, 0], "hue")
 
 class HighContrastRank(LowContrastRank):
     # more color difference = better
     def compute_rank(self, option):
         return -super().compute_rank(option)
 
+    def compute_ranks(self, table):
+        return -super().compute_ranks(table)
+
 class HighValueContrastRank(LowValueContrastRank):
     # more value difference = better
     def compute_rank(self, option):
         return -super().compute_rank(option)
 
+    def compute_ranks(self, table):
+        return -super().compute_ranks(table)
+
 class HighHueContrastRank(LowHueContrastRank):
     # more hue difference = better
     def compute_rank(self, option):
         return -super().compute_rank(option)
+
+    def compute_ranks(self, table):
+        return -super().compute_ranks(table)
+
+class ParetoObjective:
+    """
+    An objective of the Pareto front of next_pareto_options: a column of the OptionTable and whether
+    it is minimized or maximized.
+
+    name: what the objective is called in logs
+    column: function of an OptionTable returning one value per option
+    maximize: whether larger values are better
+    """
+    def __init__(self, name, column, maximize=False):
+        self.name = name
+        self.column = column
+        self.maximize = maximize
+
+    def compute_ranks(self, table):
+        # lower = better, like the OptionRanks (see OptionTable.pareto_mask)
+        values = np.asarray(self.column(table), dtype=float)
+        return -values if self.maximize else values
+
+    def __repr__(self):
+        return f"ParetoObjective({self.name}, {'max' if self.maximize else 'min'})"
+
+def contrast_means(table):
+    # mean CIE2000 difference between the average colors of the fabrics of each option
+    return table.pair_difference_means(table.fabric_stats('rgb'), "CIE2000")
+
+# the trade-offs of next_pareto_options: less wasted area, thicker strips, fewer fabrics and less
+# color contrast
+PARETO_OBJECTIVES = [
+    ParetoObjective('wasted area', lambda table: table.wasted_area),
+    ParetoObjective('thickness', lambda table: table.shortest_side, maximize=True),
+    ParetoObjective('fabric count', lambda table: table.counts),
+    ParetoObjective('contrast', contrast_means),
+]
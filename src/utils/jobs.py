@@ -0,0 +1,300 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.solvers import CancelToken
+
+class JobCancelled(Exception):
+    """Raised by a job's function when its token was cancelled, see Job."""
+    pass
+
+class JobRejected(Exception):
+    """Raised by JobQueue.submit when the queue (or the session's share of it) is full."""
+    pass
+
+class JobError(Exception):
+    """
+    Raised by a job's function for a request that cannot be answered: response is the json data of
+    the answer and status its HTTP status.
+    """
+    def __init__(self, response, status=500):
+        super().__init__(response.get('message', response.get('error')))
+        self.response = response
+        self.status = status
+
+class Job:
+    """
+    A unit of work of a session, run by a JobQueue worker.
+
+    fn is called as fn(job): a cancellable job stops early when job.token is cancelled (pass it on to
+    the solver, see CancelToken), and any job may publish progress events to its subscribers and
+    pollers.
+
+    status: 'queued', 'running', 'done', 'error' or 'cancelled'
+    """
+    def __init__(self, session_id, kind, key, fn, cancellable=False):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.kind = kind
+        self.key = key
+        self.fn = fn
+        self.cancellable = cancellable
+        self.token = CancelToken()
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.latest = None
+        self.progress = None
+        self.listeners = []
+        self.callbacks = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.finished = threading.Event()
+        self.lock = threading.Lock()
+
+    def run(self):
+        status = 'cancelled'
+        try:
+            if not self.token.cancelled():
+                self.status = 'running'
+                self.started_at = time.time()
+                self.result = self.fn(self)
+                status = 'done'
+        except JobCancelled:
+            pass
+        except Exception as e:
+            print(f'Job {self.kind} {self.id[:8]} failed: {e}')
+            self.error = e
+            status = 'error'
+        with self.lock:
+            self.status = status
+            self.finished_at = time.time()
+            self.finished.set()
+            listeners = list(self.listeners)
+            callbacks, self.callbacks = self.callbacks, []
+        for listener in listeners:
+            listener.put(self.final_event())
+        for callback in callbacks:
+            callback()
+
+    def when_finished(self, callback):
+        """Call callback once the job has finished (right away if it has)."""
+        with self.lock:
+            if not self.finished.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        self.token.cancel()
+
+    def cancelled(self):
+        return self.token.cancelled()
+
+    def is_active(self):
+        """Whether the job has not finished and was not cancelled (so that requests can still join it)."""
+        return not self.finished.is_set() and not self.cancelled()
+
+    def publish(self, kind, payload=None, progress=None):
+        """
+        Send an event to the subscribers (later subscribers get the latest event first) and keep its
+        progress dict for polling (see to_json).
+        """
+        event = (kind, payload, progress)
+        with self.lock:
+            self.latest = event
+            if progress is not None:
+                self.progress = progress
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener.put(event)
+
+    def final_event(self):
+        """('done', result, None), ('error', {'message': ...}, None) or ('cancelled', {'message': ...}, None)"""
+        if self.status == 'done':
+            return ('done', self.result, None)
+        if self.status == 'error':
+            return ('error', self.error_response()[0], None)
+        return ('cancelled', {'message': 'Superseded by a newer request'}, None)
+
+    def subscribe(self):
+        """A queue that receives the job's events, ending with its final_event."""
+        listener = queue.Queue()
+        with self.lock:
+            self.listeners.append(listener)
+            if self.latest is not None:
+                listener.put(self.latest)
+            if self.finished.is_set():
+                listener.put(self.final_event())
+        return listener
+
+    def unsubscribe(self, listener):
+        """Remove a subscriber, returns how many are left."""
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+            return len(self.listeners)
+
+    def error_response(self):
+        """(json data, HTTP status) of a failed job."""
+        if isinstance(self.error, JobError):
+            return self.error.response, self.error.status
+        return {'message': str(self.error)}, 500
+
+    def to_json(self):
+        """The status of the job for polling."""
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+    def wait(self, timeout=None):
+        """
+        Wait for the job and return its result.
+
+        Raises:
+            JobCancelled if the job was cancelled, the job's exception if it failed
+        """
+        self.finished.wait(timeout)
+        if self.status == 'cancelled':
+            raise JobCancelled()
+        if self.status == 'error':
+            raise self.error
+        return self.result
+
+    def __repr__(self):
+        return f"Job({self.kind}, {self.id[:8]}, {self.status})"
+
+def lower_thread_priority(niceness):
+    # Linux keeps a nice value per thread; solver threads started from the thread inherit it
+    if niceness <= 0:
+        return
+    try:
+        tid = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, tid, os.getpriority(os.PRIO_PROCESS, tid) + niceness)
+    except (AttributeError, OSError):
+        pass
+
+class JobQueue:
+    """
+    Runs the heavy work of the server (option solves, packing, high-res reconstruction) on a bounded
+    pool of worker threads, so that the request threads stay free for the lightweight endpoints. The
+    workers run at a lower priority (niceness) for the same reason, and so do the solver threads they
+    start.
+
+    Jobs are looked up by id for status polling and result retrieval; the last max_finished finished
+    jobs are kept. Admission control rejects new jobs (JobRejected) beyond max_pending unfinished
+    jobs, or beyond max_session_jobs of one session.
+
+    The jobs of a session run one after the other, since they work on the same session state: a job
+    only takes a worker once the session's previous job has finished. submit joins the session's
+    unfinished job if it has the same key (identical concurrent requests share one job), and cancels
+    it if it is cancellable (a newer request supersedes an option solve, so that it gives its cpus to
+    the newer request right away).
+    """
+    def __init__(self, max_workers=2, max_pending=16, max_session_jobs=4, max_finished=256, niceness=5):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job',
+                                       initializer=lower_thread_priority, initargs=(niceness,))
+        self.max_pending = max_pending
+        self.max_session_jobs = max_session_jobs
+        self.max_finished = max_finished
+        self.jobs = OrderedDict()
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def submit(self, session_id, kind, key, fn, cancellable=False):
+        """
+        Args:
+            session_id: The session identifier
+            kind: what the job does, e.g. the endpoint
+            key: identifies the request, e.g. its json
+            fn: called as fn(job) by a worker
+            cancellable: whether a newer job of the session cancels this one
+
+        Returns:
+            the Job that answers the request
+
+        Raises:
+            JobRejected if the queue is full
+        """
+        with self.lock:
+            running = self.sessions.get(session_id)
+            if running is not None and running.is_active() and (running.kind, running.key) == (kind, key):
+                print(f'Joining the running job {running.id[:8]} of session {session_id[:10]}')
+                return running
+            pending = [job for job in self.jobs.values() if not job.finished.is_set()]
+            if len(pending) >= self.max_pending:
+                raise JobRejected('The server is busy, please try again in a moment')
+            if sum(job.session_id == session_id for job in pending) >= self.max_session_jobs:
+                raise JobRejected('Too many requests of this session are still running')
+            if running is not None and running.cancellable and running.is_active():
+                print(f'Cancelling the superseded job {running.id[:8]} of session {session_id[:10]}')
+                running.cancel()
+            job = Job(session_id, kind, key, fn, cancellable=cancellable)
+            self.jobs[job.id] = job
+            self.sessions[session_id] = job
+            self._forget_finished()
+        if running is not None:
+            running.when_finished(lambda: self.pool.submit(job.run))
+        else:
+            self.pool.submit(job.run)
+        return job
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished.is_set()]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def latest(self, session_id):
+        """The last job submitted for the session (None after forget)."""
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def queue_position(self, job):
+        """How many queued jobs are ahead of a queued job (None once it runs)."""
+        if job.status != 'queued':
+            return None
+        with self.lock:
+            ahead = [other for other in self.jobs.values() if other.status == 'queued' and other.created_at < job.created_at]
+        return len(ahead)
+
+    def status(self, job):
+        """to_json of the job with its queue position."""
+        status = job.to_json()
+        status['queue_position'] = self.queue_position(job)
+        return status
+
+    def forget(self, session_id):
+        """Forget the session's last job if it has finished, e.g. after its state changed so that the job's result is stale."""
+        with self.lock:
+            job = self.sessions.get(session_id)
+            if job is not None and job.finished.is_set():
+                del self.sessions[session_id]
+
+    def cancel(self, session_id):
+        """
+        Cancel the session's jobs that have not started yet and its running cancellable job. A running
+        job that is not cancellable still uses the session's state: remove the state once the returned
+        job (the session's last one, None if it has none) has finished, e.g. with Job.when_finished,
+        then forget the session.
+        """
+        with self.lock:
+            jobs = [job for job in self.jobs.values() if job.session_id == session_id and not job.finished.is_set()]
+            latest = self.sessions.get(session_id)
+        for job in jobs:
+            if job.cancellable or job.status == 'queued':
+                job.cancel()
+        return latest
@@ -0,0 +1,179 @@
+import numpy as np
+from src.utils.color_diff import paired_color_distances
+from src.utils.config import PackingOption
+
+def non_dominated_mask(scores):
+    """
+    Pareto front of points to minimize.
+
+    Args:
+        scores: (N, D) array, lower is better in every column
+
+    Returns:
+        boolean mask of the points that no other point dominates (at most as good in every column and
+        better in one); of identical points only the first one is kept
+    """
+    scores = np.asarray(scores, dtype=float).reshape(len(scores), -1)
+    mask = np.zeros(len(scores), dtype=bool)
+    front = []
+    # a point can only be dominated by points that come before it in lexicographic order
+    for i in np.lexsort(scores.T[::-1]):
+        if len(front) > 0 and (scores[front] <= scores[i]).all(axis=1).any():
+            continue
+        front.append(i)
+        mask[i] = True
+    return mask
+
+class OptionTable:
+    """
+    Candidate strips (edge subsets) stored column-wise, with the metrics of all of them computed at once.
+
+    Options are rows; the edges of option i are edge_index[offsets[i]:offsets[i + 1]] (indices into edges).
+    Per-edge columns are in display resolution like PackingOption; per-fabric color statistics are
+    gathered once per distinct fabric (see pair_difference_means) so ranks never touch the images per option.
+
+    edge_subsets: list of edge subsets (lists of Edges)
+    config: PackingConfig (seam allowance and min_scrap_size)
+    target_L: target length of the strip in display resolution
+    rows: original index of each option (defaults to its position in edge_subsets)
+    """
+    def __init__(self, edge_subsets, config, target_L, rows=None):
+        self.edge_subsets = [list(edge_subset) for edge_subset in edge_subsets]
+        self.rows = np.arange(len(self.edge_subsets)) if rows is None else np.asarray(rows)
+        self.target_L = target_L
+        self.sa = config.sa
+        self.min_scrap_size = config.min_scrap_size
+        positions = {}
+        self.edges = []
+        edge_index = []
+        for edge_subset in self.edge_subsets:
+            for edge in edge_subset:
+                if id(edge) not in positions:
+                    positions[id(edge)] = len(self.edges)
+                    self.edges.append(edge)
+                edge_index.append(positions[id(edge)])
+        self.edge_index = np.array(edge_index, dtype=np.int64)
+        self.counts = np.array([len(edge_subset) for edge_subset in self.edge_subsets], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)]).astype(np.int64)
+        # per distinct edge
+        self.lengths = np.array([edge.length(use_high_res=False) for edge in self.edges])
+        self.other_dims = np.array([edge.get_other_dim(use_high_res=False) - 2 * config.sa for edge in self.edges])
+        self.sibling_lengths = np.array([edge.s.length(use_high_res=False) for edge in self.edges])
+        self.other_dims_px = np.array([edge.get_other_dim() for edge in self.edges])
+        fabric_positions = {}
+        self.fabrics = []
+        for edge in self.edges:
+            if id(edge.p) not in fabric_positions:
+                fabric_positions[id(edge.p)] = len(self.fabrics)
+                self.fabrics.append(edge.p)
+        self.fabric_index = np.array([fabric_positions[id(edge.p)] for edge in self.edges], dtype=np.int64)
+        self.compute_metrics()
+
+    def __len__(self):
+        return len(self.edge_subsets)
+
+    def reduce(self, values, ufunc):
+        """Reduce per-edge values (indexed like edges) over the edges of each option."""
+        return ufunc.reduceat(np.asarray(values)[self.edge_index], self.offsets[:-1]) if len(self) > 0 else np.zeros(0)
+
+    def compute_metrics(self):
+        """Thickness, wasted and total area of every option (the same as next_packing_options computed per option)."""
+        if len(self) == 0:
+            for name in ['shortest_side', 'shortest_side_px', 'sum_lengths', 'wasted_area', 'length_diff', 'total_area']:
+                setattr(self, name, np.zeros(0))
+            return
+        if self.counts.min() == 0:
+            raise ValueError("OptionTable needs at least one edge per option")
+        self.shortest_side = self.reduce(self.other_dims, np.minimum)
+        self.shortest_side_px = self.reduce(self.other_dims_px, np.minimum)
+        self.sum_lengths = self.reduce(self.lengths, np.add)
+        option_of_edge = np.repeat(np.arange(len(self)), self.counts)
+        lengths = self.lengths[self.edge_index]
+        remaining = self.other_dims[self.edge_index] - self.shortest_side[option_of_edge]
+        # leftovers too small to keep are wasted
+        wasted = (remaining < self.min_scrap_size) | (lengths < self.min_scrap_size)
+        self.wasted_area = np.add.reduceat(np.where(wasted, remaining * (lengths + 2 * self.sa), 0), self.offsets[:-1])
+        self.length_diff = self.sum_lengths - self.target_L + 2 * self.sa
+        self.wasted_area = self.wasted_area + np.maximum(self.length_diff, 0) * (self.shortest_side + 4 * self.sa)
+        self.total_area = self.reduce((self.lengths + 2 * self.sa) * (self.sibling_lengths + 2 * self.sa), np.add)
+
+    def unique_mask(self):
+        """Drops options with the same thickness and set of edge lengths as an earlier option."""
+        seen = set()
+        mask = np.zeros(len(self), dtype=bool)
+        for i in range(len(self)):
+            key = (self.shortest_side[i].item(), frozenset(self.lengths[self.edge_index[self.offsets[i]:self.offsets[i + 1]]].tolist()))
+            if key not in seen:
+                seen.add(key)
+                mask[i] = True
+        return mask
+
+    def select(self, mask):
+        """The table of the options in mask (boolean mask or row positions)."""
+        positions = np.nonzero(mask)[0] if np.asarray(mask).dtype == bool else np.asarray(mask)
+        table = object.__new__(OptionTable)
+        table.__dict__.update(self.__dict__)
+        table.edge_subsets = [self.edge_subsets[i] for i in positions]
+        table.rows = self.rows[positions]
+        table.counts = self.counts[positions]
+        table.offsets = np.concatenate([[0], np.cumsum(table.counts)]).astype(np.int64)
+        table.edge_index = np.concatenate([self.edge_index[self.offsets[i]:self.offsets[i + 1]] for i in positions]) \
+            if len(positions) > 0 else np.zeros(0, dtype=np.int64)
+        for name in ['shortest_side', 'shortest_side_px', 'sum_lengths', 'wasted_area', 'length_diff', 'total_area']:
+            setattr(table, name, getattr(self, name)[positions])
+        return table
+
+    def pair_difference_means(self, fabric_colors, metric):
+        """
+        Mean color difference over the edge pairs of each option, like the contrast ranks of a single option.
+
+        Args:
+            fabric_colors: (F, 3) colors of self.fabrics (see fabric_stats)
+            metric: color_diff metric (see paired_color_distances)
+
+        Returns:
+            array with one mean per option, 0 for options with fewer than two edges
+        """
+        fabric_colors = np.asarray(fabric_colors, dtype=float)
+        means = np.zeros(len(self))
+        fabric_of_edge = self.fabric_index[self.edge_index]
+        # options with the same number of edges share the pair pattern
+        for count in np.unique(self.counts):
+            if count < 2:
+                continue
+            options = np.nonzero(self.counts == count)[0]
+            first, second = np.triu_indices(count, k=1)
+            starts = self.offsets[options][:, None]
+            diffs = paired_color_distances(fabric_colors[fabric_of_edge[starts + first]],
+                                           fabric_colors[fabric_of_edge[starts + second]], metric)
+            means[options] = diffs.mean(axis=1)
+        return means
+
+    def fabric_stats(self, name):
+        """Per-fabric color statistic as an (F, 3) array: 'rgb' average color, 'hsv' average PIL HSV."""
+        if name == 'rgb':
+            return np.array([fabric.color for fabric in self.fabrics], dtype=float).reshape(-1, 3)
+        elif name == 'hsv':
+            return np.array([fabric.hsv_mean() for fabric in self.fabrics], dtype=float).reshape(-1, 3)
+        raise ValueError(f"Unknown fabric statistic: {name}")
+
+    def pareto_mask(self, objectives):
+        """
+        The options that are not dominated under the objectives together (see non_dominated_mask):
+        ParetoObjectives or OptionRanks, whose compute_ranks are lower for better options.
+        """
+        if len(self) == 0:
+            return np.zeros(0, dtype=bool)
+        return non_dominated_mask(np.column_stack([objective.compute_ranks(self) for objective in objectives]))
+
+    def option(self, i):
+        """PackingOption of the i-th option of the table."""
+        edge_subset = self.edge_subsets[i]
+        other_dims = self.other_dims[self.edge_index[self.offsets[i]:self.offsets[i + 1]]].tolist()
+        return PackingOption(self.rows[i].item(), edge_subset, other_dims, self.shortest_side[i].item(),
+                             self.total_area[i].item(), self.wasted_area[i].item(),
+                             shortest_side_px=self.shortest_side_px[i].item())
+
+    def options(self, order=None):
+        """PackingOptions of the table (in order, e.g. of a ranking)."""
+        return [self.option(i) for i in (range(len(self)) if order is None else order)]
@@ -0,0 +1,170 @@
+import copy
+import time
+from src.utils.solvers import CancelToken, collect_solutions, get_solver_backend, solution_signature, solve_subset_problems, solver_concurrency
+
+class SolveScheduler:
+    """
+    Spends one wall-clock budget (slo, in seconds) on the subset problems of all selected bins.
+
+    The bins are solved in rounds. The first round splits part of the budget by each bin's promise,
+    estimated from the number of reachable sums in its length window (presolve_problem). After
+    each round, bins that found nothing are hopeless and bins whose backend proved its solutions
+    best (or exhaustive) are finished; the rest of the budget goes to the bins that are still producing options,
+    warm-started from their own incumbents and weighted by how many options they found. Solving
+    stops as soon as max_options distinct options reach the target length: the solves of the round
+    that are still running are cancelled through the round's CancelToken. With a first_round_limit
+    the first round is short, so that a first answer is quick and the later rounds refine it.
+    A cancelled solve stops at once with what it has found (see CancelToken).
+
+    After solve, completed[i] tells whether the i-th bin was solved to completion: the backend
+    reported one of its solves as finished (see SolverBackend.solve_problem), without it being
+    cancelled. The results of the other bins are partial (see SolutionCache.put).
+
+    slo: wall-clock budget of one call to solve, in seconds
+    max_options: number of distinct options that is enough to stop early
+    first_round_share: fraction of the budget spent in the first round
+    max_time_limit: cap on the time limit of a single solve (e.g. config.solver_time_limits)
+    min_time_limit: rounds with less time left per bin than this are not started
+    first_round_limit: cap on the wall-clock length of the first round in seconds (optional)
+    """
+    def __init__(self, slo=20, max_options=20, first_round_share=0.5, max_time_limit=None, min_time_limit=0.5,
+                 first_round_limit=None):
+        self.slo = slo
+        self.max_options = max_options
+        self.first_round_share = first_round_share
+        self.max_time_limit = max_time_limit
+        self.min_time_limit = min_time_limit
+        self.first_round_limit = first_round_limit
+        self.completed = []
+
+    def promise(self, problem):
+        """Cheap estimate of how many options a bin can provide (before it was solved)."""
+        if problem.reachable_sums is None:
+            return 1
+        return max(1, min(problem.reachable_sums, problem.solution_limit))
+
+    def allocate(self, weights, budget, concurrency=1):
+        """
+        Split the solver time of a round between bins proportionally to their weights.
+
+        Args:
+            weights: {bin index: weight}
+            budget: wall-clock length of the round in seconds
+            concurrency: how many bins are solved at the same time
+
+        Returns:
+            {bin index: time limit in seconds}, no time limit is longer than the round
+        """
+        total = sum(weights.values())
+        time_limits = {}
+        for i, weight in weights.items():
+            time_limit = max(min(budget * concurrency * weight / total, budget), self.min_time_limit)
+            if self.max_time_limit is not None:
+                time_limit = min(time_limit, self.max_time_limit)
+            time_limits[i] = time_limit
+        return time_limits
+
+    def solve(self, problems, backend=None, suppress_output=True, on_progress=None, cancel_token=None):
+        """
+        Solve the problems of the selected bins within the time budget.
+
+        Args:
+            problems: list of SubsetProblem (one per bin)
+            backend: Solver backend name or instance, None or 'auto' for the first available one
+            suppress_output: Whether to suppress solver output
+            on_progress: called as on_progress(index, results, progress) whenever a bin found new
+                solutions, with the merged results of that bin so far and a progress dict (round,
+                bins_solved and bins of the round, solutions found, time_left in seconds) (optional)
+            cancel_token: CancelToken that stops the solve (optional)
+
+        Returns:
+            list with the merged backend results of each problem, in the same order
+        """
+        start_time = time.time()
+        solver = get_solver_backend(backend)
+        solution_sums = [{} for _ in problems]
+        solutions = [[] for _ in problems]
+        signatures = set()
+        active = list(range(len(problems)))
+        weights = {i: self.promise(problems[i]) for i in active}
+        self.completed = [False] * len(problems)
+        share = self.first_round_share
+        nrounds = 0
+        while len(active) > 0:
+            if cancel_token is not None and cancel_token.cancelled():
+                break
+            remaining = self.slo - (time.time() - start_time)
+            concurrency = solver_concurrency(len(active))
+            if remaining * concurrency / len(active) < self.min_time_limit:
+                break
+            budget = remaining * share
+            if nrounds == 0 and self.first_round_limit is not None:
+                budget = min(budget, self.first_round_limit)
+            time_limits = self.allocate({i: weights[i] for i in active}, budget, concurrency)
+            # stops the round once enough options are found, or when the whole solve is cancelled
+            round_token = CancelToken()
+            if cancel_token is not None:
+                cancel_token.on_cancel(round_token.cancel)
+            round_problems = []
+            for i in active:
+                round_problem = copy.copy(problems[i])
+                round_problem.time_limit = time_limits[i]
+                round_problem.cancel_token = round_token
+                # later rounds continue from the bin's own incumbents
+                round_problem.seeds = list(problems[i].seeds) + solutions[i]
+                round_problems.append(round_problem)
+            nfound = {}
+            finished = {}
+            round_bins = list(active)
+
+            def merge(k, bin_results, duration, bin_finished):
+                # keep the new solutions of the k-th bin of the round as soon as it is solved
+                i = round_bins[k]
+                nfound[i] = 0
+                # a cancelled solve returns early without having finished
+                finished[i] = bin_finished and not round_token.cancelled()
+                for best_sum, subsets in bin_results:
+                    for subset in subsets:
+                        subset = tuple(subset)
+                        if subset in solution_sums[i].get(best_sum, set()):
+                            continue
+                        solution_sums[i].setdefault(best_sum, set()).add(subset)
+                        solutions[i].append(subset)
+                        nfound[i] += 1
+                        if best_sum >= problems[i].target_L:
+                            signatures.add(solution_signature(problems[i], subset))
+                if len(signatures) >= self.max_options and not round_token.cancelled():
+                    round_token.cancel()
+                if on_progress is not None and nfound[i] > 0:
+                    on_progress(i, collect_solutions(solution_sums[i], problems[i].target_L), {
+                        'round': nrounds + 1,
+                        'bins_solved': len(nfound),
+                        'bins': len(round_bins),
+                        'solutions': sum(len(bin_solutions) for bin_solutions in solutions),
+                        'time_left': max(self.slo - (time.time() - start_time), 0),
+                    })
+
+            try:
+                solve_subset_problems(round_problems, solver, suppress_output=suppress_output, on_result=merge)
+            finally:
+                if cancel_token is not None:
+                    cancel_token.remove_callback(round_token.cancel)
+            nrounds += 1
+
+            next_active = []
+            for i in active:
+                hopeless = len(solutions[i]) == 0
+                if finished[i]:
+                    self.completed[i] = True
+                if not hopeless and not finished[i] and nfound[i] > 0:
+                    next_active.append(i)
+                    weights[i] = nfound[i]
+            if len(signatures) >= self.max_options:
+                break
+            active = next_active
+            share = 1.0
+
+        if not suppress_output:
+            cancelled = ' (cancelled)' if cancel_token is not None and cancel_token.cancelled() else ''
+            print(f"scheduler: {nrounds} rounds{cancelled}, {len(signatures)} distinct options in {time.time() - start_time:.2f}s")
+        return [collect_solutions(solution_sums[i], problems[i].target_L) for i in range(len(problems))]
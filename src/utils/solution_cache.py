@@ -0,0 +1,235 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from src.utils.solvers import collect_solutions
+
+# bump when the cached entries change so that caches on disk are dropped
+SOLUTION_CACHE_VERSION = 3
+SOLUTION_CACHE_NAME = '.solution_cache.json'
+
+def window_contains(outer, inner):
+    """
+    Whether every solution within the inner (thickness_min, thickness_max, fabric_count_min,
+    fabric_count_max) window is also within the outer one (None bounds are unbounded).
+    """
+    for i, (outer_bound, inner_bound) in enumerate(zip(outer, inner)):
+        if outer_bound is None:
+            continue
+        if inner_bound is None:
+            return False
+        if i % 2 == 0 and inner_bound < outer_bound:
+            return False
+        if i % 2 == 1 and inner_bound > outer_bound:
+            return False
+    return True
+
+def cache_key(problem, solver):
+    """Key of the results of problem: its content_key, the backend and the solver settings."""
+    return f"{solver.name}:{problem.solution_limit}:{problem.time_limit}:{problem.mip_gap}:{problem.content_key}"
+
+def _edge_key(key):
+    # JSON turns the (fabric id, is_e1) edge keys into lists
+    return tuple(key) if isinstance(key, list) else key
+
+def _json_value(value):
+    # numpy scalars in the windows
+    return value.item()
+
+class SolutionStore:
+    """
+    Solutions on disk, shared by all sessions that pack the same fabric folder (see for_folder).
+
+    entries: {cache_key: [entry]} with the entries of SolutionCache.put, the least recently stored
+    problems are dropped beyond max_entries. The file is plain JSON, so loading it runs no code.
+    """
+    _folder_stores = {}
+
+    def __init__(self, path=None, max_entries=2048):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.dirty = False
+        self.lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                if data.get('version') == SOLUTION_CACHE_VERSION:
+                    for key, entries in data['entries']:
+                        self.entries[key] = [dict(entry, window=tuple(entry['window']),
+                                                  solutions=[tuple(_edge_key(edge_key) for edge_key in solution)
+                                                             for solution in entry['solutions']])
+                                             for entry in entries]
+            except Exception as e:
+                print(f"Error loading solution store {path}: {e}")
+
+    @classmethod
+    def for_folder(cls, folder):
+        """The store of a fabric folder (None if the folder does not exist), shared by all callers in this process."""
+        if folder is None or not os.path.isdir(folder):
+            return None
+        folder = os.path.abspath(folder)
+        if folder not in cls._folder_stores:
+            cls._folder_stores[folder] = cls(os.path.join(folder, SOLUTION_CACHE_NAME))
+        return cls._folder_stores[folder]
+
+    def get(self, key):
+        with self.lock:
+            return [dict(entry) for entry in self.entries.get(key, [])]
+
+    def put(self, key, entries):
+        with self.lock:
+            self.entries[key] = [dict(entry) for entry in entries]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def save(self):
+        """Write the store to its path (if it changed)."""
+        with self.lock:
+            if self.path is None or not self.dirty:
+                return
+            try:
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump({'version': SOLUTION_CACHE_VERSION, 'entries': list(self.entries.items())}, f,
+                              default=_json_value)
+                os.replace(tmp_path, self.path)
+                self.dirty = False
+            except (OSError, TypeError, ValueError) as e:
+                print(f"Error saving solution store {self.path}: {e}")
+
+class SolutionCache:
+    """
+    Solver results of bin problems, so that re-ranking the options or narrowing the thickness and
+    fabric count windows does not solve the bins again.
+
+    A problem is identified by its cache_key (problem.content_key, i.e. its edges, target length and
+    group constraints, see SubsetProblem.fingerprint, plus the backend and the solver settings) and
+    each key keeps the results of a few windows. A lookup is answered by
+    - the complete results of the same window;
+    - the complete results of a wider window if they are exhaustive (the solve found fewer than
+      solution_limit options, so there are no others), or if they are the exact solution_limit best
+      options (see SolverBackend.exact) and at least min_solutions of them are left: every option of the
+      narrower window that is missing is then worse than the ones that are left, which are its best;
+    - the partial results (of a solve that ran out of time) of the same window if at least min_solutions
+      of them are feasible. Partial results answer once: the next lookup solves the bin again and the
+      new partial results are merged into them, until a solve completes.
+
+    The in-memory tier keeps the max_entries most recently used problems of a session; with a
+    SolutionStore the entries are also looked up in and written to disk.
+    """
+    def __init__(self, max_entries=128, store=None, max_windows=8, min_solutions=5):
+        self.max_entries = max_entries
+        self.store = store
+        self.max_windows = max_windows
+        self.min_solutions = min_solutions
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _entries(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        entries = self.store.get(key) if self.store is not None else []
+        if len(entries) > 0:
+            self._remember(key, entries)
+        return entries
+
+    def _remember(self, key, entries):
+        self.entries[key] = entries
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _store(self, key, entries):
+        self._remember(key, entries)
+        if self.store is not None:
+            self.store.put(key, entries)
+
+    def get(self, problem, solver):
+        """
+        Results of problem from the cache.
+
+        Args:
+            problem: SubsetProblem with a content_key (see FabricBin.subset_problem)
+            solver: the SolverBackend the problem would be solved with
+
+        Returns:
+            list of (sum, list of index tuples into problem) like the solver backends, or None if the
+            cache cannot answer
+        """
+        if problem.content_key is None:
+            return None
+        key = cache_key(problem, solver)
+        window = problem.window()
+        edge_index = {edge_key: i for i, edge_key in enumerate(problem.edge_keys)}
+        min_solutions = min(self.min_solutions, problem.solution_limit)
+        entries = self._entries(key)
+        # the same window first, then the wider windows with the most solutions
+        candidates = [entry for entry in entries if window_contains(entry['window'], window)]
+        candidates.sort(key=lambda entry: (entry['window'] != window, -len(entry['solutions'])))
+        for entry in candidates:
+            solution_sums = {}
+            for solution in entry['solutions']:
+                if not all(edge_key in edge_index for edge_key in solution):
+                    continue
+                indices = tuple(edge_index[edge_key] for edge_key in solution)
+                if problem.is_feasible(indices):
+                    solution_sums.setdefault(int(problem.lengths[list(indices)].sum()), set()).add(indices)
+            nfound = sum(len(subsets) for subsets in solution_sums.values())
+            if entry['window'] == window:
+                enough = entry['complete'] or (not entry['stale'] and nfound >= min_solutions)
+            else:
+                enough = entry['exhaustive'] or (entry['exact'] and nfound >= min_solutions)
+            if enough:
+                if not entry['complete']:
+                    entry['stale'] = True
+                    self._store(key, entries)
+                self.hits += 1
+                return collect_solutions(solution_sums, problem.target_L)
+        self.misses += 1
+        return None
+
+    def put(self, problem, results, solver, complete=True):
+        """
+        Keep the results of a solved problem (as edge keys, so that they survive presolve). Results
+        without solutions are not kept, the scheduler may have run out of time before solving the bin.
+
+        Args:
+            problem: the SubsetProblem
+            results: its backend results
+            solver: the SolverBackend that solved it
+            complete: whether the solve completed (see SolveScheduler.completed); partial results are
+                merged with the partial results of the same window that were kept before
+        """
+        solutions = [tuple(problem.edge_keys[i] for i in subset) for _, subsets in results for subset in subsets]
+        if problem.content_key is None or len(solutions) == 0:
+            return
+        key = cache_key(problem, solver)
+        window = problem.window()
+        entries = []
+        for entry in self._entries(key):
+            if entry['window'] != window:
+                entries.append(entry)
+            elif not complete and entry['complete']:
+                return
+            elif not complete:
+                solutions = list(dict.fromkeys(solutions + entry['solutions']))
+        # a grid solve is not exact at full resolution (see SolverBackend.solves_on_grid)
+        full_resolution = not solver.solves_on_grid(problem)
+        entry = {'window': window, 'solutions': solutions, 'complete': complete, 'stale': False,
+                 'exhaustive': complete and full_resolution and len(solutions) < problem.solution_limit,
+                 'exact': complete and full_resolution and solver.exact}
+        self._store(key, (entries + [entry])[-self.max_windows:])
+
+    def save(self):
+        """Write the new entries to the disk tier (if any)."""
+        if self.store is not None:
+            self.store.save()
+
+    def __len__(self):
+        return len(self.entries)
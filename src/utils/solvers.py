@@ -0,0 +1,1144 @@
+import copy
+import hashlib
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from scipy.sparse import coo_matrix
+from src.utils.subset_sum import group_items, find_best_subsets_sweep
+
+class SubsetProblem:
+    """
+    Compact array form of the strip selection problem of a FabricBin.
+
+    lengths: length of each candidate edge (what adds up to the target length)
+    other_dims: other dimension of each candidate edge (the strip thickness is their minimum)
+    groups: fabric id of each candidate edge, at most one edge per fabric can be selected
+    key: identifies the bin across iterations so that backends can reuse work (optional)
+    edge_keys: identifies each edge across iterations (defaults to its index)
+    counts: how many times each edge can be selected (defaults to once, see aggregate_problem)
+    group_limits: {group: how many edges of the group can be selected} (defaults to one per group)
+    group_mins: {group: how many edges of the group must be selected} (defaults to none, e.g. a required fabric)
+    min_counts: how many times each edge must be selected (defaults to zero, see presolve_problem)
+    source_indices: index of each edge in the problem this one was reduced from (defaults to its index)
+    seeds: known feasible solutions (index tuples, e.g. last iteration's options) to warm-start from
+    length_unit: solve on a grid of this many length units and re-check at full resolution (see quantize_problem)
+    reachable_sums: how many sums within the length window are reachable (set by presolve_problem)
+    content_key: fingerprint of the problem before presolve, without its windows (see fingerprint)
+    cancel_token: CancelToken that stops the solve early (optional, carried by the derived problems)
+    The remaining fields are the arguments of FabricBin.find_best_subsets.
+    """
+    def __init__(self, lengths, other_dims, groups, target_L, threshold, sa=0,
+                 thickness_min=None, thickness_max=None, fabric_count_min=None, fabric_count_max=None,
+                 solution_limit=20, time_limit=30, mip_gap=10, key=None, edge_keys=None,
+                 counts=None, group_limits=None, min_counts=None, source_indices=None, seeds=None,
+                 group_mins=None, length_unit=None):
+        self.lengths = np.rint(np.asarray(lengths)).astype(np.int64)
+        self.other_dims = np.rint(np.asarray(other_dims)).astype(np.int64)
+        self.groups = np.asarray(groups)
+        self.target_L = target_L
+        self.threshold = threshold
+        self.sa = sa
+        self.thickness_min = thickness_min
+        self.thickness_max = thickness_max
+        self.fabric_count_min = fabric_count_min
+        self.fabric_count_max = fabric_count_max
+        self.solution_limit = solution_limit
+        self.time_limit = time_limit
+        self.mip_gap = mip_gap
+        self.key = key
+        self.edge_keys = list(edge_keys) if edge_keys is not None else list(range(len(self.lengths)))
+        self.counts = np.asarray(counts, dtype=np.int64) if counts is not None else np.ones(len(self.lengths), dtype=np.int64)
+        self.group_limits = group_limits if group_limits is not None else {}
+        self.group_mins = group_mins if group_mins is not None else {}
+        self.length_unit = length_unit
+        self.min_counts = np.asarray(min_counts, dtype=np.int64) if min_counts is not None else np.zeros(len(self.lengths), dtype=np.int64)
+        self.source_indices = np.asarray(source_indices) if source_indices is not None else np.arange(len(self.lengths))
+        self.seeds = list(seeds) if seeds is not None else []
+        self.reachable_sums = None
+        self.content_key = None
+        self.cancel_token = None
+
+    def window(self):
+        """The thickness and fabric count bounds of the problem, see SolutionCache."""
+        return (self.thickness_min, self.thickness_max, self.fabric_count_min, self.fabric_count_max)
+
+    def fingerprint(self, *extra):
+        """
+        Hash of everything that defines the problem except its windows, the solver settings and the
+        seeds: the edges, the length window and the group constraints (plus any extra presolve arguments).
+        """
+        digest = hashlib.sha1()
+        for array in (self.lengths, self.other_dims, self.groups, self.counts, self.min_counts):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(repr((self.edge_keys, self.target_L, self.threshold, self.sa, self.length_unit,
+                            sorted(self.group_limits.items()), sorted(self.group_mins.items()), extra)).encode())
+        return digest.hexdigest()
+
+    def group_limit(self, group):
+        return self.group_limits.get(group, 1)
+
+    def group_min(self, group):
+        return self.group_mins.get(group, 0)
+
+    def required_groups(self):
+        return [group for group, group_min in self.group_mins.items() if group_min > 0]
+
+    def subset(self, indices):
+        """The same problem restricted to the edges at indices (seeds using other edges are dropped)."""
+        indices = np.asarray(indices, dtype=np.int64)
+        new_index = {int(i): k for k, i in enumerate(indices)}
+        seeds = [tuple(new_index[i] for i in seed) for seed in self.seeds if all(i in new_index for i in seed)]
+        problem = SubsetProblem(self.lengths[indices], self.other_dims[indices], self.groups[indices],
+                                self.target_L, self.threshold, sa=self.sa,
+                                thickness_min=self.thickness_min, thickness_max=self.thickness_max,
+                                fabric_count_min=self.fabric_count_min, fabric_count_max=self.fabric_count_max,
+                                solution_limit=self.solution_limit, time_limit=self.time_limit, mip_gap=self.mip_gap,
+                                key=self.key, edge_keys=[self.edge_keys[i] for i in indices],
+                                counts=self.counts[indices], group_limits=self.group_limits,
+                                min_counts=self.min_counts[indices], source_indices=self.source_indices[indices],
+                                seeds=seeds, group_mins=self.group_mins, length_unit=self.length_unit)
+        problem.content_key = self.content_key
+        problem.cancel_token = self.cancel_token
+        return problem
+
+    def is_feasible(self, solution):
+        """Whether an index tuple satisfies the length window, thickness, count and group (limit and minimum) constraints."""
+        indices = list(solution)
+        if len(indices) == 0:
+            return False
+        total = self.lengths[indices].sum()
+        if not self.target_L <= total <= self.target_L + self.threshold:
+            return False
+        thickness = self.other_dims[indices].min()
+        if self.thickness_min is not None and thickness < self.thickness_min:
+            return False
+        if self.thickness_max is not None and thickness > self.thickness_max:
+            return False
+        if self.fabric_count_min is not None and len(indices) < self.fabric_count_min:
+            return False
+        if self.fabric_count_max is not None and len(indices) > self.fabric_count_max:
+            return False
+        if (np.bincount(indices, minlength=len(self)) > self.counts).any():
+            return False
+        groups, group_counts = np.unique(self.groups[indices], return_counts=True)
+        selected = dict(zip(groups.tolist(), group_counts.tolist()))
+        if any(selected.get(group, 0) < self.group_min(group) for group in self.required_groups()):
+            return False
+        return all(count <= self.group_limit(group) for group, count in selected.items())
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __repr__(self):
+        return f"SubsetProblem({len(self)} edges, target {self.target_L} + {self.threshold})"
+
+def collect_solutions(solution_sums, target_L):
+    """Turn {sum: set of index tuples} into the sorted [(sum, subsets)] list returned by the backends."""
+    if len(solution_sums) == 0:
+        return [(0, [])]
+    return [(best_sum, list(solution_sums[best_sum]))
+            for best_sum in sorted(solution_sums.keys(), key=lambda x: abs(target_L - x))]
+
+def solution_objective(problem, solution):
+    """
+    Wasted area objective of find_best_subsets up to the constant of the target length,
+    sum_i (other_dim_i - 2 * sa) * length_i - target_L * thickness (see build_linear_model).
+    """
+    indices = list(solution)
+    return float(((problem.other_dims[indices] - 2 * problem.sa) * problem.lengths[indices]).sum()
+                 - problem.target_L * problem.other_dims[indices].min())
+
+def solution_signature(problem, solution):
+    """
+    What makes two solutions different options: the strip thickness and the set of edge lengths
+    (the duplicate check of next_packing_options).
+    """
+    indices = list(solution)
+    return (int(problem.other_dims[indices].min()), frozenset(problem.lengths[indices].tolist()))
+
+def presolve_problem(problem, min_length=None, suppress_output=True):
+    """
+    Cheap reductions of a problem with one edge per fabric before any model is built.
+
+    Drops edges that cannot be part of any strip (longer than target_L + threshold, thinner than
+    thickness_min or shorter than min_length), proves infeasibility from the thickness window, the
+    fabric count bounds, the required fabrics (group_mins) and the reachable sums, and fixes the edges
+    that every strip needs: a fabric is forced when the others cannot reach target_L even with their
+    longest edges, and of a forced fabric only the edges that still allow reaching target_L are kept.
+    A required fabric with a single usable edge fixes that edge.
+
+    Args:
+        problem: SubsetProblem
+        min_length: edges shorter than this are scraps that are not used (optional)
+        suppress_output: Whether to suppress the presolve summary
+
+    Returns:
+        the reduced SubsetProblem (see source_indices), or None if no strip can be made
+    """
+    target_L = problem.target_L
+    capacity = int(target_L + problem.threshold)
+    keep = problem.lengths <= capacity
+    if problem.thickness_min is not None:
+        keep &= problem.other_dims >= problem.thickness_min
+    if min_length is not None:
+        keep &= problem.lengths >= min_length
+    reduced = problem.subset(np.flatnonzero(keep))
+
+    def infeasible(reason):
+        if not suppress_output:
+            print(f"presolve: {reason}")
+        return None
+
+    if len(reduced) == 0:
+        return infeasible("no usable edges")
+    if problem.thickness_max is not None and not (reduced.other_dims <= problem.thickness_max).any():
+        return infeasible("no edge within the thickness window")
+
+    required = set(problem.required_groups())
+    if not required <= set(reduced.groups.tolist()):
+        return infeasible("a required fabric has no usable edge")
+    if problem.fabric_count_max is not None and len(required) > problem.fabric_count_max:
+        return infeasible("more required fabrics than allowed")
+
+    item_groups = group_items(reduced.groups)
+    longest = np.array([reduced.lengths[items].max() for items in item_groups])
+    total = longest.sum()
+    if total < target_L:
+        return infeasible("edges too short for the target length")
+    if problem.fabric_count_min is not None and len(item_groups) < problem.fabric_count_min:
+        return infeasible("not enough fabrics")
+    if problem.fabric_count_max is not None and np.sort(longest)[::-1][:problem.fabric_count_max].sum() < target_L:
+        return infeasible("too few fabrics allowed for the target length")
+
+    # forced fabrics and their dominated edges
+    drop = np.zeros(len(reduced), dtype=bool)
+    for g, items in enumerate(item_groups):
+        rest = total - longest[g]
+        if rest >= target_L:
+            continue
+        viable = [i for i in items if rest + reduced.lengths[i] >= target_L]
+        drop[[i for i in items if i not in viable]] = True
+        if len(viable) == 1:
+            reduced.min_counts[viable[0]] = 1
+    if drop.any():
+        reduced = reduced.subset(np.flatnonzero(~drop))
+        item_groups = group_items(reduced.groups)
+    for items in item_groups:
+        if len(items) == 1 and reduced.groups[items[0]].item() in required:
+            reduced.min_counts[items[0]] = 1
+
+    # some sum within [target_L, target_L + threshold] has to be reachable
+    reachable = np.zeros(capacity + 1, dtype=bool)
+    reachable[0] = True
+    for items in item_groups:
+        prev = reachable.copy()
+        if reduced.groups[items[0]].item() in required:
+            # a required fabric cannot be skipped
+            reachable[:] = False
+        for i in items:
+            length = reduced.lengths[i]
+            if length > 0:
+                reachable[length:] |= prev[:-length]
+    reduced.reachable_sums = int(np.count_nonzero(reachable[max(int(target_L), 0):]))
+    if reduced.reachable_sums == 0:
+        return infeasible("target length window is not reachable")
+
+    if not suppress_output:
+        print(f"presolve: kept {len(reduced)} of {len(problem)} edges, fixed {int(reduced.min_counts.sum())}")
+    return reduced
+
+def quantize_problem(problem, unit):
+    """
+    The same problem on a grid of unit length units, so that sums and DP tables shrink by that factor.
+
+    Lengths and other dimensions are rounded to the nearest grid point, so the rounding error of a
+    strip's length sum is about sqrt(k) / 2 units for a typical strip of k edges (target_L over the
+    median length). The length window is shrunk by that much on both sides (as far as it stays
+    open) to make the grid solutions likely to fit the window at full resolution, and the thickness
+    bounds are rounded outwards. The solutions still have to be checked against the original
+    problem (see refine_solutions), so four times as many are asked for.
+
+    Returns:
+        SubsetProblem over the same edges (same indices), without length_unit
+    """
+    lengths = np.maximum(np.rint(problem.lengths / unit), 1)
+    other_dims = np.maximum(np.rint(problem.other_dims / unit), 1)
+    median_length = float(np.median(problem.lengths)) if len(problem) > 0 else unit
+    nedges = max(problem.target_L / max(median_length, 1), 1)
+    lower = int(np.ceil(problem.target_L / unit))
+    upper = int(np.floor((problem.target_L + problem.threshold) / unit))
+    margin = max(min(int(np.ceil(np.sqrt(nedges) / 2)), (upper - lower) // 2), 0)
+    target_L, upper = lower + margin, upper - margin
+    if upper < target_L:
+        # the window is narrower than a grid unit
+        target_L = upper = int(np.rint((problem.target_L + problem.threshold / 2) / unit))
+    quantized = SubsetProblem(lengths, other_dims, problem.groups, target_L, upper - target_L, sa=problem.sa / unit,
+                              thickness_min=int(np.floor(problem.thickness_min / unit)) if problem.thickness_min is not None else None,
+                              thickness_max=int(np.ceil(problem.thickness_max / unit)) if problem.thickness_max is not None else None,
+                              fabric_count_min=problem.fabric_count_min, fabric_count_max=problem.fabric_count_max,
+                              solution_limit=4 * problem.solution_limit, time_limit=problem.time_limit,
+                              mip_gap=problem.mip_gap, key=(problem.key, unit) if problem.key is not None else None,
+                              edge_keys=problem.edge_keys, counts=problem.counts, group_limits=problem.group_limits,
+                              min_counts=problem.min_counts, source_indices=problem.source_indices,
+                              group_mins=problem.group_mins)
+    quantized.seeds = [seed for seed in problem.seeds if quantized.is_feasible(seed)]
+    quantized.cancel_token = problem.cancel_token
+    return quantized
+
+def refine_solutions(problem, results):
+    """
+    Re-check solutions of the quantized problem at full resolution: drop the ones that are infeasible
+    and duplicate options, and keep the solution_limit best by the exact objective.
+    """
+    scored = {}
+    for _, solutions in results:
+        for solution in solutions:
+            solution = tuple(sorted(solution))
+            if not problem.is_feasible(solution):
+                continue
+            signature = solution_signature(problem, solution)
+            objective = solution_objective(problem, solution)
+            if signature not in scored or objective < scored[signature][0]:
+                scored[signature] = (objective, solution)
+    solution_sums = {}
+    for objective, solution in sorted(scored.values())[:problem.solution_limit]:
+        solution_sums.setdefault(int(problem.lengths[list(solution)].sum()), set()).add(solution)
+    return collect_solutions(solution_sums, problem.target_L)
+
+def aggregate_problem(problem):
+    """
+    Merge interchangeable edges into equivalence classes so that the MIP does not explore
+    permutations of fabrics with identical dimensions.
+
+    Fabrics (groups) whose edges have the same (length, other_dim) pairs and group_min are of the same
+    type. Every distinct (length, other_dim) of a type becomes one class that can be selected up to
+    the number of fabrics of that type, and the classes of a type share that limit (and the sum of
+    the group_mins of its fabrics as minimum).
+
+    Returns:
+        (aggregated SubsetProblem, members) where members[c] lists, for every fabric of the type
+        of class c in increasing fabric id order, the index of its edge in class c
+    """
+    edges_by_group = {}
+    for i, group in enumerate(problem.groups.tolist()):
+        edges_by_group.setdefault(group, []).append(i)
+    types = {}
+    for group in sorted(edges_by_group.keys()):
+        dims = tuple(sorted((int(problem.lengths[i]), int(problem.other_dims[i])) for i in edges_by_group[group]))
+        types.setdefault((dims, problem.group_min(group)), []).append(group)
+
+    lengths, other_dims, groups, counts, min_counts, edge_keys, members = [], [], [], [], [], [], []
+    group_limits = {}
+    group_mins = {}
+    for (dims, group_min), type_groups in types.items():
+        # hash of the type so that the group of a class is stable across iterations
+        type_id = hash((dims, group_min))
+        group_limits[type_id] = len(type_groups)
+        if group_min > 0:
+            group_mins[type_id] = group_min * len(type_groups)
+        for length, other_dim in sorted(set(dims)):
+            lengths.append(length)
+            other_dims.append(other_dim)
+            groups.append(type_id)
+            counts.append(len(type_groups))
+            edge_keys.append((dims, group_min, length, other_dim))
+            members.append([next(i for i in edges_by_group[group]
+                                 if (problem.lengths[i], problem.other_dims[i]) == (length, other_dim))
+                            for group in type_groups])
+            min_counts.append(int(problem.min_counts[members[-1]].sum()))
+    class_of_dims = {(groups[c], lengths[c], other_dims[c]): c for c in range(len(lengths))}
+    type_of_group = {group: hash(type_key) for type_key, type_groups in types.items() for group in type_groups}
+    class_of = [class_of_dims[(type_of_group[group], int(problem.lengths[i]), int(problem.other_dims[i]))]
+                for i, group in enumerate(problem.groups.tolist())]
+    seeds = [tuple(sorted(class_of[i] for i in seed)) for seed in problem.seeds]
+    aggregated = SubsetProblem(lengths, other_dims, groups, problem.target_L, problem.threshold, sa=problem.sa,
+                               thickness_min=problem.thickness_min, thickness_max=problem.thickness_max,
+                               fabric_count_min=problem.fabric_count_min, fabric_count_max=problem.fabric_count_max,
+                               solution_limit=problem.solution_limit, time_limit=problem.time_limit,
+                               mip_gap=problem.mip_gap, key=problem.key, edge_keys=edge_keys,
+                               counts=counts, group_limits=group_limits, min_counts=min_counts, seeds=seeds,
+                               group_mins=group_mins)
+    aggregated.cancel_token = problem.cancel_token
+    return aggregated, members
+
+def expand_solution(aggregated, members, solution):
+    """
+    Turn a solution over classes (class indices, repeated by multiplicity) into edge indices.
+    Fabrics are picked deterministically: the lowest fabric ids of a type go to its classes in order.
+    """
+    used_fabrics = {}
+    edges = []
+    for c in sorted(solution):
+        type_id = aggregated.groups[c].item()
+        k = used_fabrics.get(type_id, 0)
+        edges.append(members[c][k])
+        used_fabrics[type_id] = k + 1
+    return tuple(sorted(edges))
+
+def build_linear_model(problem):
+    """
+    Linear MIP formulation of the strip selection problem used by the HiGHS backend
+    (GurobiModel builds the same formulation edge by edge).
+
+    Variables are [x (n integers, how many times an edge is selected), t (thickness),
+    u (binaries, whether an edge with counts > 1 is used)]. Edges that can only be selected once
+    are their own used indicator. For a selected subset with sum s >= target_L the wasted area
+    objective of find_best_subsets,
+        sum_i (other_dim_i - 2 * sa - t) * length_i * x_i + |s - target_L| * t,
+    simplifies to sum_i (other_dim_i - 2 * sa) * length_i * x_i - target_L * t, which is linear.
+    t <= other_dim_i + (max_other_dim - other_dim_i) * (1 - used_i) keeps t below every selected edge
+    and the -target_L * t term pushes it up to the thinnest one, so no pairwise constraints are
+    needed. thickness_max is enforced by selecting at least one edge that is thin enough.
+
+    Returns:
+        dict with objective c, constraint matrix A (scipy sparse), row bounds (row_lb, row_ub),
+        variable bounds (lb, ub), integrality flags, n and used (column of each edge's used indicator)
+    """
+    n = len(problem)
+    lengths = problem.lengths.astype(float)
+    other_dims = problem.other_dims.astype(float)
+    max_other_dim = float(other_dims.max()) if n > 0 else 0.0
+    t_index = n
+    used = [i if problem.counts[i] == 1 else None for i in range(n)]
+    nvars = n + 1
+    for i in range(n):
+        if used[i] is None:
+            used[i] = nvars
+            nvars += 1
+    rows, cols, vals, row_lb, row_ub = [], [], [], [], []
+
+    def add_row(indices, coefs, lb, ub):
+        r = len(row_lb)
+        rows.extend([r] * len(indices))
+        cols.extend(indices)
+        vals.extend(coefs)
+        row_lb.append(lb)
+        row_ub.append(ub)
+
+    # 1. total length within [target_L, target_L + threshold]
+    add_row(list(range(n)), list(lengths), problem.target_L, problem.target_L + problem.threshold)
+    # 2. at most one edge per fabric (and at least one of a required fabric)
+    for g in np.unique(problem.groups):
+        members = np.flatnonzero(problem.groups == g)
+        limit = problem.group_limit(g.item())
+        group_min = problem.group_min(g.item())
+        if problem.counts[members].sum() > limit or group_min > 0:
+            add_row(list(members), [1.0] * len(members), group_min if group_min > 0 else -np.inf, limit)
+    # 3. used indicators of edges that can be selected several times
+    for i in range(n):
+        if used[i] != i:
+            add_row([i, used[i]], [1.0, -float(problem.counts[i])], -np.inf, 0)
+            add_row([used[i], i], [1.0, -1.0], -np.inf, 0)
+    # 4. t is below every selected edge
+    for i in range(n):
+        add_row([t_index, used[i]], [1.0, max_other_dim - other_dims[i]], -np.inf, max_other_dim)
+    # 5. the thinnest selected edge is within thickness_max
+    if problem.thickness_max is not None:
+        thin = list(np.flatnonzero(other_dims <= problem.thickness_max))
+        add_row(thin, [1.0] * len(thin), 1, np.inf)
+    # 6. fabric count
+    if problem.fabric_count_min is not None or problem.fabric_count_max is not None:
+        add_row(list(range(n)), [1.0] * n,
+                problem.fabric_count_min if problem.fabric_count_min is not None else -np.inf,
+                problem.fabric_count_max if problem.fabric_count_max is not None else np.inf)
+
+    c = np.zeros(nvars)
+    c[:n] = (other_dims - 2 * problem.sa) * lengths
+    c[t_index] = -problem.target_L
+    lb = np.zeros(nvars)
+    ub = np.ones(nvars)
+    ub[:n] = problem.counts
+    lb[:n] = problem.min_counts
+    lb[t_index] = other_dims.min() if n > 0 else 0
+    ub[t_index] = max_other_dim
+    if problem.thickness_min is not None:
+        lb[t_index] = max(lb[t_index], problem.thickness_min)
+    ub[t_index] = max(ub[t_index], lb[t_index])
+    integrality = np.ones(nvars)
+    integrality[t_index] = 0
+    A = coo_matrix((vals, (rows, cols)), shape=(len(row_lb), nvars)).tocsr()
+    return {'c': c, 'A': A, 'row_lb': np.array(row_lb, dtype=float), 'row_ub': np.array(row_ub, dtype=float),
+            'lb': lb, 'ub': ub, 'integrality': integrality, 'n': n, 'used': used}
+
+# cancellation flags shared with the solver worker processes (see CancelToken and get_solver_pool)
+CANCEL_SLOTS = 4096
+_cancel_flags = multiprocessing.RawArray('q', CANCEL_SLOTS)
+_cancel_ids = itertools.count(1)
+
+def _init_solver_worker(cancel_flags):
+    global _cancel_flags
+    _cancel_flags = cancel_flags
+
+class CancelToken:
+    """
+    Stops a solve early, e.g. when a newer request supersedes it (see src/utils/jobs.py).
+
+    The flag lives in shared memory, so that problems pickled to the solver worker processes still see
+    it: token ids are handed out in order and a token is cancelled while its slot holds its id (slots
+    are reused after CANCEL_SLOTS tokens, long after their solves are over). The backends check it
+    between solver calls and candidate thicknesses, and a running Gurobi model is terminated through
+    a callback (see on_cancel).
+    """
+    def __init__(self):
+        self.id = next(_cancel_ids)
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        _cancel_flags[self.id % CANCEL_SLOTS] = self.id
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def cancelled(self):
+        return _cancel_flags[self.id % CANCEL_SLOTS] == self.id
+
+    def on_cancel(self, callback):
+        """Call callback when the token is cancelled (right away if it already is), in this process only."""
+        with self._lock:
+            self._callbacks.append(callback)
+        if self.cancelled():
+            callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def __getstate__(self):
+        # the callbacks belong to the process that registered them
+        return {'id': self.id}
+
+    def __setstate__(self, state):
+        self.id = state['id']
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"CancelToken({self.id}{', cancelled' if self.cancelled() else ''})"
+
+def is_cancelled(problem):
+    return problem.cancel_token is not None and problem.cancel_token.cancelled()
+
+class SolverBackend:
+    """
+    Base class of the strip selection solvers FabricBin dispatches through.
+
+    Subclasses implement probe() (checked once per process) and solve_problem(problem), which returns
+    (results, finished): results is a list of (sum, list of index tuples into the problem's edges), or
+    [(0, [])] if nothing was found, and finished whether the solver proved that these are the best
+    solutions (or all of them) rather than stopping at its time limit or being cancelled. Index tuples
+    repeat an edge that is selected several times (see SubsetProblem.counts).
+    parallel says whether several bins are solved in worker processes or threads, and aggregates
+    whether the backend solves over the equivalence classes of aggregate_problem. quantizes says
+    whether the backend's work grows with the lengths (DP tables), so that problems with a
+    length_unit are solved on that grid and refined at full resolution; the MIP backends ignore it.
+    exact says whether a finished solve returns the solution_limit best options by the wasted area
+    objective (see solution_objective) rather than good ones within a loose MIP gap.
+    """
+    name = None
+    parallel = 'process'
+    aggregates = False
+    quantizes = False
+    exact = False
+
+    def __init__(self):
+        self._available = None
+
+    def __repr__(self):
+        return f"SolverBackend({self.name})"
+
+    def probe(self):
+        return True
+
+    def is_available(self):
+        if self._available is None:
+            self._available = self.probe()
+        return self._available
+
+    def solves_on_grid(self, problem):
+        """Whether problem is solved on the grid of its length_unit (see solve_with_status)."""
+        return self.quantizes and problem.length_unit is not None and problem.length_unit > 1
+
+    def solve(self, problem, suppress_output=True):
+        """The results of solve_with_status."""
+        return self.solve_with_status(problem, suppress_output=suppress_output)[0]
+
+    def solve_with_status(self, problem, suppress_output=True):
+        """
+        Solve problem (on the grid of its length_unit if the backend quantizes).
+
+        Returns:
+            (results, finished), see solve_problem; a grid solve is finished when it is on the grid
+        """
+        if is_cancelled(problem):
+            return [(0, [])], False
+        if not self.solves_on_grid(problem):
+            return self.solve_aggregated(problem, suppress_output=suppress_output)
+        start_time = time.time()
+        quantized = quantize_problem(problem, problem.length_unit)
+        if not suppress_output:
+            print(f"quantized lengths to a grid of {problem.length_unit}: target {quantized.target_L} + {quantized.threshold}")
+        grid_results, finished = self.solve_aggregated(quantized, suppress_output=suppress_output)
+        results = refine_solutions(problem, grid_results)
+        if results == [(0, [])] and not is_cancelled(problem):
+            # the fallback only gets the time the grid solve left over
+            fallback = copy.copy(problem)
+            if problem.time_limit is not None:
+                fallback.time_limit = problem.time_limit - (time.time() - start_time)
+                if fallback.time_limit <= 0:
+                    if not suppress_output:
+                        print("no grid solution fits at full resolution and no time is left to solve without the grid")
+                    return results, False
+            if not suppress_output:
+                print("no grid solution fits at full resolution, solving without the grid")
+            return self.solve_aggregated(fallback, suppress_output=suppress_output)
+        return results, finished
+
+    def solve_aggregated(self, problem, suppress_output=True):
+        if not self.aggregates:
+            return self.solve_problem(problem, suppress_output=suppress_output)
+        aggregated, members = aggregate_problem(problem)
+        if not suppress_output:
+            print(f"aggregated {len(problem)} edges into {len(aggregated)} classes")
+        results, finished = self.solve_problem(aggregated, suppress_output=suppress_output)
+        if results == [(0, [])]:
+            return results, finished
+        return [(best_sum, [expand_solution(aggregated, members, solution) for solution in solutions])
+                for best_sum, solutions in results], finished
+
+    def solve_problem(self, problem, suppress_output=True):
+        pass
+
+class GurobiModel:
+    """
+    Gurobi model of one bin's problem that is kept between iterations and updated in place.
+
+    It is the formulation of build_linear_model, built edge by edge so that edges can be added and
+    removed when fabrics are trimmed or removed. Edges are identified by their key in the problem
+    (fabric id and edge side, or the class of aggregate_problem) and re-added when their length,
+    other dimension or count changed.
+    max_other_dim is the big-M of the thickness constraints and fixed for the life of the model.
+    """
+    def __init__(self, env, max_other_dim):
+        import gurobipy as gp
+        from gurobipy import GRB
+
+        self.max_other_dim = max_other_dim
+        self.model = gp.Model("edge_selection", env=env)
+        m = self.model
+        self.t = m.addVar(name="min_thickness", lb=0, ub=max_other_dim)
+        self.length_lb = m.addLConstr(gp.LinExpr(), GRB.GREATER_EQUAL, 0, name="length_lb")
+        self.length_ub = m.addLConstr(gp.LinExpr(), GRB.LESS_EQUAL, 0, name="length_ub")
+        self.count_lb = m.addLConstr(gp.LinExpr(), GRB.GREATER_EQUAL, 0, name="count_lb")
+        self.count_ub = m.addLConstr(gp.LinExpr(), GRB.LESS_EQUAL, 0, name="count_ub")
+        # at least one selected edge within thickness_max (inactive while thickness_max is None)
+        self.thin = m.addLConstr(gp.LinExpr(), GRB.GREATER_EQUAL, 0, name="thin")
+        self.thickness_max = None
+        self.edges = {}  # edge key -> (length, other_dim, group, count, x, used, constraints)
+        self.groups = {}  # group -> (constraint, number of edges)
+        self.group_mins = {}  # group -> minimum constraint, only for groups that were ever required
+        m.ModelSense = GRB.MINIMIZE
+
+    def is_thin(self, other_dim):
+        return self.thickness_max is not None and other_dim <= self.thickness_max
+
+    def add_edge(self, key, length, other_dim, group, count):
+        import gurobipy as gp
+        from gurobipy import GRB
+
+        m = self.model
+        constrs = []
+        if count == 1:
+            x = m.addVar(vtype=GRB.BINARY, name=f"edge_{key}")
+            used = x
+            m.update()
+        else:
+            x = m.addVar(vtype=GRB.INTEGER, lb=0, ub=count, name=f"edge_{key}")
+            used = m.addVar(vtype=GRB.BINARY, name=f"used_{key}")
+            m.update()
+            constrs.append(m.addLConstr(gp.LinExpr([1.0, -float(count)], [x, used]), GRB.LESS_EQUAL, 0))
+            constrs.append(m.addLConstr(gp.LinExpr([1.0, -1.0], [used, x]), GRB.LESS_EQUAL, 0))
+        constrs.append(m.addLConstr(gp.LinExpr([1.0, float(self.max_other_dim - other_dim)], [self.t, used]),
+                                    GRB.LESS_EQUAL, float(self.max_other_dim)))
+        for c in [self.length_lb, self.length_ub]:
+            m.chgCoeff(c, x, float(length))
+        for c in [self.count_lb, self.count_ub]:
+            m.chgCoeff(c, x, 1.0)
+        if self.is_thin(other_dim):
+            m.chgCoeff(self.thin, x, 1.0)
+        if group in self.groups:
+            group_constr, nedges = self.groups[group]
+            m.chgCoeff(group_constr, x, 1.0)
+            self.groups[group] = (group_constr, nedges + 1)
+        else:
+            self.groups[group] = (m.addLConstr(gp.LinExpr([1.0], [x]), GRB.LESS_EQUAL, 1), 1)
+        if group in self.group_mins:
+            m.chgCoeff(self.group_mins[group], x, 1.0)
+        self.edges[key] = (length, other_dim, group, count, x, used, constrs)
+
+    def remove_edge(self, key):
+        length, other_dim, group, count, x, used, constrs = self.edges.pop(key)
+        self.model.remove(list({x, used}) + constrs)
+        group_constr, nedges = self.groups[group]
+        if nedges == 1:
+            self.model.remove(group_constr)
+            del self.groups[group]
+            if group in self.group_mins:
+                self.model.remove(self.group_mins.pop(group))
+        else:
+            self.groups[group] = (group_constr, nedges - 1)
+
+    def update(self, problem):
+        """
+        Bring the model up to date with the problem: edges, right-hand sides, bounds and objective.
+
+        Returns:
+            (edge variables, used indicators) in the order of the problem's edges, or None if the
+            model cannot represent the problem and has to be rebuilt
+        """
+        import gurobipy as gp
+        from gurobipy import GRB
+
+        if len(problem) > 0 and problem.other_dims.max() > self.max_other_dim:
+            return None
+        current = {}
+        for i, key in enumerate(problem.edge_keys):
+            current[key] = (int(problem.lengths[i]), int(problem.other_dims[i]), problem.groups[i].item(),
+                            int(problem.counts[i]))
+        for key in list(self.edges.keys()):
+            if key not in current or self.edges[key][:4] != current[key]:
+                self.remove_edge(key)
+        if problem.thickness_max != self.thickness_max:
+            self.thickness_max = problem.thickness_max
+            for length, other_dim, group, count, x, used, constrs in self.edges.values():
+                self.model.chgCoeff(self.thin, x, 1.0 if self.is_thin(other_dim) else 0.0)
+        for key, (length, other_dim, group, count) in current.items():
+            if key not in self.edges:
+                self.add_edge(key, length, other_dim, group, count)
+
+        for group, (group_constr, nedges) in self.groups.items():
+            group_constr.RHS = problem.group_limit(group)
+            group_min = problem.group_min(group)
+            if group in self.group_mins:
+                self.group_mins[group].RHS = group_min
+            elif group_min > 0:
+                xs = [edge[4] for edge in self.edges.values() if edge[2] == group]
+                self.group_mins[group] = self.model.addLConstr(gp.LinExpr([1.0] * len(xs), xs), GRB.GREATER_EQUAL, group_min)
+        self.length_lb.RHS = problem.target_L
+        self.length_ub.RHS = problem.target_L + problem.threshold
+        self.count_lb.RHS = problem.fabric_count_min if problem.fabric_count_min is not None else 0
+        self.count_ub.RHS = problem.fabric_count_max if problem.fabric_count_max is not None else int(problem.counts.sum())
+        self.thin.RHS = 1 if problem.thickness_max is not None else 0
+        t_lb = problem.other_dims.min() if len(problem) > 0 else 0
+        if problem.thickness_min is not None:
+            t_lb = max(t_lb, problem.thickness_min)
+        self.t.LB = t_lb
+        self.t.UB = max(t_lb, self.max_other_dim)
+        edge_vars = [self.edges[key][4] for key in problem.edge_keys]
+        used_vars = [self.edges[key][5] for key in problem.edge_keys]
+        self.model.setAttr("LB", edge_vars, problem.min_counts.tolist())
+        self.model.setAttr("Obj", edge_vars, list((problem.other_dims - 2 * problem.sa) * problem.lengths))
+        self.t.Obj = -problem.target_L
+        self.model.update()
+        return edge_vars, used_vars
+
+    def dispose(self):
+        self.model.dispose()
+
+class GurobiBackend(SolverBackend):
+    """
+    Gurobi MIP backend. Gurobi environments are not thread-safe, so each solver thread has its own
+    environment and keeps the models of the last max_cached_models bins it solved (keyed by
+    SubsetProblem.key), so that later iterations only update them. Bins are solved on threads
+    instead of processes so that the models survive between iterations, and solve_subset_problems
+    always solves a bin on the same thread (see solver_lane) so that it finds its model again.
+    Several options come from Gurobi's solution pool (PoolSearchMode 2) rather than a callback.
+    """
+    name = 'gurobi'
+    parallel = 'thread'
+    aggregates = True
+    exact = True
+    max_cached_models = 32
+
+    def __init__(self):
+        super().__init__()
+        self.local = threading.local()
+
+    def probe(self):
+        # uncomment to disable gurobi
+        # return False
+        try:
+            import gurobipy as gp
+            # Create a test model in an environment of its own, the solver threads start theirs
+            env = gp.Env(empty=True)
+            env.setParam("OutputFlag", 0)
+            env.start()
+            m = gp.Model("test", env=env)
+            m.addVar(name="x")
+            m.update()
+            m.dispose()
+            env.dispose()
+            return True
+        except Exception:
+            return False
+
+    def get_env(self):
+        """The environment of the calling thread."""
+        env = getattr(self.local, 'env', None)
+        if env is None:
+            import gurobipy as gp
+            env = gp.Env(empty=True)
+            env.setParam("OutputFlag", 0)
+            env.start()
+            self.local.env = env
+        return env
+
+    def get_models(self):
+        """The model cache of the calling thread."""
+        if not hasattr(self.local, 'models'):
+            self.local.models = OrderedDict()
+        return self.local.models
+
+    def get_model(self, problem):
+        """Cached model of this thread for problem.key (updated to the problem), or a new one."""
+        max_other_dim = int(problem.other_dims.max()) if len(problem) > 0 else 0
+        if problem.key is None:
+            gurobi_model = GurobiModel(self.get_env(), max_other_dim)
+            return gurobi_model, gurobi_model.update(problem)
+        models = self.get_models()
+        gurobi_model = models.pop(problem.key, None)
+        if gurobi_model is None:
+            gurobi_model = GurobiModel(self.get_env(), max_other_dim)
+        models[problem.key] = gurobi_model
+        while len(models) > self.max_cached_models:
+            _, evicted = models.popitem(last=False)
+            evicted.dispose()
+        model_vars = gurobi_model.update(problem)
+        if model_vars is None:
+            # an edge is thicker than the big-M of the cached model
+            gurobi_model.dispose()
+            gurobi_model = GurobiModel(self.get_env(), max_other_dim)
+            models[problem.key] = gurobi_model
+            model_vars = gurobi_model.update(problem)
+        return gurobi_model, model_vars
+
+    def solve_problem(self, problem, suppress_output=True):
+        import gurobipy as gp
+        from gurobipy import GRB
+
+        start_time = time.time()
+        gurobi_model, (edge_vars, used_vars) = self.get_model(problem)
+        solution_sums = {}
+        signatures = set()
+        nogoods = []
+        finished = False
+        m = gurobi_model.model
+        try:
+            # a cancelled solve interrupts optimize
+            if problem.cancel_token is not None:
+                problem.cancel_token.on_cancel(m.terminate)
+            m.Params.OutputFlag = 0 if suppress_output else 1
+            # let the solver keep the solution_limit best distinct subsets in its own pool; in this mode
+            # MIPGap applies to the worst solution of the pool, so the loose mip_gap meant for a single
+            # solution would stop with an arbitrary pool (the time limit and PoolSolutions end the search)
+            m.Params.PoolSearchMode = 2
+            m.Params.MIPGap = 1e-4
+            # previous options that are still feasible are MIP starts
+            m.NumStart = len(problem.seeds)
+            for k, seed in enumerate(problem.seeds):
+                m.Params.StartNumber = k
+                counts = np.bincount(list(seed), minlength=len(edge_vars))
+                m.setAttr("Start", used_vars, (counts > 0).astype(float).tolist())
+                m.setAttr("Start", edge_vars, counts.astype(float).tolist())
+                gurobi_model.t.Start = float(problem.other_dims[list(seed)].min())
+            while len(signatures) < problem.solution_limit:
+                remaining = problem.time_limit - (time.time() - start_time)
+                if remaining <= 0 or is_cancelled(problem):
+                    finished = False
+                    break
+                m.Params.TimeLimit = remaining
+                m.Params.PoolSolutions = problem.solution_limit - len(signatures)
+                m.optimize()
+                # the pool is proven to hold the best solutions, or there are none left
+                finished = m.Status in (GRB.OPTIMAL, GRB.SOLUTION_LIMIT, GRB.INFEASIBLE, GRB.INF_OR_UNBD)
+                found = []
+                for k in range(m.SolCount):
+                    m.Params.SolutionNumber = k
+                    values = m.getAttr("Xn", edge_vars)
+                    found.append(tuple(i for i, val in enumerate(values) for _ in range(int(round(val)))))
+                nduplicates = 0
+                for solution in found:
+                    signature = solution_signature(problem, solution)
+                    if signature in signatures:
+                        nduplicates += 1
+                        continue
+                    signatures.add(signature)
+                    sol_sum = int(problem.lengths[list(solution)].sum())
+                    solution_sums.setdefault(sol_sum, set()).add(solution)
+                    if not suppress_output:
+                        print(f"Found solution with sum {sol_sum}")
+                # stop unless the pool was filled with duplicate options and there may be more
+                if nduplicates == 0 or m.Status != GRB.OPTIMAL or len(found) < m.Params.PoolSolutions:
+                    break
+                # exclude what was found so the next pool only holds new subsets; the set of used
+                # edges already determines the signature, so multiplicities need no separate cut
+                for solution in found:
+                    selected = set(solution)
+                    nogoods.append(m.addConstr(gp.quicksum(1 - used_vars[i] for i in selected) +
+                                               gp.quicksum(used_vars[i] for i in range(len(used_vars)) if i not in selected) >= 1))
+        finally:
+            if problem.cancel_token is not None:
+                problem.cancel_token.remove_callback(m.terminate)
+            if problem.key is None:
+                gurobi_model.dispose()
+            elif nogoods:
+                gurobi_model.model.remove(nogoods)
+                gurobi_model.model.update()
+        return collect_solutions(solution_sums, problem.target_L), finished
+
+class HighsBackend(SolverBackend):
+    name = 'highs'
+    aggregates = True
+
+    def probe(self):
+        try:
+            from scipy.optimize import milp
+            return True
+        except ImportError:
+            return False
+
+    def solve_problem(self, problem, suppress_output=True):
+        from scipy.optimize import milp, LinearConstraint, Bounds
+        from scipy.sparse import vstack, csr_matrix
+
+        start_time = time.time()
+        lm = build_linear_model(problem)
+        n = lm['n']
+        A, row_lb, row_ub = lm['A'], list(lm['row_lb']), list(lm['row_ub'])
+        cuts = []
+        solution_sums = {}
+        signatures = set()
+        finished = False
+        # HiGHS returns a single solution, so further ones are found by re-solving with no-good cuts
+        while len(signatures) < problem.solution_limit:
+            remaining = problem.time_limit - (time.time() - start_time)
+            if remaining <= 0 or is_cancelled(problem):
+                finished = False
+                break
+            constraint_matrix = vstack([A] + cuts) if cuts else A
+            res = milp(lm['c'], integrality=lm['integrality'], bounds=Bounds(lm['lb'], lm['ub']),
+                       constraints=LinearConstraint(constraint_matrix, row_lb, row_ub),
+                       options={'time_limit': remaining, 'mip_rel_gap': problem.mip_gap, 'disp': not suppress_output})
+            # 0 is optimal and 2 infeasible, i.e. no solutions are left
+            finished = res.status in (0, 2)
+            if res.x is None:
+                break
+            solution = tuple(i for i in range(n) for _ in range(int(round(res.x[i]))))
+            signature = solution_signature(problem, solution)
+            if signature not in signatures:
+                signatures.add(signature)
+                sol_sum = int(problem.lengths[list(solution)].sum())
+                solution_sums.setdefault(sol_sum, set()).add(solution)
+                if not suppress_output:
+                    print(f"Found solution with sum {sol_sum}")
+            # at least one edge is used or unused differently from this solution
+            selected = set(solution)
+            cut = np.zeros(len(lm['c']))
+            cut[lm['used']] = -1
+            cut[[lm['used'][i] for i in selected]] = 1
+            cuts.append(csr_matrix(cut))
+            row_lb.append(-np.inf)
+            row_ub.append(len(selected) - 1)
+        return collect_solutions(solution_sums, problem.target_L), finished
+
+class NumpyBackend(SolverBackend):
+    name = 'numpy'
+    quantizes = True
+    exact = True
+
+    def solve_problem(self, problem, suppress_output=True):
+        deadline = time.time() + problem.time_limit if problem.time_limit is not None else None
+        stopped = []
+
+        def should_stop():
+            # the sweep only asks while it still has candidates that can improve its options
+            if is_cancelled(problem) or (deadline is not None and time.time() > deadline):
+                stopped.append(True)
+            return len(stopped) > 0
+
+        results = find_best_subsets_sweep(problem.lengths, problem.other_dims, problem.groups,
+                                          problem.target_L, problem.threshold, sa=problem.sa,
+                                          thickness_min=problem.thickness_min, thickness_max=problem.thickness_max,
+                                          fabric_count_min=problem.fabric_count_min,
+                                          fabric_count_max=problem.fabric_count_max,
+                                          solution_limit=problem.solution_limit,
+                                          seeds=problem.seeds, required_groups=problem.required_groups(),
+                                          should_stop=should_stop)
+        return results, not stopped
+
+SOLVER_BACKENDS = {backend.name: backend for backend in [GurobiBackend(), HighsBackend(), NumpyBackend()]}
+# order in which 'auto' picks the first available backend
+DEFAULT_BACKEND_ORDER = ['gurobi', 'highs', 'numpy']
+
+def get_solver_backend(name='auto'):
+    """
+    Look up a solver backend by name ('gurobi', 'highs', 'numpy' or 'auto').
+
+    'auto' (or None) returns the first available backend in DEFAULT_BACKEND_ORDER. A backend that is
+    requested by name but not available falls back to 'auto'.
+    """
+    if isinstance(name, SolverBackend):
+        return name
+    if name not in (None, 'auto'):
+        if name not in SOLVER_BACKENDS:
+            raise ValueError(f"Unknown solver backend: {name}")
+        backend = SOLVER_BACKENDS[name]
+        if backend.is_available():
+            return backend
+        print(f"Solver backend {name} is not available. Falling back to the next available backend.")
+    for backend_name in DEFAULT_BACKEND_ORDER:
+        if SOLVER_BACKENDS[backend_name].is_available():
+            return SOLVER_BACKENDS[backend_name]
+    return SOLVER_BACKENDS['numpy']
+
+_solver_pool = None
+_solver_lanes = None
+_lane_of_key = OrderedDict()
+_lanes_lock = threading.Lock()
+# how many bin keys solver_lane remembers (far more than the models the lanes keep)
+MAX_LANE_KEYS = 1024
+
+def worker_context():
+    """
+    Start method of the worker process pools (solvers and feature extraction). Forking the threaded
+    server is not safe, a child can inherit a lock that another thread held (logging, BLAS, Gurobi),
+    so the workers are forked from a fork server that preloads the solver modules, or spawned where
+    there is none. Either way they import the script's __main__ as __mp_main__ (see ui/api/server.py).
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['__main__', 'src.utils.solvers', 'src.utils.features'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def get_solver_pool(max_workers=None):
+    """Lazily created process pool shared by all solve_subset_problems calls."""
+    global _solver_pool
+    if _solver_pool is None:
+        context = worker_context()
+        _solver_pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=context,
+                                           initializer=_init_solver_worker, initargs=(_cancel_flags,))
+    return _solver_pool
+
+def get_solver_lanes(max_workers=None):
+    """
+    Lazily created single-thread executors for backends that keep state in the thread that solves
+    (see GurobiBackend), one per worker. A bin is always solved on the same lane, see solver_lane.
+    """
+    global _solver_lanes
+    with _lanes_lock:
+        if _solver_lanes is None:
+            _solver_lanes = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'solver{k}')
+                             for k in range(max_workers or os.cpu_count() or 1)]
+    return _solver_lanes
+
+def solver_lane(key, nlanes):
+    """
+    Lane of the bin with key (SubsetProblem.key): its first solve takes the lane with the fewest
+    bins and later ones stay there. None for problems without a key.
+    """
+    if key is None:
+        return None
+    with _lanes_lock:
+        lane = _lane_of_key.pop(key, None)
+        if lane is None or lane >= nlanes:
+            nbins = np.bincount(np.array(list(_lane_of_key.values()), dtype=np.int64), minlength=nlanes)
+            lane = int(np.argmin(nbins[:nlanes]))
+        _lane_of_key[key] = lane
+        while len(_lane_of_key) > MAX_LANE_KEYS:
+            _lane_of_key.popitem(last=False)
+    return lane
+
+def _timed_solve(solver, problem, suppress_output):
+    start_time = time.time()
+    result, finished = solver.solve_with_status(problem, suppress_output=suppress_output)
+    return result, time.time() - start_time, finished
+
+def _solve_in_worker(backend_name, problem, suppress_output):
+    return _timed_solve(get_solver_backend(backend_name), problem, suppress_output)
+
+def solver_concurrency(nproblems, max_workers=None):
+    """How many of nproblems solve_subset_problems runs at the same time."""
+    return max(min(nproblems, max_workers or os.cpu_count() or 1), 1)
+
+def _collect_outcomes(futures, on_result):
+    # outcomes in submission order, on_result is called in completion order
+    outcomes = [None] * len(futures)
+    index = {future: i for i, future in enumerate(futures)}
+    for future in as_completed(futures):
+        i = index[future]
+        outcomes[i] = future.result()
+        if on_result is not None:
+            on_result(i, *outcomes[i])
+    return outcomes
+
+def _solve_sequentially(solver, problems, suppress_output, on_result):
+    outcomes = []
+    for i, problem in enumerate(problems):
+        outcomes.append(_timed_solve(solver, problem, suppress_output))
+        if on_result is not None:
+            on_result(i, *outcomes[i])
+    return outcomes
+
+def solve_subset_problems(problems, backend=None, suppress_output=True, max_workers=None, timed=False, on_result=None):
+    """
+    Solve several independent problems (one per bin) concurrently in a process pool, or on the
+    solver lanes for backends that keep state in their threads (see solver_lane).
+
+    Only the compact SubsetProblem arrays are sent to worker processes, never the Fabric objects.
+
+    Args:
+        problems: list of SubsetProblem
+        backend: Solver backend name or instance, None or 'auto' for the first available one
+        suppress_output: Whether to suppress solver output
+        max_workers: Number of workers (defaults to the number of cpus)
+        timed: Whether to also return how long each solve took
+        on_result: called as on_result(index, result, duration, finished) in the calling thread as soon
+            as each problem is solved, finished as returned by the backend (see SolverBackend) (optional)
+
+    Returns:
+        list with the backend results of each problem, in the same order
+        (and the list of solve durations in seconds if timed)
+    """
+    solver = get_solver_backend(backend)
+    if solver.parallel == 'thread':
+        lanes = get_solver_lanes(max_workers)
+        futures = []
+        for i, problem in enumerate(problems):
+            lane = solver_lane(problem.key, len(lanes))
+            futures.append(lanes[lane if lane is not None else i % len(lanes)].submit(_timed_solve, solver, problem, suppress_output))
+        outcomes = _collect_outcomes(futures, on_result)
+    elif len(problems) <= 1 or (max_workers or os.cpu_count()) <= 1:
+        outcomes = _solve_sequentially(solver, problems, suppress_output, on_result)
+    else:
+        try:
+            pool = get_solver_pool(max_workers)
+            futures = [pool.submit(_solve_in_worker, solver.name, problem, suppress_output) for problem in problems]
+            outcomes = _collect_outcomes(futures, on_result)
+        except BrokenProcessPool:
+            global _solver_pool
+            _solver_pool = None
+            print("Solver pool broke. Solving the bins sequentially.")
+            outcomes = _solve_sequentially(solver, problems, suppress_output, on_result)
+    results = [result for result, _, _ in outcomes]
+    if timed:
+        return results, [duration for _, duration, _ in outcomes]
+    return results
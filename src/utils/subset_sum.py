@@ -0,0 +1,363 @@
+import time
+import numpy as np
+
+def group_items(groups):
+    """
+    Split item indices into mutually exclusive groups (e.g. the e1/e2 edges of one fabric).
+
+    Args:
+        groups: array of group ids, one per item
+
+    Returns:
+        list of index arrays, one per group, in order of first appearance
+    """
+    groups = np.asarray(groups)
+    _, first_seen, inverse = np.unique(groups, return_index=True, return_inverse=True)
+    order = np.argsort(first_seen)
+    return [np.flatnonzero(inverse == g) for g in order]
+
+def reachable_sums(lengths, item_groups, capacity):
+    """
+    Boolean reachability table of the grouped subset-sum problem.
+
+    Each stage applies one "fabric group" step: a sum is reachable after group g if it was
+    reachable before, or if it is reachable before by subtracting the length of one item in g.
+    So at most one item per group is ever used.
+
+    Args:
+        lengths: integer array of item lengths
+        item_groups: list of index arrays (see group_items)
+        capacity: largest sum to track
+
+    Returns:
+        (len(item_groups) + 1, capacity + 1) boolean array; row g is reachability over the first g groups
+    """
+    stages = np.zeros((len(item_groups) + 1, capacity + 1), dtype=bool)
+    stages[0, 0] = True
+    for g, items in enumerate(item_groups):
+        prev = stages[g]
+        curr = stages[g + 1]
+        curr[:] = prev
+        for i in items:
+            length = lengths[i]
+            if 0 < length <= capacity:
+                curr[length:] |= prev[:-length]
+    return stages
+
+def enumerate_subsets(lengths, item_groups, stages, total, limit):
+    """
+    Back-pointer reconstruction of up to `limit` distinct subsets whose lengths add up to `total`.
+
+    The reachability table guarantees that every branch of the search ends in a valid subset,
+    so each subset costs O(#groups) to produce.
+
+    Returns:
+        list of tuples of item indices
+    """
+    subsets = []
+    stack = [(len(item_groups), total, ())]
+    while stack and len(subsets) < limit:
+        g, residual, chosen = stack.pop()
+        if g == 0:
+            subsets.append(chosen)
+            continue
+        prev = stages[g - 1]
+        # pushed in reverse so that skipping the group is explored first
+        for i in item_groups[g - 1][::-1]:
+            length = lengths[i]
+            if 0 < length <= residual and prev[residual - length]:
+                stack.append((g - 1, residual - length, chosen + (int(i),)))
+        if prev[residual]:
+            stack.append((g - 1, residual, chosen))
+    return subsets
+
+def find_best_subsets_bitset(lengths, groups, target, threshold, solution_limit=20):
+    """
+    Vectorized subset sum over grouped items.
+
+    Sums are tracked up to target + threshold; every sum in [target, target + threshold] is a
+    candidate and sums closer to the target are preferred. If no sum reaches the target, the
+    closest reachable sum below it is returned instead (same as the old dict-based DP).
+
+    Args:
+        lengths: integer lengths of the items
+        groups: group id per item, at most one item per group is selected
+        target: target sum
+        threshold: acceptable overshoot of the target
+        solution_limit: maximum number of subsets to return in total
+
+    Returns:
+        list of (sum, list of index tuples) sorted by closeness to the target,
+        or [(0, [])] if nothing but the empty subset is reachable
+    """
+    lengths = np.rint(np.asarray(lengths)).astype(np.int64)
+    target = int(round(target))
+    capacity = max(target + int(threshold), 0)
+    item_groups = group_items(groups)
+    stages = reachable_sums(lengths, item_groups, capacity)
+    reachable = np.flatnonzero(stages[-1])
+
+    best_sums = [s for s in reachable if s >= target]
+    if not best_sums:
+        best_sums = [reachable.max()]
+        if best_sums[0] == 0:
+            return [(0, [])]
+
+    results = []
+    nsolutions = 0
+    for best_sum in best_sums:
+        if nsolutions >= solution_limit:
+            break
+        subsets = enumerate_subsets(lengths, item_groups, stages, best_sum, solution_limit - nsolutions)
+        results.append((int(best_sum), subsets))
+        nsolutions += len(subsets)
+    return results
+
+# modulus for the subset counting in the thickness sweep; a count is only mistaken for zero
+# when it is an exact multiple of this prime
+_MOD = (1 << 61) - 1
+
+def _multiply_group(counts, base, length):
+    """counts + x^length * base (mod _MOD), i.e. allow one more item for a group."""
+    counts = counts.copy()
+    counts[length:] += base[:len(base) - length]
+    counts[counts >= _MOD] -= _MOD
+    return counts
+
+def _divide_group(counts, group_lengths):
+    """Remove the factor (1 + sum_j x^length_j) of one group from the counting polynomial."""
+    step = min(group_lengths)
+    base = np.zeros_like(counts)
+    for start in range(0, len(counts), step):
+        block = counts[start:start + step].copy()
+        for length in group_lengths:
+            lo = start - length
+            if lo + len(block) <= 0:
+                continue
+            src = base[max(lo, 0):lo + len(block)]
+            block[len(block) - len(src):] -= src
+        block %= _MOD
+        base[start:start + step] = block
+    return base
+
+def sweep_thickness_candidates(lengths, other_dims, groups, target, threshold,
+                               thickness_min=None, thickness_max=None):
+    """
+    Find every strip thickness t for which some subset with min(other_dims) == t reaches the target.
+
+    Distinct other dimensions are visited in descending order. The items with other dimension >= t
+    are exactly the items of the previous candidate plus the ones with other dimension == t, so the
+    reachability of each candidate is obtained by updating the previous one: reachability is kept as
+    a count of subsets per sum (mod a large prime) so that a fabric whose second edge becomes usable
+    can have its old group factor divided out and replaced. A sum has a subset whose thinnest edge
+    is exactly t iff its count grew during that update.
+
+    Returns:
+        list of (t, array of sums in [target, target + threshold] with min thickness exactly t)
+    """
+    capacity = max(target + int(threshold), 0)
+    counts = np.zeros(capacity + 1, dtype=np.int64)
+    counts[0] = 1
+    present = {}
+    candidates = []
+    for t in np.unique(other_dims)[::-1]:
+        if thickness_min is not None and t < thickness_min:
+            break
+        before = counts[target:].copy()
+        for i in np.flatnonzero(other_dims == t):
+            length = lengths[i]
+            if length <= 0 or length > capacity:
+                continue
+            group_lengths = present.setdefault(groups[i], [])
+            base = _divide_group(counts, group_lengths) if group_lengths else counts
+            counts = _multiply_group(counts, base, length)
+            group_lengths.append(length)
+        if thickness_max is not None and t > thickness_max:
+            continue
+        grown = np.flatnonzero(counts[target:] != before)
+        if len(grown) > 0:
+            candidates.append((int(t), grown + target))
+    return candidates
+
+def min_area_subsets(lengths, areas, tight, item_groups, capacity, required=None, count_min=None, count_max=None,
+                     should_stop=None):
+    """
+    Minimum-area subset for every sum, with at least one tight item used.
+
+    Two layers are kept per sum: layer 0 has not used a tight item yet and layer 1 has. With fabric
+    count bounds the layers are also split by the number of items used (up to count_max, or up to
+    count_min where larger counts are not told apart), so that only subsets with an allowed number
+    of items are returned.
+    The per-group choices are stored so that subsets can be rebuilt for any sum.
+    Groups flagged in required (one flag per group, optional) cannot be skipped.
+    should_stop is called before each group and gives up the table when it returns True (optional).
+
+    Returns:
+        (area per sum for layer 1, backtrack function sum -> tuple of item indices), or None if stopped
+    """
+    # no subset has more items than there are groups
+    top = min(count_max if count_max is not None else (count_min or 0), len(item_groups))
+    if count_min is not None and count_min > top:
+        return np.full(capacity + 1, np.inf), lambda total: ()
+    area = np.full((2, top + 1, capacity + 1), np.inf)
+    area[0, 0, 0] = 0
+    # choice = 0 keeps the layer without an item, otherwise
+    # (item position + 1) + 64 * source layer + 128 * source count
+    choices = np.zeros((2, top + 1, len(item_groups), capacity + 1), dtype=np.int16 if top < 255 else np.int32)
+    for g, items in enumerate(item_groups):
+        if should_stop is not None and should_stop():
+            return None
+        if required is not None and required[g]:
+            new = np.full_like(area, np.inf)
+        else:
+            new = area.copy()
+        for k, i in enumerate(items, 1):
+            length = lengths[i]
+            if length <= 0 or length > capacity:
+                continue
+            for count in range(top + 1):
+                if count == top and count_max is not None:
+                    continue
+                next_count = min(count + 1, top)
+                # a tight item moves either layer to layer 1, the others stay in their layer
+                for layer, source in ([(1, 0), (1, 1)] if tight[i] else [(0, 0), (1, 1)]):
+                    candidate = area[source, count, :-length] + areas[i]
+                    better = candidate < new[layer, next_count, length:]
+                    np.minimum(new[layer, next_count, length:], candidate, out=new[layer, next_count, length:])
+                    np.copyto(choices[layer, next_count, g, length:], k + 64 * source + 128 * count,
+                              where=better, casting='unsafe')
+        area = new
+
+    allowed = area[1, count_min or 0:]
+    best_counts = np.argmin(allowed, axis=0) + (count_min or 0)
+
+    def backtrack(total):
+        layer, count, residual, chosen = 1, int(best_counts[total]), total, []
+        for g in range(len(item_groups) - 1, -1, -1):
+            choice = int(choices[layer, count, g, residual])
+            if choice:
+                i = item_groups[g][(choice & 63) - 1]
+                chosen.append(int(i))
+                residual -= lengths[i]
+                layer, count = (choice >> 6) & 1, choice >> 7
+        return tuple(chosen[::-1])
+
+    return allowed.min(axis=0), backtrack
+
+def fill_bound(lengths, other_dims, t, target):
+    """
+    Lower bound on sum_i (other_dim_i - t) * length_i for subsets of thickness t reaching the target.
+
+    Relaxes the one-item-per-group rule and lets items be used fractionally, so the cheapest
+    length per unit (the items with other dimension closest to t) is filled up first.
+    """
+    eligible = other_dims >= t
+    order = np.argsort(other_dims[eligible], kind='stable')
+    used = np.minimum(np.cumsum(lengths[eligible][order]), target)
+    used = np.diff(used, prepend=0)
+    return float(np.sum(used * (other_dims[eligible][order] - t)))
+
+def find_best_subsets_sweep(lengths, other_dims, groups, target, threshold, sa=0,
+                            thickness_min=None, thickness_max=None,
+                            fabric_count_min=None, fabric_count_max=None,
+                            solution_limit=20, time_limit=None, seeds=None, required_groups=None,
+                            should_stop=None):
+    """
+    Thickness-sweep decomposition of the strip selection problem.
+
+    For a fixed strip thickness t (the smallest other dimension among the selected items), the
+    wasted area of a subset with length sum s >= target is
+        sum_i (other_dim_i - 2 * sa - t) * length_i + (s - target) * t = area - 2 * sa * s - target * t
+    so the problem splits into plain subset sums over the items with other dimension >= t.
+    sweep_thickness_candidates finds the feasible thicknesses; they are then solved in order of a
+    lower bound on that wasted area (see fill_bound) until the bound cannot beat the current
+    solution_limit-th best option, or until time_limit runs out. Subsets with the same thickness and
+    set of lengths give the same option, so only the first one of each is kept. Known feasible
+    seeds start out as incumbents, so that the sweep can stop early when they are already good.
+
+    Args:
+        lengths: integer lengths of the items
+        other_dims: integer other dimension (strip thickness) of the items
+        groups: group id per item, at most one item per group is selected
+        target: target sum
+        threshold: acceptable overshoot of the target
+        sa: seam allowance
+        thickness_min: minimum thickness constraint (optional)
+        thickness_max: maximum thickness constraint (optional)
+        fabric_count_min: minimum number of selected items (optional)
+        fabric_count_max: maximum number of selected items (optional)
+        solution_limit: maximum number of subsets to return in total
+        time_limit: time budget in seconds for solving the candidate thicknesses (optional)
+        seeds: feasible index tuples to start from, e.g. the previous options (optional)
+        required_groups: groups of which one item has to be selected (optional)
+        should_stop: called before each candidate thickness and between the groups of its table, the
+            sweep stops with what it has found when it returns True (optional, e.g. CancelToken.cancelled)
+
+    Returns:
+        list of (sum, list of index tuples) sorted by closeness to the target,
+        or [(0, [])] if no subset fits the target window
+    """
+    deadline = time.time() + time_limit if time_limit is not None else None
+    lengths = np.rint(np.asarray(lengths)).astype(np.int64)
+    other_dims = np.rint(np.asarray(other_dims)).astype(np.int64)
+    groups = np.asarray(groups)
+    target = int(round(target))
+
+    def stopped():
+        # also checked inside min_area_subsets, whose table alone can outlast the time limit
+        return (deadline is not None and time.time() > deadline) or (should_stop is not None and should_stop())
+    capacity = max(target + int(threshold), 0)
+
+    candidates = sweep_thickness_candidates(lengths, other_dims, groups, target, threshold,
+                                            thickness_min=thickness_min, thickness_max=thickness_max)
+    bounds = [fill_bound(lengths, other_dims, t, target) + min((s - target) * t - 2 * sa * s for s in sums)
+              for t, sums in candidates]
+    areas = lengths * other_dims.astype(float)
+    scored = []
+    signatures = set()
+    for seed in seeds or []:
+        subset = tuple(sorted(seed))
+        t = int(other_dims[list(subset)].min())
+        s = int(lengths[list(subset)].sum())
+        signature = (t, frozenset(lengths[list(subset)].tolist()))
+        if signature not in signatures:
+            signatures.add(signature)
+            scored.append((areas[list(subset)].sum() - 2 * sa * s - target * t, s, subset))
+    scored.sort(key=lambda item: item[0])
+    for bound, (t, sums) in sorted(zip(bounds, candidates), key=lambda item: item[0]):
+        if len(scored) >= solution_limit and bound >= scored[solution_limit - 1][0]:
+            break
+        if stopped():
+            break
+        eligible = np.flatnonzero(other_dims >= t)
+        item_groups = [eligible[items] for items in group_items(groups[eligible])]
+        if required_groups and not set(required_groups) <= set(groups[eligible].tolist()):
+            # a required group has no item this thick
+            continue
+        required = [groups[items[0]].item() in required_groups for items in item_groups] if required_groups else None
+        table = min_area_subsets(lengths, areas, other_dims == t, item_groups, capacity, required=required,
+                                 count_min=fabric_count_min, count_max=fabric_count_max, should_stop=stopped)
+        if table is None:
+            break
+        area, backtrack = table
+        scores = area[sums] - 2 * sa * sums - target * t
+        for s, score in sorted(zip(sums, scores), key=lambda item: item[1]):
+            if not np.isfinite(score):
+                break
+            if len(scored) >= solution_limit and score >= scored[solution_limit - 1][0]:
+                break
+            subset = backtrack(s)
+            # same thickness and edge lengths would be the same option
+            signature = (int(t), frozenset(lengths[list(subset)].tolist()))
+            if signature in signatures:
+                continue
+            signatures.add(signature)
+            scored.append((score, int(s), subset))
+            scored.sort(key=lambda item: item[0])
+
+    if not scored:
+        return [(0, [])]
+    solutions = {}
+    for _, s, subset in scored[:solution_limit]:
+        solutions.setdefault(s, []).append(subset)
+    return sorted(solutions.items(), key=lambda item: abs(item[0] - target))
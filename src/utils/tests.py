@@ -1,6 +1,25 @@
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import numpy as np
+from sklearn.metrics import silhouette_score
 from src.utils.test_set import generate_bordered_test_fabric, generate_palette_colors
 from src.utils.bin_pack_api import bin_pack, bin_pack_rail_fence
+from src.utils.binning import group_images, optimal_1d_partitions, partition_labels, silhouette_1d, unwrap_hues
+from src.utils.bins import Fabric, FabricBin
+from src.utils.color_diff import color_pdist, paired_color_distances
 from src.utils.config import PackingConfig
+from src.utils.jobs import JobCancelled, JobQueue
+from src.utils.filters import LowContrastRank, PARETO_OBJECTIVES, contrast_means
+from src.utils.options import OptionTable, non_dominated_mask
+from src.utils.solution_cache import SolutionCache, SolutionStore
+from src.utils.subset_sum import find_best_subsets_bitset, find_best_subsets_sweep
+from src.utils.solvers import SubsetProblem, SOLVER_BACKENDS, presolve_problem, aggregate_problem, expand_solution, \
+    get_solver_lanes, solver_lane, solve_subset_problems, solution_objective, solution_signature
 
 def print_waste_use(wasted_material, used_material, config=PackingConfig()):
     print(f"Total wasted fabric area: {wasted_material / config.dpi ** 2:.3f} sq in")
@@ -83,6 +102,371 @@ def packing_test4():
     assert wasted == 0, 'packing_test4: all fabrics should be used up'
     print('packing_test4 passed')
 
+def subset_sum_test1():
+    # three fabrics of 100x200, 150x150 and 120x80; at most one edge per fabric can be used
+    lengths = [100, 200, 150, 150, 120, 80]
+    groups = [0, 0, 1, 1, 2, 2]
+    results = find_best_subsets_bitset(lengths, groups, 300, 20, solution_limit=10)
+    assert results == [(320, [(4, 1)])], 'subset_sum_test1: 200 + 100 and 150 + 150 come from the same fabric and are not allowed'
+    results = find_best_subsets_bitset(lengths, groups, 330, 20, solution_limit=10)
+    assert results[0][0] == 330, 'subset_sum_test1: the exact target length should be found first'
+    assert sorted(results[0][1]) == [(5, 2, 0), (5, 3, 0)], 'subset_sum_test1: both edges of the square fabric give a valid subset'
+    assert all(330 <= s <= 350 for s, _ in results), 'subset_sum_test1: all sums should be within the threshold'
+    print('subset_sum_test1 passed')
+
+def subset_sum_test2():
+    # six fabrics, edge i of fabric i // 2 is lengths[i] long and others[i] thick
+    fabrics = [(100, 40), (120, 60), (80, 50), (150, 30), (60, 60), (90, 45)]
+    lengths = [side for w, h in fabrics for side in (w, h)]
+    others = [side for w, h in fabrics for side in (h, w)]
+    groups = [g for g in range(len(fabrics)) for _ in range(2)]
+    problem = SubsetProblem(lengths, others, groups, 300, 20, thickness_min=45, thickness_max=55)
+    results = find_best_subsets_sweep(lengths, others, groups, 300, 20, thickness_min=45, thickness_max=55)
+    assert len(results[0][1]) > 0, 'subset_sum_test2: some strip should be 45 to 55 thick'
+    assert all(problem.is_feasible(subset) for _, subsets in results for subset in subsets), 'subset_sum_test2: all strips should be within the thickness window'
+    assert all(45 <= min(others[i] for i in subset) <= 55 for _, subsets in results for subset in subsets), 'subset_sum_test2: the thinnest edge sets the strip thickness'
+    results = find_best_subsets_sweep(lengths, others, groups, 300, 20, required_groups=[3])
+    assert all(any(groups[i] == 3 for i in subset) for _, subsets in results for subset in subsets), 'subset_sum_test2: every strip should use the required fabric'
+    print('subset_sum_test2 passed')
+
+def subset_sum_test3():
+    # the smallest strip of 200 x 50 uses three fabrics; with two of them it needs the 100 x 70 fabric
+    lengths = [100, 50, 100, 70, 50, 55, 50, 55]
+    others = [50, 100, 70, 100, 55, 50, 55, 50]
+    groups = [0, 0, 1, 1, 2, 2, 3, 3]
+    results = find_best_subsets_sweep(lengths, others, groups, 200, 0)
+    assert sorted(results[0][1]) == [(0, 4, 6), (2, 4, 6)], 'subset_sum_test3: the least wasteful strips should be found first'
+    results = find_best_subsets_sweep(lengths, others, groups, 200, 0, fabric_count_max=2)
+    assert results == [(200, [(0, 2)])], 'subset_sum_test3: the strip of two fabrics should be found when at most two are allowed'
+    results = find_best_subsets_sweep(lengths, others, groups, 200, 0, fabric_count_min=4)
+    assert results == [(0, [])], 'subset_sum_test3: no strip of four fabrics is 200 long'
+    results = find_best_subsets_sweep(lengths, others, groups, 200, 0, time_limit=0)
+    assert results == [(0, [])], 'subset_sum_test3: the time limit applies before the first strip is found'
+    print('subset_sum_test3 passed')
+
+def solver_backend_test1():
+    # bins.py has to load and the HiGHS backend has to solve where gurobipy cannot be imported
+    script = """
+import sys
+sys.modules['gurobipy'] = None
+from src.utils.binning import group_images, optimal_1d_partitions, partition_labels, silhouette_1d, unwrap_hues
+from src.utils.bins import Fabric, FabricBin
+from src.utils.test_set import generate_bordered_test_fabric, generate_palette_colors
+colors = generate_palette_colors(4)
+fabrics = [Fabric(generate_bordered_test_fabric(color, width, 100)) for color, width in zip(colors, [100, 150, 200, 120])]
+fabric_bin = FabricBin([edge for fabric in fabrics for edge in (fabric.e1, fabric.e2)])
+problem = fabric_bin.subset_problem(300, 20)
+assert problem is not None and len(problem) == 8, 'every edge can be part of a strip'
+results = fabric_bin.find_best_subsets(300, 20, time_limit=10, backend='highs')
+assert results[0][0] == 300, 'a strip of exactly 300 exists'
+for best_sum, subsets in results:
+    for subset in subsets:
+        assert 300 <= sum(edge.length() for edge in subset) == best_sum <= 320
+        assert len(set(edge.p for edge in subset)) == len(subset)
+"""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.environ.get('PYTHONPATH', '')]))
+    completed = subprocess.run([sys.executable, '-c', script], cwd=root, env=env, capture_output=True, text=True)
+    assert completed.returncode == 0, f'solver_backend_test1: solving with HiGHS without gurobipy failed:\n{completed.stderr}'
+    print('solver_backend_test1 passed')
+
+def gurobi_model_test1():
+    # a second solve of a bin updates the model cached by its solver thread instead of building a new one
+    backend = SOLVER_BACKENDS['gurobi']
+    if not backend.is_available():
+        print('gurobi_model_test1 skipped, Gurobi is not available')
+        return
+    lengths = [100, 50, 120, 60, 80, 50, 150, 30, 60, 60, 90, 45]
+    others = [50, 100, 60, 120, 50, 80, 30, 150, 60, 60, 45, 90]
+    groups = [g for g in range(6) for _ in range(2)]
+    keys = [f'gurobi_model_test1 bin {k}' for k in range(3)]
+
+    def solve(target):
+        problems = [SubsetProblem(lengths, others, groups, target, 20, time_limit=10, key=key) for key in keys]
+        results = solve_subset_problems(problems, backend='gurobi')
+        lanes = get_solver_lanes()
+        models = [lanes[solver_lane(key, len(lanes))].submit(lambda key=key: backend.get_models().get(key)).result()
+                  for key in keys]
+        return problems, results, models
+
+    _, _, first = solve(300)
+    problems, results, second = solve(250)
+    assert all(model is not None for model in first), 'gurobi_model_test1: every bin should keep its model'
+    assert all(a is b for a, b in zip(first, second)), 'gurobi_model_test1: the second solve should reuse the cached models'
+    assert all(model.length_lb.RHS == 250 for model in second), 'gurobi_model_test1: the cached models should be updated to the new target'
+    assert all(res[0][0] == 250 for res in results), 'gurobi_model_test1: 100 + 150 reaches the new target exactly'
+    assert all(problem.is_feasible(subset) for problem, res in zip(problems, results) for _, subsets in res for subset in subsets), \
+        'gurobi_model_test1: the updated models should only return feasible strips'
+    print('gurobi_model_test1 passed')
+
+def gurobi_pool_test1():
+    # the solution pool holds the solution_limit best distinct options, as found by brute force
+    if not SOLVER_BACKENDS['gurobi'].is_available():
+        print('gurobi_pool_test1 skipped, Gurobi is not available')
+        return
+    rng = np.random.default_rng(14)
+    dims = rng.integers(40, 200, (9, 2))
+    lengths = np.concatenate([dims[:, 0], dims[:, 1]])
+    others = np.concatenate([dims[:, 1], dims[:, 0]])
+    groups = np.concatenate([np.arange(9)] * 2)
+    problem = SubsetProblem(lengths, others, groups, 400, 30, sa=5, solution_limit=8, time_limit=20)
+    best = {}
+    for k in range(1, 10):
+        for subset in itertools.combinations(range(18), k):
+            if problem.is_feasible(subset):
+                signature = solution_signature(problem, subset)
+                best[signature] = min(best.get(signature, np.inf), solution_objective(problem, subset))
+    results = SOLVER_BACKENDS['gurobi'].solve(problem)
+    objectives = sorted(solution_objective(problem, subset) for _, subsets in results for subset in subsets)
+    assert objectives == sorted(best.values())[:8], 'gurobi_pool_test1: the pool should hold the best options'
+    print('gurobi_pool_test1 passed')
+
+def contrast_test1():
+    # the pairwise contrast model finds the strips of the original model: the thinnest selected edge sets
+    # the strip thickness and no selected edge is shorter than it (the Wmat constraints)
+    if not SOLVER_BACKENDS['gurobi'].is_available():
+        print('contrast_test1 skipped, Gurobi is not available')
+        return
+    sizes = [(60, 50), (120, 100), (130, 110), (140, 90), (100, 100), (80, 150)]
+    colors = generate_palette_colors(len(sizes))
+    fabrics = [Fabric(generate_bordered_test_fabric(color, width, height)) for color, (width, height) in zip(colors, sizes)]
+    fabric_bin = FabricBin([edge for fabric in fabrics for edge in (fabric.e1, fabric.e2)])
+    results = fabric_bin.find_best_subsets_gurobi(300, 30, option_rank=LowContrastRank(), solution_limit=1000, time_limit=20)
+    found = set(frozenset(subset) for _, subsets in results for subset in subsets)
+    expected = set()
+    for k in range(1, len(fabrics) + 1):
+        for chosen in itertools.combinations(fabrics, k):
+            for edges in itertools.product(*[(fabric.e1, fabric.e2) for fabric in chosen]):
+                if not 300 <= sum(edge.length() for edge in edges) <= 330:
+                    continue
+                thickness = min(edge.get_other_dim() for edge in edges)
+                if any(edge.get_other_dim() == thickness and all(edge.length() <= other.length() for other in edges)
+                       for edge in edges):
+                    expected.add(frozenset(edges))
+    assert len(expected) > 0 and found == expected, 'contrast_test1: the pairwise model should find the strips of the original model'
+    print('contrast_test1 passed')
+
+def presolve_test1():
+    # fabric 0 has an edge longer than the window, fabric 3 is a scrap, fabrics 0 and 1 are needed
+    lengths = [400, 90, 200, 60, 50, 40, 10, 20]
+    others = [90, 400, 60, 200, 40, 50, 20, 10]
+    groups = [0, 0, 1, 1, 2, 2, 3, 3]
+    reduced = presolve_problem(SubsetProblem(lengths, others, groups, 280, 20), min_length=30)
+    assert list(reduced.source_indices) == [1, 2, 4, 5], 'presolve_test1: the long edge, the scraps and the edge that cannot reach the target should be dropped'
+    assert list(reduced.min_counts) == [1, 1, 0, 0], 'presolve_test1: the forced fabrics should fix their edges'
+    assert reduced.reachable_sums == 1, 'presolve_test1: only 90 + 200 is within the window'
+    assert presolve_problem(SubsetProblem(lengths, others, groups, 280, 20, fabric_count_max=1)) is None, 'presolve_test1: one fabric cannot reach the target'
+    assert presolve_problem(SubsetProblem(lengths, others, groups, 280, 20, thickness_min=300)) is None, 'presolve_test1: only the 400 edge is thick enough and it is too long'
+    print('presolve_test1 passed')
+
+def aggregation_test1():
+    # four identical 100 x 50 fabrics and one 80 x 60 fabric
+    lengths = [100, 50] * 4 + [80, 60]
+    others = [50, 100] * 4 + [60, 80]
+    groups = [0, 0, 1, 1, 2, 2, 3, 3, 4, 4]
+    problem = SubsetProblem(lengths, others, groups, 300, 0)
+    aggregated, members = aggregate_problem(problem)
+    assert len(aggregated) == 4, 'aggregation_test1: the edges of identical fabrics should be merged into classes'
+    assert sorted(aggregated.counts.tolist()) == [1, 1, 4, 4], 'aggregation_test1: each class can be used once per fabric'
+    solution = tuple([list(aggregated.lengths).index(100)] * 3)
+    assert aggregated.is_feasible(solution), 'aggregation_test1: three of the 100 edges make a strip'
+    assert expand_solution(aggregated, members, solution) == (0, 2, 4), 'aggregation_test1: the classes should expand to edges of different fabrics'
+    assert not aggregated.is_feasible((list(aggregated.lengths).index(50),) * 4 + (solution[0],)), 'aggregation_test1: at most four of the identical fabrics can be used'
+    print('aggregation_test1 passed')
+
+def color_diff_test1():
+    # reference values of colormath (textile weights for CIE1994, as in color_distance); the pairs are
+    # from Sharma et al.'s CIEDE2000 test data, plus a gray against a saturated color
+    lab1 = np.array([[50.0, 2.6772, -79.7751], [50.0, 0.0, 0.0], [60.2574, -34.0099, 36.2677], [22.7233, 20.0904, -46.694]])
+    lab2 = np.array([[50.0, 0.0, -82.7485], [73.0, 25.0, -18.0], [60.4626, -34.1751, 39.4387], [23.0331, 14.973, -42.5619]])
+    expected = {
+        'CIE1976': [4.0010632837, 38.4447655735, 3.1819238017, 6.5846798867],
+        'CIE1994': [1.4230462054, 32.8823660949, 1.3897333209, 2.5309888923],
+        'CIE2000': [2.0424596802, 28.8242878594, 1.2644200136, 2.0372582697],
+        'CMC': [1.7387361057, 49.4277324672, 1.4204860454, 3.0604414320],
+    }
+    for metric, values in expected.items():
+        assert np.allclose(paired_color_distances(lab1, lab2, metric), values, rtol=0, atol=1e-8), f'color_diff_test1: wrong {metric} distances'
+    # hue and value are circular in [0, 1]
+    hsv1 = np.array([[0.95, 0.5, 0.1], [0.2, 0.3, 0.9]])
+    hsv2 = np.array([[0.05, 0.4, 0.95], [0.7, 0.3, 0.4]])
+    assert np.allclose(paired_color_distances(hsv1, hsv2, 'hue'), [0.1, 0.5]), 'color_diff_test1: wrong hue distances'
+    assert np.allclose(paired_color_distances(hsv1, hsv2, 'value'), [0.15, 0.5]), 'color_diff_test1: wrong value distances'
+    assert np.allclose(paired_color_distances(hsv1, hsv2, 'hue-value'), [np.hypot(0.1, 0.15), np.hypot(0.5, 0.5)]), 'color_diff_test1: wrong hue-value distances'
+    # color_pdist is in pdist order, with the CIE1994 weights of the first color of each pair
+    colors = np.vstack([lab1[:2], lab2[:1]])
+    pairs = [(0, 1), (0, 2), (1, 2)]
+    expected_pdist = [paired_color_distances(colors[i], colors[j], 'CIE1994') for i, j in pairs]
+    assert np.allclose(color_pdist(colors, 'CIE1994'), expected_pdist, rtol=0, atol=1e-12), 'color_diff_test1: color_pdist should follow pdist order'
+    print('color_diff_test1 passed')
+
+def binning_test1():
+    # the dynamic program finds the best split of the sorted values into k runs, like trying every split
+    rng = np.random.default_rng(3)
+    for n in range(2, 9):
+        values = np.round(rng.uniform(0, 1, n), 2)
+        order, partitions = optimal_1d_partitions(values, n)
+        x = values[order]
+
+        def sum_of_squares(starts):
+            return sum(((run - run.mean()) ** 2).sum() for run in np.split(x, starts[1:]))
+
+        for k in range(1, n + 1):
+            best = min(sum_of_squares([0] + list(splits)) for splits in itertools.combinations(range(1, n), k - 1))
+            assert abs(sum_of_squares(partitions[k]) - best) < 1e-9, f'binning_test1: the {k} clusters of {n} values are not optimal'
+            if 2 <= k <= n - 1:
+                labels = partition_labels(order, partitions[k])
+                assert abs(silhouette_1d(x, partitions[k]) - silhouette_score(values.reshape(-1, 1), labels)) < 1e-9, \
+                    f'binning_test1: silhouette_1d differs from sklearn for {k} clusters of {n} values'
+    print('binning_test1 passed')
+
+def binning_test2():
+    # the reds on both ends of the hue range end up in one group
+    hues = [0.02, 0.97, 0.99, 0.01, 0.33, 0.35, 0.31, 0.66, 0.64, 0.68]
+    fabrics = [{'id': i, 'img': None} for i in range(len(hues))]
+    features = [{'average_hsv': np.array([hue, 0.5, 0.5])} for hue in hues]
+    groups = group_images(fabrics, n_clusters=3, criterion='hue', features=features)
+    ids = sorted(sorted(fabric['id'] for fabric in group) for group in groups)
+    assert ids == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]], f'binning_test2: wrong hue groups {ids}'
+    reds = unwrap_hues(np.array(hues))[:4]
+    assert reds.max() - reds.min() < 0.1, 'binning_test2: the reds should be contiguous after unwrap_hues'
+    print('binning_test2 passed')
+
+def cache_problem(solution_limit=20, thickness_min=None, lengths=(100, 150, 200, 250, 120, 180)):
+    problem = SubsetProblem(list(lengths), [50, 60, 70, 80, 90, 100], [0, 1, 2, 3, 4, 5], 300, 50,
+                            thickness_min=thickness_min, solution_limit=solution_limit,
+                            edge_keys=[(k, True) for k in range(len(lengths))])
+    problem.content_key = problem.fingerprint()
+    return problem
+
+def result_set(results):
+    return set(subset for _, subsets in results for subset in subsets)
+
+def solution_cache_test1():
+    solver = SOLVER_BACKENDS['numpy']
+    # the same window answers from the cache
+    cache = SolutionCache()
+    problem = cache_problem()
+    results, finished = solver.solve_with_status(problem)
+    assert cache.get(problem, solver) is None, 'solution_cache_test1: an empty cache should miss'
+    cache.put(problem, results, solver, complete=finished)
+    assert result_set(cache.get(problem, solver)) == result_set(results), 'solution_cache_test1: the same window should hit'
+    assert cache.get(problem, SOLVER_BACKENDS['highs']) is None, 'solution_cache_test1: another backend should miss'
+    # a narrower window is answered by the exhaustive results of a wider one
+    narrow = cache_problem(thickness_min=70)
+    assert result_set(cache.get(narrow, solver)) == result_set(solver.solve(narrow)), \
+        'solution_cache_test1: the narrower window should be the wider exhaustive results that are left'
+    # the solution_limit best options of a wider window answer a narrower one with the best options left,
+    # unless the backend only finds good options
+    cache = SolutionCache(min_solutions=1)
+    problem, narrow = cache_problem(solution_limit=3), cache_problem(solution_limit=3, thickness_min=70)
+    results, finished = solver.solve_with_status(problem)
+    cache.put(problem, results, solver, complete=finished)
+    cache.put(problem, results, SOLVER_BACKENDS['highs'], complete=finished)
+    cached = cache.get(narrow, solver)
+    best = min(solution_objective(narrow, subset) for subset in result_set(solver.solve(narrow)))
+    assert cached is not None and min(solution_objective(narrow, subset) for subset in result_set(cached)) == best, \
+        'solution_cache_test1: the best option of the narrower window should come from the cache'
+    assert cache.get(narrow, SOLVER_BACKENDS['highs']) is None, 'solution_cache_test1: inexact results should not answer a narrower window'
+    # the least recently used problems are dropped
+    cache = SolutionCache(max_entries=2)
+    problems = [cache_problem(lengths=(100, 150, 200, 250, 120, 180 + k)) for k in range(3)]
+    for problem in problems:
+        cache.put(problem, solver.solve(problem), solver)
+    assert len(cache) == 2 and cache.get(problems[0], solver) is None and cache.get(problems[2], solver) is not None, \
+        'solution_cache_test1: the oldest problem should be evicted beyond max_entries'
+    print('solution_cache_test1 passed')
+
+def solution_cache_test2():
+    solver = SOLVER_BACKENDS['numpy']
+    problem = cache_problem()
+    results = solver.solve(problem)
+    subsets = sorted(result_set(results))
+    # partial results are merged and answer once, complete results replace them
+    cache = SolutionCache(min_solutions=2)
+    cache.put(problem, [(0, subsets[:1])], solver, complete=False)
+    assert cache.get(problem, solver) is None, 'solution_cache_test2: too few partial results should miss'
+    cache.put(problem, [(0, subsets[1:2])], solver, complete=False)
+    assert result_set(cache.get(problem, solver)) == set(subsets[:2]), 'solution_cache_test2: partial results should be merged'
+    assert cache.get(problem, solver) is None, 'solution_cache_test2: partial results should only answer once'
+    cache.put(problem, [(0, subsets[2:3])], solver, complete=False)
+    assert result_set(cache.get(problem, solver)) == set(subsets[:3]), 'solution_cache_test2: a new partial solve should refresh them'
+    cache.put(problem, results, solver)
+    cache.put(problem, [(0, subsets[:1])], solver, complete=False)
+    assert result_set(cache.get(problem, solver)) == set(subsets), 'solution_cache_test2: complete results should be kept'
+    # the store round-trips through its JSON file
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'solutions.json')
+        cache = SolutionCache(store=SolutionStore(path))
+        cache.put(problem, results, solver)
+        cache.save()
+        with open(path) as f:
+            json.load(f)
+        reloaded = SolutionCache(store=SolutionStore(path))
+        assert result_set(reloaded.get(problem, solver)) == set(subsets), 'solution_cache_test2: the store should load its solutions'
+        assert result_set(reloaded.get(cache_problem(thickness_min=70), solver)) == result_set(solver.solve(cache_problem(thickness_min=70))), \
+            'solution_cache_test2: the loaded entries should keep their flags'
+    print('solution_cache_test2 passed')
+
+def pareto_test1():
+    # the rows that no other row beats in both columns; of the identical rows only the first one is kept
+    scores = np.array([[1, 5], [2, 2], [3, 3], [5, 1], [2, 2], [4, 1], [1, 6]])
+    assert non_dominated_mask(scores).tolist() == [True, True, False, False, False, True, False], \
+        'pareto_test1: non_dominated_mask should keep exactly the non-dominated rows'
+    # each objective of the front points the right way
+    sizes = [(60, 50), (120, 100), (130, 110), (140, 90)]
+    fabrics = [Fabric(generate_bordered_test_fabric(color, width, height))
+               for color, (width, height) in zip(generate_palette_colors(len(sizes)), sizes)]
+    edge_subsets = [[fabrics[1].e1], [fabrics[0].e1, fabrics[2].e1], [fabrics[1].e1, fabrics[2].e2, fabrics[3].e1]]
+    table = OptionTable(edge_subsets, PackingConfig(seam_allowance=0, min_scrap_size=0), 200)
+    best = {'wasted area': np.argmin(table.wasted_area), 'thickness': np.argmax(table.shortest_side),
+            'fabric count': np.argmin(table.counts), 'contrast': np.argmin(contrast_means(table))}
+    for objective in PARETO_OBJECTIVES:
+        assert np.nonzero(table.pareto_mask([objective]))[0].tolist() == [best[objective.name]], \
+            f'pareto_test1: the {objective.name} objective should keep its best option'
+    print('pareto_test1 passed')
+
+def job_queue_test1():
+    # the jobs of a session run one after the other even with free workers
+    jobs = JobQueue(max_workers=2, niceness=0)
+    gate = threading.Event()
+    order = []
+    def step(name, wait=None):
+        def fn(job):
+            order.append(f'{name} start')
+            if wait is not None:
+                wait.wait(10)
+            order.append(f'{name} end')
+            return name
+        return fn
+    first = jobs.submit('a', 'pack', 1, step('first', gate))
+    second = jobs.submit('a', 'pack', 2, step('second'))
+    other = jobs.submit('b', 'pack', 1, step('other'))
+    assert other.wait(10) == 'other', 'job_queue_test1: another session should not wait for the session'
+    assert second.status == 'queued', 'job_queue_test1: the second job should wait for the first one'
+    gate.set()
+    assert second.wait(10) == 'second', 'job_queue_test1: the second job should run once the first one finished'
+    assert order.index('first end') < order.index('second start'), 'job_queue_test1: the jobs of a session should not overlap'
+    # an identical request joins the unfinished job
+    gate = threading.Event()
+    job = jobs.submit('a', 'options', 1, step('options', gate), cancellable=True)
+    assert jobs.submit('a', 'options', 1, step('options')) is job, 'job_queue_test1: an identical request should join the job'
+    # a newer request cancels a superseded cancellable job
+    started, idle = threading.Event(), threading.Event()
+    def solve(job):
+        started.set()
+        while not job.cancelled():
+            idle.wait(0.01)
+        raise JobCancelled()
+    gate.set()
+    job.wait(10)
+    superseded = jobs.submit('a', 'options', 2, solve, cancellable=True)
+    assert started.wait(10), 'job_queue_test1: the solve should start'
+    newer = jobs.submit('a', 'options', 3, step('newer'), cancellable=True)
+    assert newer.wait(10) == 'newer', 'job_queue_test1: the newer job should run after the superseded one'
+    assert superseded.status == 'cancelled', 'job_queue_test1: the superseded job should be cancelled'
+    print('job_queue_test1 passed')
+
 def run_all_tests():
     seam_test1()
     seam_test2()
@@ -90,6 +474,22 @@ def run_all_tests():
     packing_test2()
     packing_test3()
     packing_test4()
+    subset_sum_test1()
+    subset_sum_test2()
+    subset_sum_test3()
+    solver_backend_test1()
+    gurobi_model_test1()
+    gurobi_pool_test1()
+    contrast_test1()
+    presolve_test1()
+    aggregation_test1()
+    color_diff_test1()
+    binning_test1()
+    binning_test2()
+    solution_cache_test1()
+    solution_cache_test2()
+    pareto_test1()
+    job_queue_test1()
 
 if __name__ == '__main__':
     run_all_tests()
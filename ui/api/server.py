@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 import dill as pickle
 import os
@@ -8,6 +8,7 @@ from rectpack import *
 import time
 import numpy as np
 import json
+import queue
 from datetime import datetime
 from PIL import Image
 import threading
@@ -18,7 +19,7 @@ file_operation_lock = threading.Lock()
 WKDIR = '../../'
 sys.path.insert(0, WKDIR)
 
-from src.utils.bin_pack_api_rail_fence import next_packing_options, pack_with_option, option_to_strip
+from src.utils.bin_pack_api_rail_fence import next_packing_options, next_pareto_options, pack_with_option, option_to_strip
 from src.results.reconstruct_high_res import reconstruct_high_res
 from src.utils.config import *
 from src.utils.filters import *
@@ -26,7 +27,10 @@ from src.utils.pack import update_rail_fence_packed_fabric_high_res_size
 from src.utils.plot import *
 from src.utils.binning import *
 from src.utils.load_images import load_fabrics_for_binning
+from src.utils.features import DOMINANT_METHODS, criteria_value, extract_features
 from src.utils.bins import UserFabricBins
+from src.utils.jobs import JobCancelled, JobError, JobQueue, JobRejected
+from src.utils.solution_cache import SolutionCache, SolutionStore
 from src.utils.tests import total_area
 
 app = Flask(__name__)
@@ -36,30 +40,43 @@ CORS(app)
 # In-memory storage for session data and options
 session_store = {}
 option_store = {}  # Will store options by session_id and option key
-last_response = None
+solution_caches = {}  # solver results by session_id, so re-sorting and narrowing filters do not re-solve
+# heavy requests (option solves, packing, high-res reconstruction) run on a bounded pool of workers,
+# so that they do not starve the lightweight endpoints; their results are polled by job id
+JOB_WORKERS = 2
+MAX_PENDING_JOBS = 16
+job_queue = JobQueue(max_workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS)
+OPTION_JOBS = ['generate_options', 'generate_options_stream']
 current_session_id = None  # Global variable to store current session ID
 PUBLIC_DIR = os.path.join(os.getcwd(), '../public')
-# remove files related to any previous sessions
-if os.path.exists(PUBLIC_DIR):
-    for f in os.listdir(PUBLIC_DIR):
-        if os.path.isdir(os.path.join(PUBLIC_DIR, f)) and len(f) == 10:
-            os.system(f'rm -rf {os.path.join(PUBLIC_DIR, f)}')
 # Path where pickled files will be stored
 PICKLE_DIR = os.path.join(os.path.dirname(__file__), 'pickle_store')
-if not os.path.exists(PICKLE_DIR):
-    os.makedirs(PICKLE_DIR)
-else:
-    os.system(f'rm -rf {PICKLE_DIR}/*')
 # Logs directory
 LOG_DIR = os.path.join(os.path.dirname(__file__), 'logs')
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
-else:
-    os.system(f'rm -rf {LOG_DIR}/*')
 # Results directory
 RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
-if not os.path.exists(RESULTS_DIR):
-    os.makedirs(RESULTS_DIR)
+
+def clean_up_previous_sessions():
+    # remove files related to any previous sessions
+    if os.path.exists(PUBLIC_DIR):
+        for f in os.listdir(PUBLIC_DIR):
+            if os.path.isdir(os.path.join(PUBLIC_DIR, f)) and len(f) == 10:
+                os.system(f'rm -rf {os.path.join(PUBLIC_DIR, f)}')
+    if not os.path.exists(PICKLE_DIR):
+        os.makedirs(PICKLE_DIR)
+    else:
+        os.system(f'rm -rf {PICKLE_DIR}/*')
+    if not os.path.exists(LOG_DIR):
+        os.makedirs(LOG_DIR)
+    else:
+        os.system(f'rm -rf {LOG_DIR}/*')
+    if not os.path.exists(RESULTS_DIR):
+        os.makedirs(RESULTS_DIR)
+
+# the solver and feature worker processes import this script as __mp_main__ (see worker_context),
+# they must not remove the files of the running sessions
+if __name__ != '__mp_main__':
+    clean_up_previous_sessions()
 
 # Explicit favicon route that works across all domains
 @app.route('/favicon.ico')
@@ -70,6 +87,10 @@ def favicon():
         mimetype='image/vnd.microsoft.icon'
     )
 
+# the sortBy values of the UI, see create_rank
+RANK_METHODS = ['none', 'wastedArea', 'thicknessInc', 'thicknessDec', 'fabricCountInc', 'fabricCountDec',
+                'colorInc', 'colorDec', 'valueInc', 'valueDec', 'hueInc', 'hueDec']
+
 def create_rank(rank_method):
     if rank_method == 'wastedArea':
         return WastedAreaRank()
@@ -138,15 +159,24 @@ def get_option(session_id, option_key):
     """Retrieve option from memory"""
     return option_store.get(session_id, {}).get(option_key)
 
-def clear_option_store(session_id):
+def get_solution_cache(session_id, data_folder):
+    """The solution cache of a session, backed by the solution store of its fabric folder."""
+    if session_id not in solution_caches:
+        store = SolutionStore.for_folder(os.path.join(PUBLIC_DIR, 'fabric_data', data_folder.lstrip('/')))
+        solution_caches[session_id] = SolutionCache(store=store)
+    return solution_caches[session_id]
+
+def clear_option_store(session_id, keep=None):
     """
     Clear all stored options for a given session_id.
     
     Args:
         session_id: The session identifier
+        keep: option keys to keep (optional)
     """
     if session_id in option_store:
-        option_store[session_id] = {}
+        option_store[session_id] = {key: option for key, option in option_store[session_id].items()
+                                    if keep is not None and key in keep}
 
 def option_to_strip_image(packed_fabric, sorted_fabrics, option, iter, bins=None, config=PackingConfig(),
                                  should_save=False, session_id=None, save_folder=None, use_high_res=False):
@@ -187,6 +217,7 @@ def add_cors_headers(response):
     return response
 
 @app.route('/api/generate_options', methods=['OPTIONS'])
+@app.route('/api/generate_options_stream', methods=['OPTIONS'])
 def handle_generate_options_preflight():
     response = jsonify({})
     response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
@@ -195,17 +226,94 @@ def handle_generate_options_preflight():
 
 @app.route('/api/retrieve_last_response', methods=['GET'])
 def retrieve_last_response():
-    global last_response
-    if last_response is None:
+    # the options of the session's last job, unless the session changed since
+    job = job_queue.latest(find_session_id())
+    if job is None or job.kind not in OPTION_JOBS or job.status != 'done':
         return jsonify({'message': 'No last response found'}), 404
-    response = last_response
-    return jsonify(response)
+    return jsonify(job.result)
 
-@app.route('/api/generate_options', methods=['POST'])
-def generate_options():
-    start_time = time.time()
+def request_wait(data, default):
+    # a request's 'wait' overrides whether its endpoint waits for the job or answers 202 to be polled
+    return data.get('wait', default) if data else default
 
-    data = request.json
+def request_key(data):
+    # identical requests of a session are answered by the same job
+    return json.dumps({k: v for k, v in (data or {}).items() if k != 'wait'}, sort_keys=True)
+
+def job_result_response(job, answer=None):
+    """
+    The answer of a job: its result (or answer(result)), its error, 409 if it was cancelled or 202
+    with its status while it runs.
+    """
+    if job.status == 'done':
+        return jsonify(answer(job.result) if answer is not None else job.result)
+    if job.status == 'error':
+        error, status = job.error_response()
+        return jsonify(error), status
+    if job.status == 'cancelled':
+        return jsonify({'message': 'Superseded by a newer request'}), 409
+    return jsonify(job_queue.status(job)), 202
+
+def submit_job(kind, data, fn, cancellable=False, answer=None, wait=True):
+    """
+    Hand a request of the current session to the job queue and answer it: right away with 202 and the
+    job's status if the request does not wait (the client then polls /api/jobs/<job_id> and fetches
+    /api/jobs/<job_id>/result), or with the job's result once it is done.
+
+    Args:
+        kind: the endpoint
+        data: the request json
+        fn: called as fn(job, data, session_id) by a job worker
+        cancellable: whether a newer request of the session supersedes the job
+        answer: turns the job's result into the answer of a waiting request (defaults to the result)
+        wait: whether requests wait for the job unless they set 'wait'; the long jobs (solves, grouping,
+            high-res reconstruction) are polled by default so that they do not hold a request thread
+    """
+    session_id = find_session_id()
+    try:
+        job = job_queue.submit(session_id, kind, request_key(data), lambda job: fn(job, data, session_id),
+                               cancellable=cancellable)
+    except JobRejected as e:
+        response = jsonify({'message': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    if not request_wait(data, wait):
+        return jsonify(job_queue.status(job)), 202
+    job.finished.wait()
+    return job_result_response(job, answer)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+    return jsonify(job_queue.status(job))
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+    return job_result_response(job)
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+    if not job.cancellable:
+        return jsonify({'message': 'This job cannot be cancelled'}), 409
+    job.cancel()
+    return jsonify(job_queue.status(job))
+
+def prepare_options(data, session_id):
+    """
+    Update the session for the options of data (a generate_options request): the packing strategy,
+    the filters and rank, the fabrics of the first iteration and the rail-fence target lengths.
+
+    Returns:
+        an error message, or None
+    """
     iter = data.get('currentStep', 0)
     data_folder = data.get('dataFolder', 'ui_test1')
     packed_fabric_path = data.get('packedFabric', None)
@@ -215,12 +323,7 @@ def generate_options():
     bin_filter = data.get('binFilter', None)
     selected_bins = data.get('selectedBins', [])
     sort_by = data.get('sortBy', 'none')
-    thickness_min = data.get('thicknessMin', None)
-    thickness_max = data.get('thicknessMax', None)
-    fabric_count_min = data.get('fabricCountMin', None)
-    fabric_count_max = data.get('fabricCountMax', None)
 
-    session_id = find_session_id()
     session_data = session_store[session_id]
 
     session_data['config'].update_dpi(dpi)
@@ -256,7 +359,7 @@ def generate_options():
             print('Loading fabrics from bins')
             fabrics = session_data['bins'].to_id_fabric_map(bin_filter=bin_filter)
             if len(fabrics) == 0:
-                return jsonify({'message': 'No fabrics could be loaded from bins'})
+                return 'No fabrics could be loaded from bins'
             if 0 not in session_data['bins_per_iter']:
                 session_data['bins_per_iter'][0] = session_data['bins'].to_bins_data()
 
@@ -332,43 +435,158 @@ def generate_options():
         elif iter == 9:
             session_data['config'].target_L['left'] = session_data['packed_fabric'].size[1] - session_data['config'].target_L['right'] + 2 * session_data['config'].sa
             session_data['config'].target_L_high_res['left'] = session_data['config'].packed_fabric_high_res_size[1] - session_data['config'].target_L_high_res['right'] + 50
+    return None
+
+# how many new options a streamed options job renders each time the solver finds new ones
+STREAM_RENDER_BATCH = 4
+
+def option_signature(option):
+    return tuple(sorted((edge.p.id, edge.is_e1) for edge in option.edge_subset))
+
+def render_live_options(session_id, ranked, rendered, cancel_token=None):
+    """
+    Render the strip images of the best few options found so far that are not rendered yet.
+
+    Args:
+        session_id: The session identifier
+        ranked: the options found so far, in ranked order
+        rendered: {option signature: (option index, option json)} of the options rendered so far,
+            updated in place (see generate_options_response)
+        cancel_token: rendering stops when it is cancelled (optional)
+
+    Returns:
+        the option jsons of the rendered options among ranked, in ranked order
+    """
+    session_data = session_store[session_id]
+    strip_image_folder = os.path.join(PUBLIC_DIR, session_id[:10])
+    if not os.path.exists(strip_image_folder):
+        os.makedirs(strip_image_folder)
+    pending = [option for option in ranked if option_signature(option) not in rendered]
+    for option in pending[:STREAM_RENDER_BATCH]:
+        if cancel_token is not None and cancel_token.cancelled():
+            break
+        # live options get keys of their own, a final option with the same strip takes over its key
+        option.index = f'live_{len(rendered)}'
+        rendered[option_signature(option)] = (option.index, option_to_strip_image(
+            session_data['packed_fabric'],
+            session_data['sorted_fabrics'],
+            option,
+            session_data['iter'],
+            session_data['bins'],
+            session_data['config'],
+            should_save=True,
+            session_id=session_id,
+            save_folder=strip_image_folder
+        ))
+    return [rendered[option_signature(option)][1] for option in ranked if option_signature(option) in rendered]
+
+def generate_options_response(data, session_id, on_progress=None, first_round_limit=None, cancel_token=None,
+                              on_solved=None, rendered=None):
+    """
+    Generate the options of a session prepared by prepare_options and save their strip images.
+
+    Args:
+        data: the generate_options request
+        session_id: The session identifier
+        on_progress: passed on to next_packing_options (optional)
+        first_round_limit: passed on to next_packing_options (optional)
+        cancel_token: passed on to next_packing_options (optional)
+        on_solved: called once the options are generated, before their strip images are rendered (optional)
+        rendered: the options already rendered while solving, they are not rendered again (optional,
+            see render_live_options)
+
+    Returns:
+        the response data of the options (the result of the options job, see retrieve_last_response)
+
+    Raises:
+        JobCancelled if the solve was cancelled
+    """
+    iter = data.get('currentStep', 0)
+    data_folder = data.get('dataFolder', 'ui_test1')
+    strategy = data.get('packingStrategy', 'log-cabin')
+    thickness_min = data.get('thicknessMin', None)
+    thickness_max = data.get('thicknessMax', None)
+    fabric_count_min = data.get('fabricCountMin', None)
+    fabric_count_max = data.get('fabricCountMax', None)
+    option_mode = data.get('optionMode', 'ranked') # 'pareto' returns the trade-offs indexed by every sortBy
+    solve_slo = data.get('solveSlo', None) # seconds the solver may spend on this request, not kept in the session
+    session_data = session_store[session_id]
 
     # Generate options
     method_time = time.time()
-    options = next_packing_options(
-        session_data['packed_fabric'],
-        session_data['sorted_fabrics'],
-        session_data['iter'],
-        session_data['bin_filter'],
-        session_data['option_filter'],
-        session_data['option_rank'],
-        session_data['bins'],
-        session_data['config'],
+    option_args = dict(
         thickness_min=thickness_min,
         thickness_max=thickness_max,
         fabric_count_min=fabric_count_min,
-        fabric_count_max=fabric_count_max
+        fabric_count_max=fabric_count_max,
+        solution_cache=get_solution_cache(session_id, data_folder),
+        on_progress=on_progress,
+        first_round_limit=first_round_limit,
+        cancel_token=cancel_token,
+        solve_slo=float(solve_slo) if solve_slo is not None else None
     )
+    rank_orders, pareto_front = None, None
+    if option_mode == 'pareto':
+        options, rank_orders, pareto_front = next_pareto_options(
+            session_data['packed_fabric'],
+            session_data['sorted_fabrics'],
+            session_data['iter'],
+            session_data['bin_filter'],
+            session_data['option_filter'],
+            session_data['option_rank'],
+            session_data['bins'],
+            session_data['config'],
+            ranks={rank_method: create_rank(rank_method) for rank_method in RANK_METHODS},
+            **option_args
+        )
+    else:
+        options = next_packing_options(
+            session_data['packed_fabric'],
+            session_data['sorted_fabrics'],
+            session_data['iter'],
+            session_data['bin_filter'],
+            session_data['option_filter'],
+            session_data['option_rank'],
+            session_data['bins'],
+            session_data['config'],
+            **option_args
+        )
     method_time = time.time() - method_time
     print(f'next_packing_options() took {method_time} seconds')
+    if on_solved is not None:
+        on_solved()
+    if cancel_token is not None and cancel_token.cancelled():
+        raise JobCancelled()
 
     # Convert options to JSON and save images
     strip_image_folder = os.path.join(PUBLIC_DIR, session_id[:10])
     if not os.path.exists(strip_image_folder):
         os.makedirs(strip_image_folder)
 
-    clear_option_store(session_id)
-    option_jsons = [option_to_strip_image(
-        session_data['packed_fabric'],
-        session_data['sorted_fabrics'],
-        option,
-        session_data['iter'],
-        session_data['bins'],
-        session_data['config'],
-        should_save=True,
-        session_id=session_id,
-        save_folder=strip_image_folder
-    ) for option in options]
+    option_jsons = []
+    for option in options:
+        # rendering takes a while at full resolution, a superseded request stops early
+        if cancel_token is not None and cancel_token.cancelled():
+            raise JobCancelled()
+        if rendered is not None and option_signature(option) in rendered:
+            # the same strip as a live option: keep its image and key, for the final option object
+            option.index, option_json = rendered[option_signature(option)]
+            store_option(session_id, session_data['iter'], option.index, option)
+            option_jsons.append(option_json)
+            continue
+        option_jsons.append(option_to_strip_image(
+            session_data['packed_fabric'],
+            session_data['sorted_fabrics'],
+            option,
+            session_data['iter'],
+            session_data['bins'],
+            session_data['config'],
+            should_save=True,
+            session_id=session_id,
+            save_folder=strip_image_folder
+        ))
+    # the earlier options (e.g. streamed ones) stay selectable until these replace them
+    clear_option_store(session_id, keep={option_json['option_key'] for option_json in option_jsons})
 
     # Save packed fabric image
     if session_data['packed_fabric']:
@@ -381,6 +599,10 @@ def generate_options():
         'options': option_jsons,
         'message': f'Generated {len(option_jsons)} options',
     }
+    if rank_orders is not None:
+        # the UI re-sorts these options by any sortBy without generating them again
+        response_data['rank_orders'] = rank_orders
+        response_data['pareto_front'] = pareto_front
 
     if 'bins' in session_data and session_data['bins'] is not None:
         response_data['bins_merged'] = session_data['bins'].bins_merged
@@ -393,20 +615,140 @@ def generate_options():
         response_data['packed_fabric_size'] = session_data['packed_fabric'].size
         response_data['utilization'] = '100'
 
-    global last_response
-    last_response = response_data
-    print(f'generate_options() api call took {time.time() - start_time} seconds')
-    return jsonify({'message': 'Options generated successfully!'})
+    return response_data
+
+def solve_options(job, data, session_id, first_round_limit=None, live=False):
+    """
+    The job of a generate_options request: prepare the session and generate the options, publishing
+    the solver progress for polling as it comes. With live, the best few new options are rendered
+    whenever the solver finds some and the option jsons of all options rendered so far are published
+    in ranked order as 'options' events (see generate_options_stream); the final response reuses them.
+
+    Raises:
+        JobError with the message of a request that cannot be answered
+    """
+    error = prepare_options(data, session_id)
+    if error is not None:
+        raise JobError({'message': error}, 200)
+    if not live:
+        return generate_options_response(data, session_id,
+                                         on_progress=lambda options, progress: job.publish('options', None, progress),
+                                         first_round_limit=first_round_limit, cancel_token=job.token)
+
+    # the live options are rendered on a helper thread of the job, so that they do not hold up the solver
+    rendered = {}
+    updates = queue.Queue()
+
+    def render():
+        ranked, progress = [], None
+        while not job.cancelled():
+            pending = any(option_signature(option) not in rendered for option in ranked)
+            # wait for the solver only when every option found so far is rendered
+            try:
+                update = updates.get(block=not pending)
+            except queue.Empty:
+                update = False
+            if update is None:
+                return
+            if update:
+                # newer options replace the ones not rendered yet
+                ranked, progress = update
+                continue
+            option_jsons = render_live_options(session_id, ranked, rendered, job.token)
+            job.publish('options', option_jsons, progress)
+
+    renderer = threading.Thread(target=render, name=f'{threading.current_thread().name}_render', daemon=True)
+    renderer.start()
+
+    def stop_rendering():
+        updates.put(None)
+        renderer.join()
+
+    try:
+        return generate_options_response(data, session_id,
+                                         on_progress=lambda options, progress: updates.put((options, progress)),
+                                         first_round_limit=first_round_limit, cancel_token=job.token,
+                                         on_solved=stop_rendering, rendered=rendered)
+    finally:
+        if renderer.is_alive():
+            stop_rendering()
+
+@app.route('/api/generate_options', methods=['POST'])
+def generate_options():
+    start_time = time.time()
+
+    def answer(response_data):
+        # the options are fetched from retrieve_last_response (or the job's result)
+        print(f'generate_options() api call took {time.time() - start_time} seconds')
+        return {'message': 'Options generated successfully!'}
+
+    return submit_job('generate_options', request.json, solve_options, cancellable=True, answer=answer, wait=False)
+
+def sse_event(event, payload):
+    return f'event: {event}\ndata: {json.dumps(payload)}\n\n'
+
+@app.route('/api/generate_options_stream', methods=['POST'])
+def generate_options_stream():
+    """
+    generate_options as server-sent events, so that the first options show up while the bins are
+    still being solved: 'options' events carry the strip images of the new options, the keys of all
+    options rendered so far in ranked order and the solver progress (the job renders them, see
+    solve_options, the stream only forwards what this client has not seen); the last event is 'done' with the
+    response of generate_options (also the result of the job, see retrieve_last_response), 'error', or
+    'cancelled' when a newer request of the session superseded this one. A solve that nobody listens
+    to anymore is cancelled.
+    """
+    start_time = time.time()
 
-@app.route('/api/pack_with_selected_option', methods=['POST'])
-def pack_with_selected_option():
     data = request.json
+    session_id = find_session_id()
+    # the first solver round is short so that the first options come quickly, the later rounds refine them
+    first_round_limit = float(data.get('firstAnswerTime', 0.5))
+
+    def solve(job):
+        response_data = solve_options(job, data, session_id, first_round_limit=first_round_limit, live=True)
+        print(f'generate_options_stream() took {time.time() - start_time} seconds')
+        return response_data
+
+    try:
+        job = job_queue.submit(session_id, 'generate_options_stream', request_key(data), solve, cancellable=True)
+    except JobRejected as e:
+        response = jsonify({'message': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    events = job.subscribe()
+
+    def stream():
+        try:
+            yield from stream_events()
+        finally:
+            # the client went away (or the job is over)
+            if job.unsubscribe(events) == 0 and job.is_active():
+                print(f'Nobody listens to job {job.id[:8]} anymore, cancelling it')
+                job.cancel()
+
+    def stream_events():
+        sent = set() # keys of the options sent to this client
+        while True:
+            kind, option_jsons, progress = events.get()
+            if kind != 'options':
+                yield sse_event(kind, option_jsons)
+                return
+            new_options = [option_json for option_json in option_jsons if option_json['option_key'] not in sent]
+            sent.update(option_json['option_key'] for option_json in new_options)
+            order = [option_json['option_key'] for option_json in option_jsons]
+            yield sse_event('options', {'options': new_options, 'order': order, 'progress': progress})
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def pack_option(job, data, session_id):
+    """The job of a pack_with_selected_option request: pack the session's fabric with the selected option."""
     iter = data.get('currentStep', 0)
     strategy = data.get('packingStrategy', 'log-cabin')
     option_key = data.get('optionKey', None)
     option_order = data.get('optionOrder', None)
 
-    session_id = find_session_id()
     session_data = session_store[session_id]
     
     # Save current state for undo before modifying
@@ -418,7 +760,7 @@ def pack_with_selected_option():
     # Get selected option from memory
     selected_option = get_option(session_id, option_key)
     if not selected_option:
-        return jsonify({'message': 'Selected option not found'}), 404
+        raise JobError({'message': 'Selected option not found'}, 404)
 
     if option_order:
         selected_option.update_order(option_order)
@@ -462,10 +804,7 @@ def pack_with_selected_option():
                 session_data['packed_fabric'].save(f, format='PNG')
     packed_fabric_size = session_data['packed_fabric'].size if session_data['packed_fabric'] else None
 
-    global last_response
-    last_response = None
-
-    return jsonify({
+    return {
         'message': 'Packed with the selected option',
         'iter': session_data['iter'],
         'packed_fabric_path': f'/{session_id[:10]}/packed_fabric.png',
@@ -473,15 +812,20 @@ def pack_with_selected_option():
         'utilization': f'{utilization:.2f}',
         'used_area': f'{used:.2f}',
         'unused_fabrics': f'{unused:.2f}'
-    })
+    }
 
-@app.route('/api/undo', methods=['POST'])
-def undo_last_action():
-    session_id = find_session_id()
-    
+@app.route('/api/pack_with_selected_option', methods=['POST'])
+def pack_with_selected_option():
+    return submit_job('pack_with_selected_option', request.json, pack_option)
+
+def undo_action(job, data, session_id):
+    """
+    The job of an undo request: restore the session's state before its last packing. It runs on the
+    job queue so that it does not replace the session's state while another job of the session uses it.
+    """
     previous_state_path = os.path.join(RESULTS_DIR, session_id[:10], 'previous_state.pkl')
     if not os.path.exists(previous_state_path):
-        return jsonify({'error': 'No previous state to restore'}), 404
+        raise JobError({'error': 'No previous state to restore'}, 404)
     
     # Restore previous state
     del session_store[session_id]
@@ -509,10 +853,7 @@ def undo_last_action():
         session_data['config']
     )
     
-    global last_response
-    last_response = None
-    
-    return jsonify({
+    return {
         'message': 'Reverted to previous state',
         'iter': session_data['iter'],
         'packed_fabric_path': f'/{session_id[:10]}/packed_fabric.png',
@@ -520,7 +861,12 @@ def undo_last_action():
         'utilization': f'{utilization:.2f}',
         'used_area': f'{used:.2f}',
         'unused_fabrics': f'{unused:.2f}'
-    })
+    }
+
+@app.route('/api/undo', methods=['POST'])
+def undo_last_action():
+    # the undo job is now the session's last job, so the options of the previous one are not retrieved again
+    return submit_job('undo', request.get_json(silent=True), undo_action)
 
 @app.route('/api/finish_packing', methods=['POST'])
 def finish_packing():
@@ -547,12 +893,10 @@ def finish_packing():
         'total_steps': len(session_data['instructions'])
     })
 
-@app.route('/api/finish_packing_high_res', methods=['POST'])
-def finish_packing_high_res():
-    session_id = find_session_id()
+def reconstruct_session(job, data, session_id):
+    """The job of a finish_packing_high_res request: reconstruct the packing of the session at high resolution."""
     session_data = session_store.get(session_id)
     try:
-        data = request.json
         fabric_folder = data.get('fabricFolder', '')
         use_step_by_step = data.get('stepByStep', True)
         # Create output directory for high-res results
@@ -560,17 +904,18 @@ def finish_packing_high_res():
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
         success = reconstruct_high_res(session_data, fabric_folder, output_dir, public_dir=PUBLIC_DIR, step_by_step=use_step_by_step)
-        if success:
-            return jsonify({'message': 'High-res results generated successfully!'})
-        else:
-            return jsonify({'error': 'High-res results generation failed'}), 500
     except Exception as e:
         print(f"Error finishing packing high res: {str(e)}")
-        session_id = find_session_id()
-        session_data = session_store.get(session_id)
         with open(os.path.join(RESULTS_DIR, session_id[:10], 'current_session.pkl'), 'wb') as f:
             pickle.dump(session_data, f)
-        return jsonify({'error': str(e)}), 500
+        raise JobError({'error': str(e)}, 500)
+    if not success:
+        raise JobError({'error': 'High-res results generation failed'}, 500)
+    return {'message': 'High-res results generated successfully!'}
+
+@app.route('/api/finish_packing_high_res', methods=['POST'])
+def finish_packing_high_res():
+    return submit_job('finish_packing_high_res', request.json or {}, reconstruct_session, wait=False)
 
 @app.route('/api/load_fabrics', methods=['POST'])
 def load_fabrics():
@@ -585,22 +930,39 @@ def estimate_nbins():
     fabric_folder = data.get('fabric_folder')
     group_criterion = data.get('group_criterion')
     mode = data.get('mode')
+    dominant_method = data.get('dominantMethod', 'kmeans')
+    if dominant_method not in DOMINANT_METHODS:
+        return jsonify({'message': f'Unknown dominantMethod: {dominant_method}, expected one of {DOMINANT_METHODS}'}), 400
 
     fabric_json = load_fabrics_for_binning(PUBLIC_DIR, os.path.join('fabric_data', fabric_folder.lstrip('/')), should_include_image=True)
-    criteria_values = [compute_criteria(fabric['img'], mode=mode, criterion=group_criterion) for fabric in fabric_json]
+    features = extract_features([fabric['img'] for fabric in fabric_json],
+                                [os.path.join(PUBLIC_DIR, fabric['image']) for fabric in fabric_json],
+                                dominant_method=dominant_method)
+    criteria_values = [criteria_value(image_features, mode=mode, criterion=group_criterion) for image_features in features]
+    # one value per fabric like group_images, so that all k are scored in one pass
+    criteria_values = [np.linalg.norm(value) if isinstance(value, np.ndarray) else value for value in criteria_values]
     criteria_values = np.array(criteria_values).reshape(-1, 1)
-    n_bins = estimate_clusters(criteria_values)
-    return jsonify({'nbins': n_bins})
+    n_bins, scores = estimate_clusters(criteria_values, return_scores=True)
+    return jsonify({'nbins': n_bins, 'scores': {str(k): float(score) for k, score in scores.items()}})
 
 @app.route('/api/group_fabrics', methods=['POST'])
 def group_fabrics():
+    """Group the fabrics of a folder into bins as a job (polled unless the request sets 'wait': true)."""
     data = request.json
+    dominant_method = data.get('dominantMethod', 'kmeans')
+    if dominant_method not in DOMINANT_METHODS:
+        return jsonify({'message': f'Unknown dominantMethod: {dominant_method}, expected one of {DOMINANT_METHODS}'}), 400
+    return submit_job('group_fabrics', data, group_fabrics_response, wait=False)
+
+def group_fabrics_response(job, data, session_id):
+    """The bins of a group_fabrics request (the result of its job)."""
     fabric_folder = data.get('fabric_folder')
     available_fabrics = data.get('available_fabrics')
     n_bins = int(data.get('n_bins'))
     group_criterion = data.get('group_criterion')
     mode = data.get('mode')
     fixed_bins = data.get('fixed_bins', [])  # Get fixed bins from request
+    dominant_method = data.get('dominantMethod', 'kmeans')
 
     # Extract fabric IDs from fixed bins to exclude them from grouping
     fixed_fabric_ids = []
@@ -618,9 +980,12 @@ def group_fabrics():
     )
     
     # Group the remaining fabrics
-    groups = group_images(fabric_json, n_clusters=n_bins, criterion=group_criterion, mode=mode)
+    features = extract_features([fabric['img'] for fabric in fabric_json],
+                                [os.path.join(PUBLIC_DIR, fabric['image']) for fabric in fabric_json],
+                                dominant_method=dominant_method)
+    groups = group_images(fabric_json, n_clusters=n_bins, criterion=group_criterion, mode=mode, features=features)
 
-    return jsonify({'bins': groups})
+    return {'bins': groups}
 
 @app.route('/api/load_bins', methods=['POST'])
 def load_bins():
@@ -639,7 +1004,8 @@ def load_bins():
     else:
         with open(pickle_file_path, 'rb') as f:
             bins = pickle.load(f)
-        session_data['bins'] = UserFabricBins(PUBLIC_DIR, bins, sa=session_data['config'].sa)
+        session_data['bins'] = UserFabricBins(PUBLIC_DIR, bins, sa=session_data['config'].sa,
+                                              dominant_method=getattr(session_data['config'], 'dominant_method', 'kmeans'))
         return jsonify({'bins': bins, 'message': 'User-defined bins loaded successfully!'})
 
 @app.route('/api/load_bin_options', methods=['POST']) 
@@ -668,14 +1034,20 @@ def save_bins():
     if len(non_empty_bins) == 0:
         return jsonify({'message': 'No bins to save'})
     dpi = int(data.get('dpi', 100))
+    dominant_method = data.get('dominantMethod', None)
+    if dominant_method is not None and dominant_method not in DOMINANT_METHODS:
+        return jsonify({'message': f'Unknown dominantMethod: {dominant_method}, expected one of {DOMINANT_METHODS}'}), 400
 
     session_id = find_session_id()
     session_data = session_store[session_id]
     session_data['config'].update_dpi(dpi)
+    if dominant_method is not None:
+        session_data['config'].dominant_method = dominant_method
 
     # Create UserFabricBins object and store it in session data
     if session_data['iter'] == 0:
-        session_data['bins'] = UserFabricBins(PUBLIC_DIR, bins, sa=session_data['config'].sa)
+        session_data['bins'] = UserFabricBins(PUBLIC_DIR, bins, sa=session_data['config'].sa,
+                                              dominant_method=getattr(session_data['config'], 'dominant_method', 'kmeans'))
         # save initial bins as a pickle file
         pickle_file_path = os.path.join(PICKLE_DIR, f'{session_id}.pkl')
         with file_operation_lock:
@@ -686,7 +1058,8 @@ def save_bins():
             session_data['bins'].update_bins(bins)
         except Exception as e:
             print(f"Error updating bins; constructing new UserFabricBins object (likely the previous packing is not reset)")
-            session_data['bins'] = UserFabricBins(PUBLIC_DIR, bins, sa=session_data['config'].sa)
+            session_data['bins'] = UserFabricBins(PUBLIC_DIR, bins, sa=session_data['config'].sa,
+                                                  dominant_method=getattr(session_data['config'], 'dominant_method', 'kmeans'))
     if 0 not in session_data['bins_per_iter']:
         assert session_data['iter'] == 0, "the current iter should be 0, is actually:" + str(session_data['iter'])
     if session_data['iter'] == 0: # always update the bins for iter 0
@@ -941,21 +1314,30 @@ def rectpack():
             'success': False
         })
 
-# Reset session data
-@app.route('/api/reset_session', methods=['POST'])
-def reset_session():
-    session_id = find_session_id()
+def remove_session(session_id):
+    """Remove the state of a session whose jobs have finished (see reset_session)."""
+    job_queue.forget(session_id)
     strip_image_folder = os.path.join(PUBLIC_DIR, session_id[:10])
     if os.path.exists(strip_image_folder):
         os.system(f'rm -r {strip_image_folder}')
     # if os.path.exists(LOG_DIR):
     #     os.system(f'rm {LOG_DIR}/*.json')
+    session_store.pop(session_id, None)
+    option_store.pop(session_id, None)
+    solution_caches.pop(session_id, None)
+
+# Reset session data
+@app.route('/api/reset_session', methods=['POST'])
+def reset_session():
     global current_session_id
-    del session_store[current_session_id]
-    del option_store[current_session_id]
+    session_id = find_session_id()
+    # new requests go to the new session, the state of the old one is removed once its jobs have finished
     current_session_id = None
-    global last_response
-    last_response = None
+    job = job_queue.cancel(session_id)
+    if job is None:
+        remove_session(session_id)
+    else:
+        job.when_finished(lambda: remove_session(session_id))
     # completely use a new session id
     session_id = find_session_id()
     return jsonify({'message': 'Session reset successfully'})
@@ -10,6 +10,7 @@ import DialogContentText from '@mui/material/DialogContentText';
 import DialogTitle from '@mui/material/DialogTitle';
 
 import axios from 'axios';
+import { waitForJob } from './jobs';
 
 import Grid from '@mui/material/Grid2';
 import Button from '@mui/material/Button';
@@ -644,7 +645,8 @@ const BinningPage = () => {
     });
     
     try {
-      const response = await axios.post('http://127.0.0.1:5000/api/group_fabrics', {
+      // grouping extracts the color features of every fabric, so it runs as a job that is polled
+      const job = await axios.post('http://127.0.0.1:5000/api/group_fabrics', {
         fabric_folder: fabricFolder,
         available_fabrics: useAllFabrics ? [] : availableFabrics,
         n_bins: nFabricBins - fixedBinIndexes.length, // Reduce number of new bins to create
@@ -652,6 +654,7 @@ const BinningPage = () => {
         mode: mode,
         fixed_bins: fixedBinIndexes.map(binIndex => bins[binIndex].fabrics) // Send fixed bins data to backend
       });
+      const response = await waitForJob(job.data.job_id);
 
       // Create new bins array with the proper format
       const newBins = Array.from({ length: nFabricBins }, (_, index) => ({
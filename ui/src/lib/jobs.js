@@ -0,0 +1,12 @@
+import axios from 'axios';
+
+// polls a job of the server's job queue until it is finished, then fetches its result
+export const waitForJob = async (jobId, onStatus) => {
+  while (true) {
+    const status = (await axios.get(`http://127.0.0.1:5000/api/jobs/${jobId}`)).data;
+    if (onStatus) onStatus(status);
+    if (['done', 'error', 'cancelled'].includes(status.status)) break;
+    await new Promise(resolve => setTimeout(resolve, 1000));
+  }
+  return axios.get(`http://127.0.0.1:5000/api/jobs/${jobId}/result`);
+};
@@ -7,6 +7,7 @@ import update from 'immutability-helper';
 import axios from 'axios';
 import jsPDF from 'jspdf';
 import html2canvas from 'html2canvas';
+import { waitForJob } from './jobs';
 
 import Grid from '@mui/material/Grid2';
 import Button from '@mui/material/Button';
@@ -419,9 +420,18 @@ const PackingPage = () => {
     setSaveLoading(true);
     logUserAction('SAVE_HIGH_RES_RESULTS');
     try {
-      const response = await axios.post('http://127.0.0.1:5000/api/finish_packing_high_res', {
+      // the reconstruction takes a while, so it runs as a job that is polled instead of a long request
+      const job = await axios.post('http://127.0.0.1:5000/api/finish_packing_high_res', {
         fabricFolder: fabricFolder,
         stepByStep: stepByStep,
+        wait: false,
+      });
+      const response = await waitForJob(job.data.job_id, status => {
+        if (status.status === 'queued') {
+          setBackendMessage(`High-res reconstruction is queued (${status.queue_position} jobs ahead)`);
+        } else if (status.status === 'running') {
+          setBackendMessage('Reconstructing high-res results...');
+        }
       });
       setBackendMessage(response.data.message);
       localStorage.setItem('backendMessage', JSON.stringify(response.data.message));
@@ -598,7 +608,36 @@ const PackingPage = () => {
     });
   };
 
+  // reads the server-sent events of generate_options_stream and calls onEvent(event, data) for each
+  const readEventStream = async (response, onEvent) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary >= 0) {
+        const chunk = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = 'message';
+        let data = '';
+        chunk.split('\n').forEach(line => {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        });
+        if (data) onEvent(event, JSON.parse(data));
+        boundary = buffer.indexOf('\n\n');
+      }
+    }
+  };
+
+  // id of the latest options request, a newer request supersedes (and cancels) the running one
+  const optionsRequestId = useRef(0);
+
   const generateNextOptions = async (stepOverride = null) => {
+    const requestId = ++optionsRequestId.current;
     setLoading(true);
     logUserAction('GENERATE_OPTIONS');
     let packedFabricPath = null;
@@ -607,7 +646,7 @@ const PackingPage = () => {
     }
 
     try {
-      const response = await fetch('http://127.0.0.1:5000/api/generate_options', {
+      const response = await fetch('http://127.0.0.1:5000/api/generate_options_stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -625,19 +664,49 @@ const PackingPage = () => {
           thicknessMax: thicknessMax,
           fabricCountMin: fabricCountMin,
           fabricCountMax: fabricCountMax,
+          optionMode: 'pareto',
         }),
       });
-      const data = await response.json();
-      if (data.message === 'Options generated successfully!') {
-        await retrieveLastResponse();
+      if (!(response.headers.get('Content-Type') || '').includes('text/event-stream')) {
+        const data = await response.json();
+        setBackendMessage(data.message);
+        localStorage.setItem('backendMessage', JSON.stringify(data.message));
+        return;
       }
+      // options are shown as soon as they are found and replaced by the final ones when solving is done
+      const liveOptions = {};
+      await readEventStream(response, (event, data) => {
+        if (requestId !== optionsRequestId.current || event === 'cancelled') {
+          // a newer request took over
+          return;
+        }
+        if (event === 'options') {
+          data.options.forEach(option => { liveOptions[option.option_key] = option; });
+          setShowOptions(true);
+          setBackendResponse(previous => ({
+            ...(previous || {}),
+            options: data.order.map(key => liveOptions[key]),
+            rank_orders: null,
+          }));
+          const progress = data.progress;
+          setBackendMessage(`Found ${data.order.length} options so far (round ${progress.round}, ` +
+            `${progress.bins_solved}/${progress.bins} bins solved, ${Math.round(progress.time_left)}s left)`);
+        } else if (event === 'done') {
+          handleGenerateOptionsResponse(data);
+        } else if (event === 'error') {
+          setBackendMessage(data.message);
+          localStorage.setItem('backendMessage', JSON.stringify(data.message));
+        }
+      });
     } catch (error) {
       console.log(error);
       setBackendMessage('Error generating next options');
       localStorage.setItem('backendMessage', JSON.stringify('Error generating next options'));
     } finally {
-      setLoading(false);
-      setShowResults(false);
+      if (requestId === optionsRequestId.current) {
+        setLoading(false);
+        setShowResults(false);
+      }
     }
   };
 
@@ -708,6 +777,11 @@ const PackingPage = () => {
   const options = useMemo(() => {
     if (showOptions) {
       if (backendResponse && backendResponse['options']) {
+        // pareto responses come with the order of the options under every sortBy
+        const rankOrder = backendResponse['rank_orders'] && backendResponse['rank_orders'][sortBy];
+        if (rankOrder) {
+          return rankOrder.map(i => backendResponse['options'][i]);
+        }
         return backendResponse['options'];
       } else {
         console.log('No backend response; checking localStorage');
@@ -721,7 +795,7 @@ const PackingPage = () => {
       }
     }
     return [];
-  }, [showOptions, backendResponse]);
+  }, [showOptions, backendResponse, sortBy]);
 
   const onSelectPackingStrategy = (e) => {
     logUserAction('SELECT_PACKING_STRATEGY', {